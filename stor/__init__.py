@@ -20,16 +20,7 @@ functions.
 
 See `stor.swift` for more information on Swift-specific functionality.
 """
-try:
-    from importlib import metadata
-# TODO: remove fallback once support for Python < 3.8 is dropped
-except ImportError:  # Python < 3.8
-    try:
-        import importlib_metadata as metadata
-    except ImportError:
-        # Fall back to pkg_resources for Python < 3.8 if importlib_metadata not available
-        import pkg_resources
-        metadata = None
+import sys
 
 from stor.utils import copy
 from stor.utils import copytree
@@ -37,18 +28,45 @@ from stor.utils import is_filesystem_path
 from stor.utils import is_swift_path
 from stor.utils import is_obs_path
 from stor.utils import NamedTemporaryDirectory
+from stor.utils import sync
 from stor.base import Path
 from stor import settings
 
 
-try:
-    if metadata is not None:
-        __version__ = metadata.version("stor")
-    else:
-        __version__ = pkg_resources.get_distribution("stor").version
-except Exception:  # pragma: no cover
-    # we are not pip installed in environment
-    __version__ = None
+def _get_version():
+    try:
+        from importlib import metadata
+    # TODO: remove fallback once support for Python < 3.8 is dropped
+    except ImportError:  # Python < 3.8
+        try:
+            import importlib_metadata as metadata
+        except ImportError:
+            # Fall back to pkg_resources for Python < 3.8 if importlib_metadata not available
+            import pkg_resources
+            metadata = None
+
+    try:
+        if metadata is not None:
+            return metadata.version("stor")
+        else:
+            return pkg_resources.get_distribution("stor").version
+    except Exception:  # pragma: no cover
+        # we are not pip installed in environment
+        return None
+
+
+def __getattr__(name):
+    # Importing the package metadata is slow, so the version is only looked up when used
+    if name == '__version__':
+        global __version__
+        __version__ = _get_version()
+        return __version__
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+
+
+# TODO: remove once support for Python 3.6 is dropped (module __getattr__ needs 3.7)
+if sys.version_info < (3, 7):  # pragma: no cover
+    __version__ = _get_version()
 
 
 settings._initialize()
@@ -126,6 +144,7 @@ __all__ = [
     'getsize',
     'copy',
     'copytree',
+    'sync',
     'remove',
     'rmtree',
     'walkfiles',
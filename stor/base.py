@@ -1,6 +1,7 @@
 import errno
 import fnmatch
 import glob
+import importlib
 import os
 import ntpath
 import posixpath
@@ -19,6 +20,42 @@ class TreeWalkWarning(Warning):
     pass
 
 
+# The module and name of the path class of each drive and filesystem path module. The
+# modules are imported when the first path of their type is created (see _get_class).
+_CLASS_NAMES = {
+    'swift://': ('stor.swift', 'SwiftPath'),
+    's3://': ('stor.s3', 'S3Path'),
+    ntpath: ('stor.windows', 'WindowsPath'),
+    posixpath: ('stor.posix', 'PosixPath'),
+}
+_classes = {}
+
+
+def _get_class(key):
+    """Returns the path class of a drive or path module, importing it on first use"""
+    try:
+        return _classes[key]
+    except KeyError:
+        module_name, class_name = _CLASS_NAMES[key]
+        cls = _classes[key] = getattr(importlib.import_module(module_name), class_name)
+        return cls
+
+
+def _get_path_class(path):
+    """Returns the Path subclass of a path string"""
+    drive_end = path.find('://')
+    if drive_end != -1:
+        drive = path[:drive_end + 3]
+        if drive == 'dx://':
+            return utils.find_dx_class(path)
+        elif drive in _CLASS_NAMES:
+            return _get_class(drive)
+    if os.path in _CLASS_NAMES:
+        return _get_class(os.path)
+    else:  # pragma: no cover
+        assert False, 'path is not compatible with stor'
+
+
 class Path(str):
     """
     Wraps path operations with an object-oriented API that makes it easier to
@@ -43,26 +80,16 @@ class Path(str):
         if cls is Path:
             if not hasattr(path, 'startswith'):
                 raise TypeError('must be a string like')
-            if utils.is_dx_path(path):
-                cls = utils.find_dx_class(path)
-            elif utils.is_swift_path(path):
-                from stor.swift import SwiftPath
-
-                cls = SwiftPath
-            elif utils.is_s3_path(path):
-                from stor.s3 import S3Path
-
-                cls = S3Path
-            elif os.path == ntpath:
-                from stor.windows import WindowsPath
-
-                cls = WindowsPath
-            elif os.path == posixpath:
-                from stor.posix import PosixPath
-
-                cls = PosixPath
-            else:  # pragma: no cover
-                assert False, 'path is not compatible with stor'
+            cls = _get_path_class(path)
+        return str.__new__(cls, path)
+
+    @classmethod
+    def _from_validated(cls, path):
+        """Creates a path of this class without dispatching on or validating the path.
+
+        Only for internal use with path strings known to be valid for the class, such as
+        the children of a listed path.
+        """
         return str.__new__(cls, path)
 
     def __init__(self, path):
@@ -13,6 +13,18 @@ as a directory in a way that is similar to the UNIX command.
 
 To copy or remove a tree, use the ``-r`` flag with ``cp`` or ``remove``.
 
+``cp`` and ``rm`` take several paths at once, or read them from a file (one path per
+line, or ``-`` for stdin) with ``--from-file``. The paths are processed by a pool of
+``--threads`` threads in one process, which share S3 clients and swift
+authentication, and a progress line is logged as they complete::
+
+    $ stor rm s3://bucket/file1 s3://bucket/file2
+    $ stor cp --from-file keys.txt --threads 20 s3://backup-bucket/dir/
+    $ find dir -name '*.vcf' | stor cp --from-file - swift://tenant/container/vcfs/
+
+With several sources, the destination of ``cp`` is a directory. Sources are copied
+into it, and trees copied with ``-r`` are copied to directories of the same name.
+
 Relative Paths
 --------------
 
@@ -66,16 +78,42 @@ user can pipe output from one command into the ``stor`` CLI::
 
     $ echo "hello world" | stor cp - s3://my/file1
 
+``stdin`` is read as bytes and uploaded in segments as it arrives (a multipart
+upload on S3, a static large object on swift and file parts on DNAnexus), so only
+a few segments are held in memory and nothing is written to local disk. The
+object is complete once ``stdin`` is closed.
+
 The user can also output a path's contents to ``stdout`` using the ``cat``
 subcommand::
 
     $ stor cat s3://my/file1
     hello world
 
-Direct file transfer between OBS services is not yet supported,
-and within one OBS service (server-side copy) is only supported for DX.
+Objects are written to ``stdout`` in ranges as they are downloaded, so piping a large
+object into a command that only reads its start (such as ``head``) does not download
+all of it. ``--range START-END`` outputs only the bytes from ``START`` to ``END``
+(inclusive). ``END`` may be omitted to output the rest of the object::
+
+    $ stor cat s3://my/file1 --range 0-4
+    hello
+
+To copy only the files of a directory that changed since the last copy, use the
+``sync`` subcommand. Files are compared by size and ETag (or modification time with
+``--compare mtime``), and ``--delete`` removes files that are no longer in the source::
+
+    $ stor sync local/dir s3://bucket/dir --delete
+
+Copies within one OBS service are done server-side, without downloading the data::
+
+    $ stor cp -r s3://bucket/dir s3://backup-bucket/dir
+
+Copies between different OBS services are streamed through memory in parts, without
+using local disk (see the ``[stor:transfer]`` settings)::
+
+    $ stor cp -r swift://tenant/container/dir s3://bucket/dir
 """
 import argparse
+from concurrent.futures import as_completed, ThreadPoolExecutor
 import copy
 from functools import partial
 import logging
@@ -83,20 +121,27 @@ import os
 import shutil
 import signal
 import sys
-import tempfile
 
 import configparser
 
 import stor
 from stor import exceptions
+from stor import obs
 from stor import settings
 from stor import Path
 from stor import utils
 from stor.extensions import swiftstack
 
-PRINT_CMDS = ('list', 'listdir', 'ls', 'cat', 'pwd', 'walkfiles', 'url', 'convert-swiftstack',
-              'completions')
+PRINT_CMDS = ('list', 'listdir', 'ls', 'pwd', 'walkfiles', 'url', 'convert-swiftstack',
+              'completions', 'prune-hash-cache')
 SERVICES = ('s3', 'swift', 'dx')
+# Commands that take several paths, which are processed by a thread pool
+MULTI_PATH_CMDS = ('cp', 'rm')
+DEFAULT_THREADS = 10
+# The number of bytes read from stdin at a time by ``cp -``
+STDIN_CHUNK_SIZE = 1024 * 1024
+# The number of bytes of the first read of ``cat``, so that output starts quickly
+CAT_FIRST_CHUNK_SIZE = 64 * 1024
 
 ENV_FILE = os.path.expanduser('~/.stor-cli.env')
 PKG_ENV_FILE = os.path.join(os.path.dirname(__file__), 'default.env')
@@ -108,18 +153,25 @@ def perror(msg):
     sys.exit(1)
 
 
+# The streamed write of stdin in progress, which is aborted on exit
+_stdin_stream = None
+
+
 def force_exit(signum, frame):  # pragma: no cover
     sys.stderr.write(' Aborted\n')
+    if _stdin_stream is not None:
+        # Do not leave an incomplete multipart upload behind
+        try:
+            _stdin_stream.abort()
+        except Exception:
+            # Exit even if the upload could not be aborted
+            pass
     os._exit(1)
 
 
 signal.signal(signal.SIGINT, force_exit)
 
-
-class TempPath(Path):
-    """Persist stdin to a temporary file for CLI operations with OBS."""
-    def __del__(self):
-        os.remove(str(self))
+progress_logger = logging.getLogger('%s.progress' % __name__)
 
 
 def _make_stdin_action(func, err_msg):
@@ -130,19 +182,10 @@ def _make_stdin_action(func, err_msg):
     """
     class StdinAction(argparse._StoreAction):
         def __call__(self, parser, namespace, values, option_string=None):
-            if values == '-':
-                if namespace.func == func:
-                    raise argparse.ArgumentError(self, err_msg)
-                else:
-                    ntf = tempfile.NamedTemporaryFile(delete=False, mode='w')
-                    try:
-                        ntf.write(sys.stdin.read())
-                    finally:
-                        ntf.close()
-                    super(StdinAction, self).__call__(parser,
-                                                      namespace,
-                                                      TempPath(ntf.name),
-                                                      option_string=option_string)
+            if '-' in values and len(values) > 1:
+                raise argparse.ArgumentError(self, '- cannot be used with other sources')
+            elif values == ['-'] and namespace.func == func:
+                raise argparse.ArgumentError(self, err_msg)
             else:
                 super(StdinAction, self).__call__(parser,
                                                   namespace,
@@ -151,6 +194,14 @@ def _make_stdin_action(func, err_msg):
     return StdinAction
 
 
+class _VersionAction(argparse._VersionAction):
+    """Prints the stor version, which is only looked up when requested"""
+    def __call__(self, parser, namespace, values, option_string=None):
+        self.version = stor.__version__
+        super(_VersionAction, self).__call__(parser, namespace, values,
+                                             option_string=option_string)
+
+
 def _get_env():
     """
     Get the current environment using the ENV_FILE.
@@ -209,9 +260,145 @@ def _clear_env(service=None):
             _env_chdir(name + '://')
 
 
-def _cat(pth):
-    """Return the contents of a given path."""
-    return pth.open().read()
+def _copy_stdin(dest):
+    """Copy stdin to a file path as it is read.
+
+    OBS objects are opened with ``open('wb', stream=True)``, so segments are uploaded
+    as they fill and the upload is completed when stdin reaches EOF. If reading stdin
+    fails or the command is interrupted, the upload is aborted.
+    """
+    global _stdin_stream
+    dest = Path(dest)
+    if (utils.is_s3_path(dest) or utils.is_swift_path(dest)) and dest.is_ambiguous():
+        raise ValueError('OBS destination must be file with extension or directory with slash')
+    if utils.has_trailing_slash(dest) or (not utils.is_obs_path(dest) and dest.isdir()):
+        raise ValueError('the destination of stdin must be a file, not a directory')
+    if utils.is_obs_path(dest):
+        fp = _stdin_stream = dest.open('wb', stream=True)
+    else:
+        dest.parent.makedirs_p()
+        fp = dest.open('wb')
+    try:
+        with fp:
+            shutil.copyfileobj(sys.stdin.buffer, fp, STDIN_CHUNK_SIZE)
+    finally:
+        _stdin_stream = None
+
+
+def _parse_byte_range(value):
+    """Parses a ``START-END`` byte range, where ``END`` is inclusive and optional."""
+    start, sep, end = value.partition('-')
+    try:
+        start = int(start)
+        end = int(end) if end else None
+    except ValueError:
+        start = None
+    if not sep or start is None or start < 0 or (end is not None and end < start):
+        raise argparse.ArgumentTypeError('invalid range %r, expected START-END' % value)
+    return start, end
+
+
+def _cat(pth, byte_range=None):
+    """Write the contents of a given path to stdout as they are read.
+
+    OBS objects are read in ranges of ``OBSFile.READ_RANGE_SIZE`` bytes (see
+    `OBSPath.open`), after a first range of ``CAT_FIRST_CHUNK_SIZE`` bytes. When
+    ``byte_range`` is a ``(start, end)`` tuple, only the bytes from ``start`` to ``end``
+    (inclusive, or to the end of the object if ``None``) are written. Output stops
+    without an error if the reader of stdout exits.
+    """
+    start, end = byte_range or (0, None)
+    fp = pth.open('rb', stream=True) if utils.is_obs_path(pth) else pth.open('rb')
+    with fp:
+        if start:
+            fp.seek(start)
+        remaining = end - start + 1 if end is not None else None
+        chunk_size = CAT_FIRST_CHUNK_SIZE
+        try:
+            while remaining is None or remaining > 0:
+                # read1 makes a single read of the chunk instead of filling the buffer
+                chunk = fp.read1(chunk_size if remaining is None
+                                 else min(chunk_size, remaining))
+                chunk_size = obs.OBSFile.READ_RANGE_SIZE
+                if not chunk:
+                    break
+                sys.stdout.buffer.write(chunk)
+                sys.stdout.buffer.flush()
+                if remaining is not None:
+                    remaining -= len(chunk)
+        except BrokenPipeError:
+            # Point stdout at devnull so that flushing it at exit does not fail again
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+            sys.exit(1)
+
+
+class _CliProgressLogger(utils.BaseProgressLogger):
+    def __init__(self, cmd, total_paths):
+        super(_CliProgressLogger, self).__init__(progress_logger)
+        self.cmd = cmd
+        self.total_paths = total_paths
+        self.num_failed = 0
+
+    def update_progress(self, result):
+        """Tracks the number of failed paths"""
+        self.num_failed += not result['success']
+
+    def get_start_message(self):
+        return 'starting %s of %s paths' % (self.cmd, self.total_paths)
+
+    def get_finish_message(self):
+        return '%s complete - %s' % (self.cmd, self.get_progress_message())
+
+    def get_progress_message(self):
+        formatted_elapsed_time = self.format_time(self.get_elapsed_time())
+        return '%s/%s\t%s\t%s failed' % (self.num_results, self.total_paths,
+                                         formatted_elapsed_time, self.num_failed)
+
+
+def _read_paths(from_file):
+    """Reads the paths listed in a file, one per line. ``-`` reads them from stdin."""
+    if from_file == '-':
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(from_file) as fp:
+            lines = fp.read().splitlines()
+    return [get_path(line.strip()) for line in lines if line.strip()]
+
+
+def _run_many(cmd, func, paths, threads, dest=None):
+    """Runs ``func`` (e.g. ``stor.remove`` or ``stor.copy``) on many paths at once.
+
+    The paths are processed by ``threads`` threads of this process, so S3 clients and
+    swift authentication are shared. A path that fails does not stop the others, and
+    its error is written to stderr.
+
+    When ``dest`` is given, it is a directory that the paths are copied into. Trees
+    copied with ``stor.copytree`` are copied to directories of the same name.
+
+    Returns:
+        int: The number of paths that failed.
+    """
+    def run(pth):
+        if dest is None:
+            func(pth)
+        elif func is stor.copytree:
+            func(source=pth, dest=Path(dest) / utils.remove_trailing_slash(pth).name)
+        else:
+            func(source=pth, dest=utils.with_trailing_slash(dest))
+
+    with _CliProgressLogger(cmd, len(paths)) as pl:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            futures = {executor.submit(run, pth): pth for pth in paths}
+            for fut in as_completed(futures):
+                try:
+                    fut.result()
+                except Exception as exc:
+                    sys.stderr.write('Error: %s failed for %s - %s: %s\n'
+                                     % (cmd, futures[fut], exc.__class__.__name__, exc))
+                    pl.add_result({'success': False})
+                else:
+                    pl.add_result({'success': True})
+    return pl.num_failed
 
 
 def _obs_relpath_service(pth):
@@ -234,8 +421,8 @@ def get_path(pth, mode=None):
     """
     Convert string to a Path type.
 
-    The string ``-`` is a special string depending on mode.
-    With mode 'r', it represents stdin and a temporary file is created and returned.
+    The string ``-`` is a special string depending on the command.
+    For ``cp``, it represents stdin, which is read when the command runs.
     """
     service = _obs_relpath_service(pth)
     if not service:
@@ -272,6 +459,9 @@ def get_path(pth, mode=None):
 
 def _wrapped_list(path, **kwargs):
     """Use iterative walkfiles for DX paths, rather than trying to generate full list first"""
+    if not (utils.is_s3_path(path) or utils.is_swift_path(path)):
+        # Only S3 and swift support sharded parallel listing
+        kwargs.pop('parallel', None)
     if utils.is_dx_path(path):
         func = stor.walkfiles
     else:
@@ -285,6 +475,13 @@ def _to_url(path):
     return stor.Path(path).to_url()
 
 
+def _prune_hash_cache(max_age=None):
+    from stor import hash_cache
+
+    num_removed = hash_cache.prune(max_age=max_age * 24 * 60 * 60 if max_age else None)
+    return 'removed %s hash cache entries' % num_removed
+
+
 def _convert_swiftstack(path, bucket=None):
     path = stor.Path(path)
     if utils.is_swift_path(path):
@@ -312,8 +509,7 @@ def create_parser():
                         type=str,
                         metavar='CONFIG_FILE')
     parser.add_argument('--version', help='Print version',
-                        action='version',
-                        version=stor.__version__)
+                        action=_VersionAction)
 
     subparsers = parser.add_subparsers(dest='cmd')
     subparsers.required = True
@@ -332,6 +528,10 @@ def create_parser():
                              help='Limit the amount of results returned.',
                              type=int,
                              metavar='INT')
+    parser_list.add_argument('--parallel',
+                             help='List S3 and swift paths with this many concurrent shards.',
+                             type=int,
+                             metavar='INT')
     parser_list.add_argument('--canonicalize',
                              help='Canonicalize any DXPaths that are returned',
                              dest='canonicalize',
@@ -349,11 +549,12 @@ def create_parser():
                            action='store_true')
     parser_ls.set_defaults(func=stor.listdir)
 
-    cp_msg = 'Copy a source to a destination path.'
+    cp_msg = 'Copy sources to a destination path.'
     parser_cp = subparsers.add_parser('cp',  # noqa
                                       help=cp_msg,
                                       description='%s\n \'-\' is a special character that allows'
-                                                  ' for using stdin as the source.' % cp_msg)
+                                                  ' for using stdin as the source. With several'
+                                                  ' sources, DEST is a directory.' % cp_msg)
     parser_cp.add_argument('-r',
                            help='Copy a directory and its subtree to the destination directory.'
                                 ' Must be specified before any other flags.',
@@ -364,11 +565,42 @@ def create_parser():
     parser_cp.add_argument('source',
                            type=get_path,
                            metavar='SOURCE',
+                           nargs='*',
                            action=_make_stdin_action(stor.copytree,
                                                      '- cannot be used with -r'))
     parser_cp.add_argument('dest', type=get_path, metavar='DEST')
+    parser_cp.add_argument('--from-file',
+                           help='Also copy the sources listed in this file, one per line.'
+                                ' \'-\' reads them from stdin.',
+                           dest='from_file',
+                           metavar='FILE')
+    parser_cp.add_argument('--threads',
+                           help='Copy this many sources at once (default: %s).' % DEFAULT_THREADS,
+                           type=int,
+                           default=DEFAULT_THREADS,
+                           metavar='INT')
+
+    sync_msg = 'Copy the files of a source directory that differ from a destination directory.'
+    parser_sync = subparsers.add_parser('sync',
+                                        help=sync_msg,
+                                        description='%s One directory must be on the filesystem'
+                                                    ' and the other on S3 or swift.' % sync_msg)
+    parser_sync.add_argument('source', type=get_path, metavar='SOURCE')
+    parser_sync.add_argument('dest', type=get_path, metavar='DEST')
+    parser_sync.add_argument('--compare',
+                             help='How files of the same size are compared (default: etag).',
+                             choices=utils.SYNC_COMPARE_MODES,
+                             default='etag')
+    parser_sync.add_argument('--delete',
+                             help='Remove files of the destination that are not in the source.',
+                             action='store_true')
+    parser_sync.add_argument('--parallel',
+                             help='List S3 and swift paths with this many concurrent shards.',
+                             type=int,
+                             metavar='INT')
+    parser_sync.set_defaults(func=stor.sync)
 
-    rm_msg = 'Remove file at a path.'
+    rm_msg = 'Remove files at paths.'
     parser_rm = subparsers.add_parser('rm',
                                       help=rm_msg,
                                       description='%s Use the -r flag to remove a tree.' % rm_msg)
@@ -378,7 +610,17 @@ def create_parser():
                            dest='func',
                            const=stor.rmtree,
                            default=stor.remove)
-    parser_rm.add_argument('path', type=get_path, metavar='PATH')
+    parser_rm.add_argument('path', type=get_path, metavar='PATH', nargs='*')
+    parser_rm.add_argument('--from-file',
+                           help='Also remove the paths listed in this file, one per line.'
+                                ' \'-\' reads them from stdin.',
+                           dest='from_file',
+                           metavar='FILE')
+    parser_rm.add_argument('--threads',
+                           help='Remove this many paths at once (default: %s).' % DEFAULT_THREADS,
+                           type=int,
+                           default=DEFAULT_THREADS,
+                           metavar='INT')
 
     walkfiles_msg = 'List all files under a path that match an optional pattern.'
     parser_walkfiles = subparsers.add_parser('walkfiles',
@@ -398,6 +640,12 @@ def create_parser():
     cat_msg = 'Output file contents to stdout.'
     parser_cat = subparsers.add_parser('cat', help=cat_msg, description=cat_msg)
     parser_cat.add_argument('path', type=partial(get_path, mode='r'), metavar='PATH')
+    parser_cat.add_argument('--range',
+                            help='Only output the bytes from START to END (inclusive). END'
+                                 ' may be omitted to output the rest of the file.',
+                            type=_parse_byte_range,
+                            dest='byte_range',
+                            metavar='START-END')
     parser_cat.set_defaults(func=_cat)
 
     cd_msg = 'Change directory to a given OBS path.'
@@ -427,6 +675,17 @@ def create_parser():
     parser_swiftstack.add_argument('--bucket', default=None)
     parser_swiftstack.set_defaults(func=_convert_swiftstack)
 
+    prune_msg = 'Remove hashes of files that changed or no longer exist from the hash cache.'
+    parser_prune = subparsers.add_parser('prune-hash-cache', help=prune_msg,
+                                         description=prune_msg)
+    parser_prune.add_argument('--max-age',
+                              help='Also remove hashes that have not been used for this many'
+                                   ' days.',
+                              type=float,
+                              dest='max_age',
+                              metavar='DAYS')
+    parser_prune.set_defaults(func=_prune_hash_cache)
+
     parser_completions = subparsers.add_parser(
         'completions',
         help='emit bash completions script to stdout'
@@ -436,20 +695,58 @@ def create_parser():
     return parser
 
 
+def _resolve_cli_paths(cmd, args):
+    """Resolves the function and paths that a command runs on.
+
+    The ``func``, ``path`` and ``from_file`` arguments are popped from the ``args``
+    dictionary. Commands of ``MULTI_PATH_CMDS`` given a single path run on it like
+    other commands, with a ``source`` of ``-`` copying stdin.
+
+    Returns:
+        tuple: The function to run, the path of single path commands and the list of
+        paths of commands given several paths (otherwise ``None``).
+    """
+    func = args.pop('func', None)
+    pth = args.pop('path', None)
+    from_file = args.pop('from_file', None)
+    if cmd not in MULTI_PATH_CMDS:
+        return func, pth, None
+
+    paths = pth if cmd == 'rm' else args.pop('source')
+    if from_file:
+        if from_file == '-' and '-' in paths:
+            perror('Error: - cannot be used with --from-file -\n')
+        paths = paths + _read_paths(from_file)
+    if '-' in paths and len(paths) > 1:
+        perror('Error: - cannot be used with other sources\n')
+    if not paths:
+        perror('Error: no paths to %s\n' % cmd)
+    elif len(paths) > 1:
+        return func, None, paths
+    elif cmd == 'rm':
+        return func, paths[0], None
+    elif paths[0] == '-':
+        return _copy_stdin, pth, None
+    args['source'] = paths[0]
+    return func, pth, None
+
+
 def process_args(args):
     args_copy = copy.copy(vars(args))
     config = args_copy.pop('config', None)
-    func = args_copy.pop('func', None)
-    pth = args_copy.pop('path', None)
     cmd = args_copy.pop('cmd', None)
+    threads = args_copy.pop('threads', None)
+    func, pth, paths = _resolve_cli_paths(cmd, args_copy)
 
     if config:
         settings.update(settings.parse_config_file(config))
-    func_kwargs = {
-        key: Path(val) if type(val) is TempPath else val
-        for key, val in args_copy.items() if val
-    }
+    func_kwargs = {key: val for key, val in args_copy.items() if val}
     try:
+        if paths:
+            num_failed = _run_many(cmd, func, paths, threads, **func_kwargs)
+            if num_failed:
+                perror('Error: %s of %s paths failed\n' % (num_failed, len(paths)))
+            return
         if pth:
             return func(pth, **func_kwargs)
         return func(**func_kwargs)
@@ -492,6 +789,12 @@ def main():
     dx_logger = logging.getLogger('stor.dx.progress')
     dx_logger.setLevel(logging.INFO)
     dx_logger.addHandler(handler)
+    obs_logger = logging.getLogger('stor.obs.progress')
+    obs_logger.setLevel(logging.INFO)
+    obs_logger.addHandler(handler)
+    cli_logger = logging.getLogger('stor.cli.progress')
+    cli_logger.setLevel(logging.INFO)
+    cli_logger.addHandler(handler)
 
     settings._initialize()
     parser = create_parser()
@@ -1,6 +1,11 @@
+from collections import OrderedDict
+from concurrent.futures import as_completed, ThreadPoolExecutor
+from functools import partial
 import logging
+import os
 import sys
-import tempfile
+import threading
+import time
 import urllib.parse
 import warnings
 
@@ -14,6 +19,7 @@ from stor import exceptions as stor_exceptions
 from stor import Path
 from stor import settings
 from stor import utils
+from stor.obs import OBSListEntry
 from stor.obs import OBSPath
 from stor.obs import OBSUploadObject
 from stor.posix import PosixPath
@@ -23,6 +29,15 @@ import stor.settings
 logger = logging.getLogger(__name__)
 progress_logger = logging.getLogger('%s.progress' % __name__)
 
+# The maximum number of objects resolved by each ``resolve_data_objects`` API call
+_RESOLVE_BATCH_SIZE = 1000
+
+# The maximum number of objects removed by each ``project.remove_objects`` API call
+_REMOVE_BATCH_SIZE = 1000
+
+# The maximum number of parts of a file uploaded with ``DXFile.upload_part``
+_MAX_FILE_PARTS = 10000
+
 
 class DNAnexusError(stor_exceptions.RemoteError):
     """Base class for all remote errors thrown by this DX module"""
@@ -78,12 +93,107 @@ def _dx_error_to_descriptive_exception(client_exception):
         return DNAnexusError(exc_str, client_exception)
 
 
+class _DXResolutionCache(object):
+    """A process-wide cache of dxids resolved from virtual paths.
+
+    Project names are cached under ``('project', name)`` keys and files under
+    ``('file', project_id, folder, name)`` keys. Entries expire after the ``[dx]``
+    ``resolution_cache_ttl`` and the least recently used entries are evicted once
+    there are more than ``resolution_cache_size`` of them.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get_many(self, keys):
+        """Returns a dict of the unexpired values cached for ``keys``."""
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                value, expires = entry
+                if expires <= now:
+                    del self._entries[key]
+                else:
+                    self._entries.move_to_end(key)
+                    found[key] = value
+        return found
+
+    def get(self, key):
+        """Returns the value cached for ``key`` or ``None``."""
+        return self.get_many([key]).get(key)
+
+    def set_many(self, items):
+        """Caches the values of the ``items`` dict."""
+        options = settings.get_section('dx')
+        ttl = options['resolution_cache_ttl']
+        if not ttl or ttl <= 0:
+            return
+        expires = time.monotonic() + ttl
+        with self._lock:
+            for key, value in items.items():
+                self._entries[key] = (value, expires)
+                self._entries.move_to_end(key)
+            while len(self._entries) > options['resolution_cache_size']:
+                self._entries.popitem(last=False)
+
+    def set(self, key, value):
+        """Caches ``value`` for ``key``."""
+        self.set_many({key: value})
+
+    def discard(self, matches):
+        """Removes every entry where ``matches(key, value)`` is True."""
+        with self._lock:
+            for key in [key for key, (value, _) in self._entries.items() if matches(key, value)]:
+                del self._entries[key]
+
+    def clear(self):
+        """Removes all entries."""
+        with self._lock:
+            self._entries.clear()
+
+
+_resolution_cache = _DXResolutionCache()
+
+
+class DXUploadLogger(utils.BaseProgressLogger):
+    def __init__(self, total_upload_objects):
+        super(DXUploadLogger, self).__init__(progress_logger)
+        self.total_upload_objects = total_upload_objects
+        self.uploaded_bytes = 0
+
+    def update_progress(self, result):
+        """Keep track of total uploaded bytes by referencing the object sizes"""
+        self.uploaded_bytes += os.path.getsize(result['source'])
+
+    def get_start_message(self):
+        return 'starting upload of %s objects' % self.total_upload_objects
+
+    def get_finish_message(self):
+        return 'upload complete - %s' % self.get_progress_message()
+
+    def get_progress_message(self):
+        elapsed_time = self.get_elapsed_time()
+        formatted_elapsed_time = self.format_time(elapsed_time)
+        mb = self.uploaded_bytes / (1024 * 1024.0)
+        mb_s = mb / elapsed_time.total_seconds() if elapsed_time else 0.0
+        return (
+            '%s/%s\t'
+            '%s\t'
+            '%0.2f MB\t'
+            '%0.2f MB/s'
+        ) % (self.num_results, self.total_upload_objects, formatted_elapsed_time, mb, mb_s)
+
+
 @contextmanager
 def _wrap_dx_calls():
     """Updates the dx_auth_token from settings for dxpy
     Bubbles all dxpy exceptions as `DNAnexusError` classes
     """
-    auth_token = settings.get()['dx']['auth_token']
+    auth_token = settings.get_section('dx')['auth_token']
     if auth_token:  # pragma: no cover
         dxpy.set_security_context({
             'auth_token_type': 'Bearer',
@@ -95,6 +205,45 @@ def _wrap_dx_calls():
         raise _dx_error_to_descriptive_exception(e) from e
 
 
+class _DXMultipartWriter(object):
+    """Writes a file in parts with ``DXFile.upload_part``. Used by `OBSSegmentWriter`
+    and streaming copies.
+
+    Any existing file at the path is removed when the upload starts, as with
+    `DXPath.write_object`. The file is closed once all parts are uploaded.
+    """
+    max_parts = _MAX_FILE_PARTS
+
+    def __init__(self, pth):
+        self._path = pth
+        self.segment_size = utils.str_to_bytes(
+            settings.get_section('dx:upload')['segment_size'])
+        self._file_handler = None
+
+    def start(self):
+        if self._path.isfile():
+            self._path.remove()
+        with _wrap_dx_calls():
+            self._file_handler = dxpy.new_dxfile(project=self._path.canonical_project,
+                                                 folder='/' + (self._path.parent.resource or ''),
+                                                 parents=True,
+                                                 name=str(self._path.name))
+
+    def upload_part(self, part_number, data):
+        with _wrap_dx_calls():
+            self._file_handler.upload_part(data, index=part_number)
+        return part_number
+
+    def complete(self, parts):
+        with _wrap_dx_calls():
+            self._file_handler.close()
+
+    def abort(self):
+        if self._file_handler:
+            with _wrap_dx_calls():
+                self._file_handler.remove()
+
+
 class DXPath(OBSPath):
     """
     Provides the ability to manipulate and access resources on DNAnexus
@@ -137,11 +286,16 @@ class DXPath(OBSPath):
 
         The canonical and virtual forms of DXPath objects are cached to not hit
         the server for every transformation call. However, after copy/remove/rename,
-        the cached information is outdated and needs to be cleared.
+        the cached information is outdated and needs to be cleared. Entries of the
+        process-wide resolution cache for files at or under this path are cleared too.
         """
+        self._clear_shared_cache()
         for prop in ('canonical_project', 'canonical_resource', 'virtual_path', 'virtual_project'):
             self.__dict__.pop(prop, None)
 
+    def _clear_shared_cache(self):
+        raise NotImplementedError
+
     def virtual_project(self):
         raise NotImplementedError
 
@@ -213,7 +367,7 @@ class DXPath(OBSPath):
         """
         if not self.resource:
             raise ValueError('DX Projects cannot have a temporary download url')
-        file_proxy_url = stor.settings.get()['dx']['file_proxy_url']
+        file_proxy_url = stor.settings.get_section('dx')['file_proxy_url']
         if file_proxy_url:
             if not file_proxy_url.startswith('http'):
                 raise ValueError("if set, ``file_proxy_url`` must be an http(s) path")
@@ -312,17 +466,19 @@ class DXPath(OBSPath):
         Removes a resource and all of its contents.
         The path should point to a project or directory.
 
+        When the path is a project, every data object in it is removed with
+        ``remove_objects`` calls of up to 1000 object ids, after which the top-level
+        folders are removed. Both steps run on ``object_threads`` threads (configured
+        in the ``dx:delete`` settings).
+
         Raises:
             NotFoundError: The path points to a nonexistent directory
+            DNAnexusError: Some objects or folders of a project failed to be removed
         """
         proj_handler = dxpy.DXProject(self.canonical_project)
         if not self.resource:
-            folders = self.listdir(only='folders')
-            files = self.listdir(only='objects')
-            for folder_p in folders:
-                folder_p.rmtree()
-            for file_p in files:
-                file_p.remove()
+            self._rmtree_project(proj_handler)
+            self.clear_cached_properties()
             return
         try:
             proj_handler.remove_folder('/' + self.resource, recurse=True)
@@ -331,6 +487,61 @@ class DXPath(OBSPath):
                                                 .format(self), e)
         self.clear_cached_properties()
 
+    def _rmtree_project(self, proj_handler):
+        """Removes all data objects and folders of a project. Helper for rmtree."""
+        options = settings.get_section('dx:delete')
+        errors = []
+
+        def collect(futures):
+            for fut in as_completed(futures):
+                try:
+                    fut.result()
+                except Exception as e:
+                    errors.append(e)
+
+        with ThreadPoolExecutor(max_workers=options['object_threads']) as executor:
+            futures = []
+            try:
+                # Objects are removed before their folders so the folder removals
+                # do not race with the batches
+                batch = []
+                for obj in dxpy.find_data_objects(project=proj_handler.get_id(),
+                                                  folder='/', recurse=True):
+                    batch.append(obj['id'])
+                    if len(batch) == _REMOVE_BATCH_SIZE:
+                        futures.append(executor.submit(self._remove_batch,
+                                                       proj_handler, batch))
+                        batch = []
+                if batch:
+                    futures.append(executor.submit(self._remove_batch, proj_handler, batch))
+                collect(futures)
+
+                folders = proj_handler.list_folder('/', only='folders')['folders']
+                futures = [
+                    executor.submit(self._remove_folder, proj_handler, folder)
+                    for folder in folders
+                ]
+                collect(futures)
+            finally:
+                for fut in futures:
+                    fut.cancel()
+
+        if len(errors) == 1:
+            raise errors[0]
+        elif errors:
+            raise DNAnexusError('{} error(s) occurred while using rmtree: {}'
+                                .format(len(errors), errors[0]), errors)
+
+    def _remove_batch(self, proj_handler, object_ids):
+        """Removes a batch of object ids from a project. Helper for threaded rmtree."""
+        with _wrap_dx_calls():
+            proj_handler.remove_objects(object_ids)
+
+    def _remove_folder(self, proj_handler, folder):
+        """Removes a folder of a project. Helper for threaded rmtree."""
+        with _wrap_dx_calls():
+            proj_handler.remove_folder(folder, recurse=True)
+
     def makedirs_p(self, mode=0o777):
         """Make directories, including parents on DX from DX folder paths.
 
@@ -543,7 +754,8 @@ class DXPath(OBSPath):
                 raise stor_exceptions.NotFoundError(
                     'No data object was found for the given path on DNAnexus')
         else:
-            super(DXPath, self).copy(dest)  # for other filesystems, delegate to utils.copy
+            # for other services and filesystems, delegate to OBSPath.copy
+            super(DXPath, self).copy(dest, **kwargs)
 
     def copytree(self, dest, raise_if_same_project=False, **kwargs):
         """Copies a source directory to a destination directory.
@@ -613,7 +825,8 @@ class DXPath(OBSPath):
                 raise stor_exceptions.NotFoundError(
                     'No project or directory was found at path ({})'.format(self))
         else:
-            super(DXPath, self).copytree(dest)  # for other filesystems, delegate to utils.copytree
+            # for other services and filesystems, delegate to OBSPath.copytree
+            super(DXPath, self).copytree(dest, **kwargs)
 
     def _prep_for_copytree(self, dest):
         """Handles logic, for finalizing target destination, making parent folders
@@ -762,14 +975,46 @@ class DXPath(OBSPath):
             obj: DXPath(obj) if utils.is_dx_path(obj) else source / obj
             for obj in objects
         }
-        results = {}
-        for obj, dx_obj in objs_to_download.items():
-            dest_resource = dx_obj[len(source):].lstrip('/')
-            dest_obj = PosixPath(dest) / dest_resource
-            dx_obj.copy(dest_obj)
-            results[obj] = dest_obj
+        results = {
+            obj: PosixPath(dest) / dx_obj[len(source):].lstrip('/')
+            for obj, dx_obj in objs_to_download.items()
+        }
+
+        # Resolve all objects with batched calls before downloading them concurrently
+        canonical_objs = dict(zip(objs_to_download,
+                                  _resolve_paths(list(objs_to_download.values()))))
+        errors = {
+            obj: canonical_obj for obj, canonical_obj in canonical_objs.items()
+            if isinstance(canonical_obj, Exception)
+        }
+        options = settings.get_section('dx:download')
+        with ThreadPoolExecutor(max_workers=options['object_threads']) as executor:
+            futures = {
+                executor.submit(self._download_file, canonical_obj, results[obj]): obj
+                for obj, canonical_obj in canonical_objs.items()
+                if obj not in errors
+            }
+            for fut in as_completed(futures):
+                try:
+                    fut.result()
+                except Exception as e:
+                    errors[futures[fut]] = e
+
+        if len(errors) == 1:
+            raise next(iter(errors.values()))
+        elif errors:
+            raise DNAnexusError('{} error(s) occurred while downloading objects: {}'
+                                .format(len(errors), errors), errors)
         return results
 
+    def _download_file(self, canonical_path, dest):
+        """Downloads a single canonical file path. Helper for threaded downloads."""
+        dest.parent.makedirs_p()
+        with _wrap_dx_calls():
+            dxpy.download_dxfile(dxid=canonical_path.canonical_resource,
+                                 filename=dest,
+                                 project=canonical_path.canonical_project)
+
     @_wrap_dx_calls()
     def download(self, dest, **kwargs):
         """Download a directory.
@@ -792,6 +1037,10 @@ class DXPath(OBSPath):
         This is not a batch level operation.
         If some file errors, the files uploaded before will remain present.
 
+        Files are uploaded concurrently with the ``[dx:upload]`` ``object_threads``
+        setting. Files that already exist at their destination are found with batched
+        ``resolve_data_objects`` calls and are skipped.
+
         Args:
             to_upload (List[Union[str, OBSUploadObject]]): A list of posix file names,
                 directory names, or OBSUploadObject objects to upload.
@@ -816,6 +1065,7 @@ class DXPath(OBSPath):
             for f in all_files_to_upload
         ])
 
+        files_to_upload = []
         for upload_obj in dx_upload_objects:
             upload_obj.object_name = Path(upload_obj.object_name)
             upload_obj.source = Path(upload_obj.source)
@@ -824,21 +1074,7 @@ class DXPath(OBSPath):
                 path=upload_obj.object_name))
 
             if upload_obj.source.isfile():
-                dest_is_file = dest_file.isfile()
-                if dest_is_file:  # only occurs if upload is called directly with existing objects
-                    logger.warning(
-                        'Destination path ({}) already exists, will not cause '
-                        'duplicate file objects on the platform. Skipping...'
-                        .format(dest_file))
-                else:
-                    with _wrap_dx_calls():
-                        dxpy.upload_local_file(
-                            filename=upload_obj.source,
-                            project=self.canonical_project,
-                            folder='/' + (dest_file.parent.resource or ''),
-                            parents=True,
-                            name=dest_file.name
-                        )
+                files_to_upload.append((upload_obj.source, dest_file))
             elif upload_obj.source.isdir():
                 dest_file.makedirs_p()
             else:
@@ -846,6 +1082,55 @@ class DXPath(OBSPath):
                     'Source path ({}) does not exist. Please provide a valid source'
                     .format(upload_obj.source))
 
+        if not files_to_upload:
+            return
+
+        # Resolve the destinations in batches instead of checking every file for existence
+        dest_files = [dest_file for _, dest_file in files_to_upload]
+        existing_files = {
+            str(dest_file) for dest_file, resolved in zip(dest_files,
+                                                          _resolve_paths(dest_files))
+            if not isinstance(resolved, stor_exceptions.NotFoundError)
+        }
+        new_files_to_upload = []
+        for source, dest_file in files_to_upload:
+            if str(dest_file) in existing_files:
+                # only occurs if upload is called directly with existing objects
+                logger.warning(
+                    'Destination path ({}) already exists, will not cause '
+                    'duplicate file objects on the platform. Skipping...'
+                    .format(dest_file))
+            else:
+                existing_files.add(str(dest_file))
+                new_files_to_upload.append((source, dest_file))
+
+        options = settings.get_section('dx:upload')
+        with DXUploadLogger(len(new_files_to_upload)) as ul:
+            with ThreadPoolExecutor(max_workers=options['object_threads']) as executor:
+                futures = [
+                    executor.submit(self._upload_file, source, dest_file)
+                    for source, dest_file in new_files_to_upload
+                ]
+                try:
+                    for fut in as_completed(futures):
+                        ul.add_result(fut.result())
+                except BaseException:
+                    for fut in futures:
+                        fut.cancel()
+                    raise
+
+    def _upload_file(self, source, dest_file):
+        """Uploads a single local file. Helper for threaded uploads."""
+        with _wrap_dx_calls():
+            dxpy.upload_local_file(
+                filename=source,
+                project=self.canonical_project,
+                folder='/' + (dest_file.parent.resource or ''),
+                parents=True,
+                name=dest_file.name
+            )
+        return {'source': source, 'dest': dest_file}
+
     def read_object(self):
         """Reads an individual object from DX.
         Note dxpy for Py3 automatically decodes the DXFile.read using utf-8.
@@ -863,17 +1148,55 @@ class DXPath(OBSPath):
         result = result.encode('utf-8')  # dxpy for py3 already decodes the data with 'utf-8'
         return result
 
+    def read_object_range(self, start, end):
+        """Reads a byte range of an individual object from DX.
+
+        Args:
+            start (int): The offset of the first byte to read
+            end (int): The offset of the last byte to read (inclusive)
+
+        Returns:
+            bytes: the raw bytes of the range from the object on DX.
+        """
+        return self._get_range_reader()(start, end)
+
+    def _get_range_reader(self):
+        """Returns a function that reads byte ranges of the file with one ``DXFile``, so
+        that streamed reads do not look up the file again for every range."""
+        if not self.resource:
+            raise ValueError('Can only read_object_range() on a file path, not a project')
+        file_handler = dxpy.DXFile(dxid=self.canonical_resource,
+                                   project=self.canonical_project,
+                                   mode='rb')
+
+        def read_range(start, end):
+            with _wrap_dx_calls():
+                file_handler.seek(start)
+                return file_handler.read(end - start + 1)
+        return read_range
+
+    def _get_multipart_writer(self):
+        return _DXMultipartWriter(self)
+
+    def _list_copy_entries(self, use_manifest=False):
+        """Lists the files of a directory for `OBSPath.copytree`. DX listings do not
+        include sizes, which are looked up when files are copied."""
+        condition = None
+        if use_manifest:
+            condition = partial(utils.validate_manifest_list,
+                                utils.get_data_manifest_contents(self))
+        return [OBSListEntry(p) for p in self.list(condition=condition)]
+
     def write_object(self, content, **kwargs):
         """Writes an individual object to DX.
 
-        Note that this method writes the provided content to a temporary
-        file before uploading. This allows us to reuse code from DXPath's
-        uploader (multi part object support, etc.).
+        The content is uploaded from memory to a new file with ``dxpy.upload_string``.
+        Any existing file at the path is removed first.
 
         Args:
             content (bytes): raw bytes to write to OBS
-            **kwargs: Keyword arguments to pass to
-                `DXPath.upload`
+            **kwargs: Keyword arguments of `DXPath.upload`, which are accepted for
+                compatibility and not used
         """
         if not self.resource:
             raise ValueError('Cannot write to project. Please provide a file path')
@@ -881,16 +1204,16 @@ class DXPath(OBSPath):
             # bytes/unicode a little confused so allow it
             warnings.warn('A future version of stor will raise a'
                           ' TypeError if content is not bytes')
-        mode = 'wb' if type(content) == bytes else 'wt'
         if self.isfile():
             self.remove()
-        with tempfile.NamedTemporaryFile(mode=mode) as fp:
-            fp.write(content)
-            fp.flush()
-            suo = OBSUploadObject(fp.name, object_name='/' + self.resource)
-            return self.upload([suo], **kwargs)
+        with _wrap_dx_calls():
+            dxpy.upload_string(content,
+                               project=self.canonical_project,
+                               folder='/' + (self.parent.resource or ''),
+                               parents=True,
+                               name=str(self.name))
 
-    def open(self, mode='r', encoding=None):
+    def open(self, mode='r', encoding=None, stream=False):
         """
         Opens a OBSFile that can be read or written to and is uploaded to
         the remote service.
@@ -903,6 +1226,9 @@ class DXPath(OBSPath):
                 ("r" or "rb") and writing ("w", "wb")
             encoding (str): text encoding to use. Defaults to
                 ``locale.getpreferredencoding(False)``
+            stream (bool): In read modes, fetch the file in byte ranges as it is
+                read instead of reading the whole file into memory when opened. In write
+                modes, upload the file in parts as it is written.
 
         Returns:
             OBSFile: The file object for Swift/S3/DX.
@@ -916,7 +1242,7 @@ class DXPath(OBSPath):
                              'utf-8. Please switch your encoding')
         if not self.resource:
             raise ValueError("Can only read or write on file paths not project paths")
-        return super().open(mode=mode, encoding=encoding)
+        return super().open(mode=mode, encoding=encoding, stream=stream)
 
     def list(self,
              canonicalize=False,
@@ -1093,7 +1419,8 @@ class DXPath(OBSPath):
             list_gen = dxpy.find_data_objects(**kwargs)
         for obj in list_gen:
             if canonicalize:
-                yield DXCanonicalPath('dx://{}:/{}'.format(obj['project'], obj['id']))
+                yield DXCanonicalPath._from_validated(
+                    'dx://{}:/{}'.format(obj['project'], obj['id']))
             else:
                 yield DXVirtualPath('{drive}{proj_name}:{folder}/{name}'.format(
                     drive=self.drive,
@@ -1182,6 +1509,11 @@ class DXVirtualPath(DXPath):
         if utils.is_valid_dxid(self.project, 'project'):
             return self.project
 
+        cache_key = ('project', self.project)
+        project_id = _resolution_cache.get(cache_key)
+        if project_id:
+            return project_id
+
         with _wrap_dx_calls():
             try:
                 proj_dict = dxpy.find_one_project(
@@ -1194,6 +1526,7 @@ class DXVirtualPath(DXPath):
             raise ProjectNotFoundError('Found no projects for name: {!r}'
                                        .format(self.project))
 
+        _resolution_cache.set(cache_key, proj_dict['id'])
         return proj_dict['id']
 
     @cached_property
@@ -1210,6 +1543,11 @@ class DXVirtualPath(DXPath):
         if utils.has_trailing_slash(self):
             raise ValueError('Invalid operation ({method}) on folder path ({path})'
                              .format(path=self, method=sys._getframe(2).f_code.co_name))
+        cache_key = ('file', self.canonical_project, ('/' + self.resource).parent, self.name)
+        file_id = _resolution_cache.get(cache_key)
+        if file_id:
+            return file_id
+
         objects = [{
             'name': self.name,
             'folder': ('/' + self.resource).parent,
@@ -1222,6 +1560,7 @@ class DXVirtualPath(DXPath):
             raise MultipleObjectsSameNameError('Multiple objects found at path ({}). '
                                                'Try using a canonical ID instead'.format(self))
         elif len(results) == 1:
+            _resolution_cache.set(cache_key, results[0]['id'])
             return results[0]['id']
         else:
             raise stor_exceptions.NotFoundError(
@@ -1268,6 +1607,30 @@ class DXVirtualPath(DXPath):
         except stor_exceptions.NotFoundError:
             return False
 
+    def _clear_shared_cache(self):
+        """Clears the shared resolution cache entries of files at or under this path"""
+        if utils.is_valid_dxid(self.project, 'project'):
+            project_id = self.project
+        else:
+            project_id = (self.__dict__.get('canonical_project') or
+                          _resolution_cache.get(('project', self.project)))
+        if not project_id:
+            return
+        resource = self.normpath().resource
+        if not resource:
+            _resolution_cache.discard(lambda key, value: key[:2] == ('file', project_id))
+            return
+
+        path = '/' + resource.rstrip('/')
+
+        def matches(key, value):
+            if key[:2] != ('file', project_id):
+                return False
+            file_path = str(key[2]).rstrip('/') + '/' + key[3]
+            return file_path == path or file_path.startswith(path + '/')
+
+        _resolution_cache.discard(matches)
+
 
 class DXCanonicalPath(DXPath):
     """Represents fully canonicalized DNAnexus paths:
@@ -1342,3 +1705,104 @@ class DXCanonicalPath(DXPath):
                 return True
             except stor_exceptions.NotFoundError:
                 return False
+
+    def _clear_shared_cache(self):
+        """Clears the shared resolution cache entries of this file, or of every file
+        in this project"""
+        if self.resource:
+            _resolution_cache.discard(lambda key, value: value == self.resource)
+        else:
+            _resolution_cache.discard(lambda key, value: key[:2] == ('file', self.project))
+
+
+def resolve_many(paths):
+    """Resolves many dx paths to canonical paths with batched API calls.
+
+    Each distinct project name is resolved once, and files are resolved with up to
+    1000 objects per ``resolve_data_objects`` call. Resolved dxids are shared with
+    other `DXPath` objects through the process-wide resolution cache, so paths
+    that were already resolved do not make any API calls.
+
+    Args:
+        paths (List[str|DXPath]): The dx paths to resolve. Canonical paths are
+            returned as is.
+
+    Returns:
+        List[DXCanonicalPath]: The canonical paths, in the same order as ``paths``.
+
+    Raises:
+        MultipleObjectsSameNameError: If a project name or file path is not unique
+        NotFoundError: If a project or file is not found on DNAnexus
+        ValueError: If a path looks like a folder path (i.e., ends with trailing slash)
+    """
+    results = _resolve_paths(paths)
+    for result in results:
+        if isinstance(result, Exception):
+            raise result
+    return results
+
+
+def _resolve_paths(paths):
+    """Resolves dx paths like `resolve_many`, but returns the exception for each path
+    that cannot be resolved in place of its canonical path."""
+    paths = [DXPath(p) for p in paths]
+    errors = {}
+    for i, p in enumerate(paths):
+        if isinstance(p, DXVirtualPath) and p.resource and utils.has_trailing_slash(p):
+            errors[i] = ValueError('Invalid operation (resolve_many) on folder path ({path})'
+                                   .format(path=p))
+
+    project_ids = {}
+    for i, p in enumerate(paths):
+        if i in errors or not isinstance(p, DXVirtualPath):
+            continue
+        if p.project not in project_ids:
+            try:
+                project_ids[p.project] = p.canonical_project
+            except (MultipleObjectsSameNameError, stor_exceptions.NotFoundError) as e:
+                project_ids[p.project] = e
+        if isinstance(project_ids[p.project], Exception):
+            errors[i] = project_ids[p.project]
+        else:
+            p.__dict__['canonical_project'] = project_ids[p.project]
+
+    file_keys = {
+        i: ('file', p.canonical_project, ('/' + p.resource).parent, p.name)
+        for i, p in enumerate(paths)
+        if i not in errors and isinstance(p, DXVirtualPath) and p.resource
+    }
+    file_ids = _resolution_cache.get_many(file_keys.values())
+    unresolved = list(OrderedDict.fromkeys(
+        key for key in file_keys.values() if key not in file_ids))
+    num_matches = {}
+    if unresolved:
+        objects = [
+            {'project': project_id, 'folder': folder, 'name': name}
+            for _, project_id, folder, name in unresolved
+        ]
+        with _wrap_dx_calls():
+            results = dxpy.resolve_data_objects(objects=objects,
+                                                batchsize=_RESOLVE_BATCH_SIZE)
+        resolved = {
+            key: key_results[0]['id']
+            for key, key_results in zip(unresolved, results)
+            if len(key_results) == 1
+        }
+        _resolution_cache.set_many(resolved)
+        file_ids.update(resolved)
+        num_matches = {
+            key: len(key_results) for key, key_results in zip(unresolved, results)
+        }
+
+    for i, key in file_keys.items():
+        if key in file_ids:
+            paths[i].__dict__['canonical_resource'] = file_ids[key]
+        elif num_matches[key] > 1:
+            errors[i] = MultipleObjectsSameNameError('Multiple objects found at path ({}). '
+                                                     'Try using a canonical ID instead'
+                                                     .format(paths[i]))
+        else:
+            errors[i] = stor_exceptions.NotFoundError(
+                'No data object was found for the given path ({}) on DNAnexus'
+                .format(paths[i]))
+    return [errors[i] if i in errors else p.canonical_path for i, p in enumerate(paths)]
@@ -0,0 +1,307 @@
+"""
+A persistent cache of the MD5s and ETags of local files.
+
+Deciding whether a local file is identical to an object (e.g. with `stor.sync` or the
+``skip_identical`` upload settings) requires the MD5 of the file, or the ETag it would
+have as an S3 multipart upload or a Swift static large object. Computing these reads
+the whole file, so they are stored in a SQLite database keyed by the device, inode,
+size and modification time (in nanoseconds) of the file. A file that has not changed
+is never read again, while any change to the file changes its key.
+
+The cache is configured with the ``stor:hash_cache`` settings::
+
+    [stor:hash_cache]
+    enabled = True
+    path = ~/.cache/stor/hashes.sqlite
+    max_entries = 1000000
+
+When ``max_entries`` is exceeded, the least recently used entries are evicted.
+Entries of files that have changed or been removed can be pruned with `prune` or
+the ``stor prune-hash-cache`` command.
+"""
+import functools
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from stor import settings
+
+logger = logging.getLogger(__name__)
+
+# The size of the reads used when hashing files
+_HASH_CHUNK_SIZE = 1024 * 1024
+# Evict entries beyond ``max_entries`` after this many entries have been added
+_EVICT_INTERVAL = 1000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS hashes (
+    device INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    part_size INTEGER NOT NULL,
+    digest TEXT NOT NULL,
+    path TEXT NOT NULL,
+    accessed REAL NOT NULL,
+    PRIMARY KEY (device, inode, size, mtime_ns, kind, part_size)
+);
+CREATE INDEX IF NOT EXISTS hashes_accessed ON hashes (accessed);
+"""
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def _stat_key(stat):
+    return (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+def _default_path():
+    cache_dir = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(cache_dir, 'stor', 'hashes.sqlite')
+
+
+class HashCache(object):
+    """
+    A SQLite database of file hashes. It is safe to use from several threads and
+    processes.
+
+    Hashes are stored by ``kind``:
+
+    * ``md5``: The MD5 of the file (with a ``part_size`` of 0).
+    * ``s3``: The ETag of the file as an S3 multipart upload with parts of ``part_size``.
+    * ``swift``: The ETag of the file as a Swift static large object with segments of
+      ``part_size``.
+    """
+    def __init__(self, path, max_entries=None):
+        """
+        Args:
+            path (str): The database file. Its directory is created if needed.
+            max_entries (int): The maximum number of entries. The least recently used
+                entries beyond it are evicted.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._num_added = 0
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None,
+                                     check_same_thread=False)
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.executescript(_SCHEMA)
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM hashes').fetchone()[0]
+
+    def get(self, stat, kind, part_size=0):
+        """Returns the cached hash of a file with the given ``os.stat`` result, or None"""
+        key = _stat_key(stat) + (kind, part_size)
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    'SELECT digest FROM hashes WHERE device=? AND inode=? AND size=? AND '
+                    'mtime_ns=? AND kind=? AND part_size=?', key).fetchone()
+                if row:
+                    self._conn.execute(
+                        'UPDATE hashes SET accessed=? WHERE device=? AND inode=? AND size=? '
+                        'AND mtime_ns=? AND kind=? AND part_size=?', (time.time(),) + key)
+        except sqlite3.Error as exc:
+            logger.warning('could not read from hash cache %s: %s', self.path, exc)
+            return None
+        return row[0] if row else None
+
+    def set_many(self, stat, file_name, hashes):
+        """Caches hashes of a file
+
+        Args:
+            stat (os.stat_result): The stat of the file before it was hashed.
+            file_name (str): The name of the file, used by `prune`.
+            hashes (dict): Hashes keyed by ``(kind, part_size)``.
+        """
+        now = time.time()
+        rows = [
+            _stat_key(stat) + (kind, part_size, digest, os.path.abspath(file_name), now)
+            for (kind, part_size), digest in hashes.items()
+        ]
+        try:
+            with self._lock:
+                self._conn.executemany(
+                    'INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+                self._num_added += len(rows)
+                if self._num_added >= _EVICT_INTERVAL:
+                    self._num_added = 0
+                    self._evict()
+        except sqlite3.Error as exc:
+            logger.warning('could not write to hash cache %s: %s', self.path, exc)
+
+    def _evict(self):
+        """Removes the least recently used entries beyond ``max_entries``"""
+        if not self.max_entries:
+            return 0
+        return self._conn.execute(
+            'DELETE FROM hashes WHERE rowid IN (SELECT rowid FROM hashes ORDER BY accessed '
+            'LIMIT MAX((SELECT COUNT(*) FROM hashes) - ?, 0))', (self.max_entries,)).rowcount
+
+    def prune(self, max_age=None):
+        """Removes the entries of files that have changed or no longer exist
+
+        Args:
+            max_age (float): Also remove entries that have not been used for this many
+                seconds.
+
+        Returns:
+            int: The number of removed entries.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT DISTINCT device, inode, size, mtime_ns, path FROM hashes').fetchall()
+        stale = []
+        for row in rows:
+            try:
+                if _stat_key(os.stat(row[4])) != row[:4]:
+                    stale.append(row[:4])
+            except OSError:
+                stale.append(row[:4])
+
+        with self._lock:
+            num_removed = 0
+            for key in stale:
+                num_removed += self._conn.execute(
+                    'DELETE FROM hashes WHERE device=? AND inode=? AND size=? AND mtime_ns=?',
+                    key).rowcount
+            if max_age is not None:
+                num_removed += self._conn.execute('DELETE FROM hashes WHERE accessed < ?',
+                                                  (time.time() - max_age,)).rowcount
+            num_removed += self._evict()
+            self._conn.execute('VACUUM')
+        return num_removed
+
+
+def get_cache():
+    """Returns the `HashCache` configured by the ``stor:hash_cache`` settings
+
+    Returns:
+        HashCache: The cache, or None if it is disabled or cannot be opened
+    """
+    options = settings.get_section('stor:hash_cache')
+    if not options.get('enabled'):
+        return None
+    path = os.path.expanduser(options.get('path') or _default_path())
+    with _caches_lock:
+        if path not in _caches:
+            try:
+                _caches[path] = HashCache(path, max_entries=options.get('max_entries'))
+            except (OSError, sqlite3.Error) as exc:
+                logger.warning('not caching file hashes, could not open %s: %s', path, exc)
+                _caches[path] = None
+        return _caches[path]
+
+
+def prune(max_age=None):
+    """Removes the entries of files that have changed or no longer exist from the
+    configured cache. See `HashCache.prune`.
+
+    Returns:
+        int: The number of removed entries.
+    """
+    cache = get_cache()
+    return cache.prune(max_age=max_age) if cache is not None else 0
+
+
+def _hash_file(file_name, part_size=None):
+    """Reads a file once to compute the MD5 of its contents and of each of its parts
+
+    Returns:
+        tuple(hashlib.md5, List[hashlib.md5]): The MD5 of the file and the MD5s of
+        each ``part_size`` part of the file (empty if no ``part_size`` is given)
+    """
+    file_md5 = hashlib.md5()
+    part_md5s = []
+    part_md5 = hashlib.md5()
+    part_remaining = part_size
+    with open(file_name, 'rb') as fp:
+        for chunk in iter(functools.partial(fp.read, _HASH_CHUNK_SIZE), b''):
+            file_md5.update(chunk)
+            chunk = memoryview(chunk) if part_size else None
+            while chunk:
+                part = chunk[:part_remaining]
+                part_md5.update(part)
+                part_remaining -= len(part)
+                chunk = chunk[len(part):]
+                if not part_remaining:
+                    part_md5s.append(part_md5)
+                    part_md5 = hashlib.md5()
+                    part_remaining = part_size
+    if part_size and part_remaining != part_size:
+        part_md5s.append(part_md5)
+    return file_md5, part_md5s
+
+
+def get_file_hashes(file_name, part_size=None, cache=None):
+    """Returns the MD5 of a local file and the ETags it has when uploaded in parts
+
+    The file is only read if the hashes are not in the cache.
+
+    Args:
+        file_name (str): The file.
+        part_size (int): Also return the ETags of the file when uploaded in parts of
+            this size.
+        cache (HashCache): The cache to use, if any.
+
+    Returns:
+        dict: The ``md5`` of the file and, with ``part_size``, its ETag as an ``s3``
+        multipart upload and as a ``swift`` static large object.
+    """
+    stat = os.stat(file_name)
+    kinds = [('md5', 0)] + ([('s3', part_size), ('swift', part_size)] if part_size else [])
+    if cache is not None:
+        cached = {kind: cache.get(stat, *kind) for kind in kinds}
+        if all(cached.values()):
+            return {kind: digest for (kind, _), digest in cached.items()}
+
+    file_md5, part_md5s = _hash_file(file_name, part_size)
+    hashes = {('md5', 0): file_md5.hexdigest()}
+    if part_size:
+        s3_md5 = hashlib.md5(b''.join(m.digest() for m in part_md5s))
+        hashes[('s3', part_size)] = '%s-%s' % (s3_md5.hexdigest(), len(part_md5s))
+        swift_md5 = hashlib.md5(''.join(m.hexdigest() for m in part_md5s).encode())
+        hashes[('swift', part_size)] = swift_md5.hexdigest()
+    if cache is not None:
+        cache.set_many(stat, file_name, hashes)
+    return {kind: digest for (kind, _), digest in hashes.items()}
+
+
+def etag_matches(file_name, entry, segment_size, cache=None):
+    """Returns True if a local file has the ETag of a listed S3 or Swift object
+
+    Args:
+        file_name (str): The local file.
+        entry (OBSListEntry): The listed object.
+        segment_size (int): The upload ``segment_size`` of the service of the object.
+        cache (HashCache): The cache to use, if any.
+    """
+    from stor import utils
+
+    etag = (entry.etag or '').strip('"')
+    if utils.is_s3_path(entry.path) and '-' in etag:
+        # Multipart uploads have the MD5 of the MD5s of their parts, followed by the
+        # number of parts. Objects uploaded with another part size are assumed to have
+        # equal parts rounded up to a MiB, as most clients do.
+        num_parts = int(etag.rsplit('-', 1)[1])
+        part_size = segment_size
+        if -(-entry.size // part_size) != num_parts:
+            part_size = -(-entry.size // num_parts)
+            part_size = max(-(-part_size // 2 ** 20) * 2 ** 20, 2 ** 20)
+        return get_file_hashes(file_name, part_size, cache=cache)['s3'] == etag
+    elif utils.is_swift_path(entry.path) and entry.size > segment_size:
+        # Static large objects are listed with the MD5 of the MD5s of their segments
+        hashes = get_file_hashes(file_name, segment_size, cache=cache)
+        return etag in (hashes['md5'], hashes['swift'])
+    else:
+        return get_file_hashes(file_name, cache=cache)['md5'] == etag
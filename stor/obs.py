@@ -1,17 +1,28 @@
+from collections import deque
+from contextlib import contextmanager
+from functools import partial
+from concurrent.futures import as_completed, ThreadPoolExecutor, wait
 import io
+from itertools import islice
 import locale
+import logging
+import os
 import posixpath
 import sys
-
-import dxpy
-from swiftclient.service import SwiftError
-from swiftclient.service import SwiftUploadObject
+import threading
 
 from stor.base import Path
+from stor import exceptions
 from stor.posix import PosixPath
 from stor import utils
 import stor
 
+logger = logging.getLogger(__name__)
+progress_logger = logging.getLogger('%s.progress' % __name__)
+
+# Segments of streamed writes grow no larger than the maximum part size of S3, Swift and DX
+_MAX_SEGMENT_SIZE = 5 * 1024 ** 3
+
 
 def _delegate_to_buffer(attr_name, valid_modes=None):
     """Factory function that delegates file-like properties to underlying buffer"""
@@ -28,10 +39,13 @@ def _delegate_to_buffer(attr_name, valid_modes=None):
     return wrapper
 
 
-class OBSUploadObject(SwiftUploadObject):
+class OBSUploadObject(object):
     """
     An upload object similar to swiftclient's SwiftUploadObject that allows the user
     to specify a destination file name (full key) and upload options.
+
+    It validates its arguments the same way as SwiftUploadObject, but does not
+    depend on swiftclient, so it can be used without importing it.
     """
     def __init__(self, source, object_name, options=None):
         """
@@ -41,14 +55,231 @@ class OBSUploadObject(SwiftUploadObject):
             source (str): A path that specifies a source file.
             dest (str): A path that specifies a destination file name (full key)
         """
+        if isinstance(source, str):
+            self.object_name = object_name or source
+        elif source is None or hasattr(source, 'read'):
+            if not object_name or not isinstance(object_name, str):
+                raise ValueError('Object names must be specified as strings for uploads '
+                                 'from None or file like objects.')
+            self.object_name = object_name
+        else:
+            raise ValueError('Unexpected source type for OBSUploadObject: {0}'
+                             .format(type(source)))
+
+        if not self.object_name:
+            raise ValueError('Object names must not be empty strings')
+
+        self.object_name = self.object_name.lstrip('/')
+        self.options = dict(options or {})
+        self.source = source
+
+
+class OBSListEntry(object):
+    """
+    A listed path along with the metadata returned by the listing, as returned by
+    ``list(with_metadata=True)`` of S3 and Swift paths.
+
+    Metadata that the service does not return for an entry (e.g. for directories when
+    listing as a directory) is ``None``.
+
+    Attributes:
+        path (OBSPath): The listed path.
+        size (int): The size of the object in bytes.
+        etag (str): The ETag (MD5 hash for non-segmented objects) of the object,
+            without quotes.
+        last_modified (datetime|str): When the object was last modified, as returned by
+            the service (a ``datetime`` for S3 and an ISO 8601 string for Swift).
+        storage_class (str): The S3 storage class of the object.
+        content_type (str): The Swift content type of the object.
+    """
+    __slots__ = ('path', 'size', 'etag', 'last_modified', 'storage_class', 'content_type')
+
+    def __init__(self, path, size=None, etag=None, last_modified=None, storage_class=None,
+                 content_type=None):
+        self.path = path
+        self.size = size
+        self.etag = etag
+        self.last_modified = last_modified
+        self.storage_class = storage_class
+        self.content_type = content_type
+
+    def __eq__(self, other):
+        if not isinstance(other, OBSListEntry):
+            return NotImplemented
+        return all(getattr(self, attr) == getattr(other, attr) for attr in self.__slots__)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '%s(%s)' % (type(self).__name__, ', '.join(
+            '%s=%r' % (attr, getattr(self, attr)) for attr in self.__slots__
+            if getattr(self, attr) is not None
+        ))
+
+
+class _BufferPool(object):
+    """Limits the number of bytes held in memory by the threads of a streaming copy"""
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._reserved = 0
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def reserve(self, num_bytes):
+        """Waits until ``num_bytes`` are available and reserves them in the context.
+
+        More than ``max_bytes`` can be reserved when nothing else is, so that parts
+        larger than the pool do not wait forever.
+        """
+        with self._cond:
+            while self._reserved and self._reserved + num_bytes > self.max_bytes:
+                self._cond.wait()
+            self._reserved += num_bytes
         try:
-            super(OBSUploadObject, self).__init__(source, object_name=object_name, options=options)
-        except SwiftError as exc:
-            if 'SwiftUploadObject' in exc.value:
-                msg = exc.value.replace('SwiftUploadObject', 'OBSUploadObject', 1)
-            else:
-                msg = exc.value
-            raise ValueError(msg)
+            yield
+        finally:
+            with self._cond:
+                self._reserved -= num_bytes
+                self._cond.notify_all()
+
+
+# The buffer pool shared by the streaming copies of all threads
+_buffer_pool = None
+_buffer_pool_lock = threading.Lock()
+
+
+def _get_buffer_pool():
+    """Returns the process-wide `_BufferPool` of the ``stor:transfer`` ``max_memory``.
+
+    The pool is created when it is first needed, and replaced if ``max_memory``
+    changes. Copies that are running keep the pool they started with.
+    """
+    global _buffer_pool
+    max_bytes = utils.str_to_bytes(stor.settings.get_section('stor:transfer')['max_memory'])
+    with _buffer_pool_lock:
+        if _buffer_pool is None or _buffer_pool.max_bytes != max_bytes:
+            _buffer_pool = _BufferPool(max_bytes)
+        return _buffer_pool
+
+
+class OBSTransferLogger(utils.BaseProgressLogger):
+    """Logs the progress of copies between OBS paths run by `_run_transfers`"""
+    def __init__(self, total_transfer_objects):
+        super(OBSTransferLogger, self).__init__(progress_logger)
+        self.total_transfer_objects = total_transfer_objects
+        self.transferred_bytes = 0
+
+    def update_progress(self, result):
+        """Tracks the number of bytes transferred"""
+        self.transferred_bytes += result['size'] or 0
+
+    def get_start_message(self):
+        return 'starting copy of %s objects' % self.total_transfer_objects
+
+    def get_finish_message(self):
+        return 'copy complete - %s' % self.get_progress_message()
+
+    def get_progress_message(self):
+        elapsed_time = self.get_elapsed_time()
+        formatted_elapsed_time = self.format_time(elapsed_time)
+        mb = self.transferred_bytes / (1024 * 1024.0)
+        mb_s = mb / elapsed_time.total_seconds() if elapsed_time else 0.0
+        return (
+            '%s/%s\t'
+            '%s\t'
+            '%0.2f MB\t'
+            '%0.2f MB/s'
+        ) % (self.num_results, self.total_transfer_objects, formatted_elapsed_time, mb, mb_s)
+
+
+def _run_transfers(worker, objects, max_workers):
+    """Copies objects on ``max_workers`` threads, logging their progress with
+    `OBSTransferLogger`. Helper for the ``_copy_objects`` and ``_stream_objects``
+    methods of OBS paths.
+
+    Args:
+        worker (function): Copies one object. It is called with the items of an
+            object as keyword arguments and returns a result dict with ``success``
+            and ``size`` keys.
+        objects (List[dict]): The ``source`` and ``dest`` of each object, along with
+            any other arguments of ``worker``.
+        max_workers (int): The number of objects copied at once.
+
+    Returns:
+        dict: The ``completed`` and ``failed`` copies.
+
+    Raises:
+        FailedTransferError: Objects could not be copied.
+    """
+    copied = {'completed': [], 'failed': []}
+    with OBSTransferLogger(len(objects)) as tl:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(worker, **obj): obj
+                for obj in objects
+            }
+            for fut in as_completed(futures.keys()):
+                try:
+                    result = fut.result()
+                except Exception as e:
+                    raise exceptions.FailedTransferError(
+                        'An exception occured while attempting to copy object '
+                        f'{futures[fut]["source"]}: {e}'
+                    )
+
+                if result['success']:
+                    tl.add_result(result)
+                    copied['completed'].append(result)
+                else:
+                    copied['failed'].append(result)
+
+    if copied['failed']:
+        raise exceptions.FailedTransferError(
+            f'An error occurred while copying the following objects: {copied}'
+        )
+    return copied
+
+
+def _iter_shards_parallel(list_shard, shards, parallel, limit=None):
+    """Lists shards of a listing on ``parallel`` threads and yields their results in
+    order. Helper for parallel ``list_iter`` methods.
+
+    ``list_shard(shard)`` lists a bounded number of pages of a shard and returns their
+    results along with a shard of the rest of its listing (or None), which is listed
+    next. At most ``2 * parallel`` of these bounded chunks of results are held in
+    memory at a time.
+
+    Args:
+        list_shard (function): Lists a part of a shard, as described above.
+        shards (Iter[dict]): The shards, in listing order.
+        parallel (int): The number of shards listed at once.
+        limit (int): The maximum number of results yielded.
+
+    Returns:
+        Iter[List]: The results of each listed chunk of a shard.
+    """
+    shards = iter(shards)
+    num_results = 0
+    with ThreadPoolExecutor(max_workers=parallel) as executor:
+        pending = deque(executor.submit(list_shard, shard)
+                        for shard in islice(shards, 2 * parallel))
+        try:
+            while pending:
+                results, rest = pending.popleft().result()
+                if rest is not None:
+                    pending.appendleft(executor.submit(list_shard, rest))
+                else:
+                    for shard in islice(shards, 1):
+                        pending.append(executor.submit(list_shard, shard))
+                if limit:
+                    results = results[:limit - num_results]
+                    num_results += len(results)
+                yield results
+                if limit and num_results >= limit:
+                    return
+        finally:
+            for fut in pending:
+                fut.cancel()
 
 
 class OBSPath(Path):
@@ -73,8 +304,223 @@ class OBSPath(Path):
             raise ValueError('path must have %s (got %r)' % (self.drive, pth))
         return super(OBSPath, self).__init__(pth)
 
-    copy = utils.copy
-    copytree = utils.copytree
+    def copy(self, dest, **kwargs):
+        """Copies an object to a destination file or directory.
+
+        Objects are copied server-side to destinations on the same service (S3 to S3
+        and Swift to Swift), without downloading them. Objects are streamed to other OBS
+        services (e.g. Swift to S3 or S3 to DX) without being written to disk, see
+        `_stream_objects`. Other destinations are handled by `utils.copy`.
+
+        Args:
+            dest (Path|str): The destination file, or a directory with a trailing slash.
+
+        Raises:
+            ValueError: The destination is ambiguous or is not an object path.
+            FailedTransferError: The object could not be copied.
+        """
+        dest = Path(dest)
+        if not utils.is_obs_path(dest):
+            return super(OBSPath, self).copy(dest, **kwargs)
+
+        if utils.is_dx_path(dest):
+            is_dir = utils.has_trailing_slash(dest) or dest.isdir()
+        elif dest.is_ambiguous():
+            raise ValueError('OBS destination must be file with extension or directory with slash')
+        else:
+            is_dir = utils.has_trailing_slash(dest)
+        dest_file = dest / self.name if is_dir else dest
+        if not dest_file.resource:
+            raise ValueError('cannot copy to "%s", it is not an object path' % dest_file)
+
+        objects = [{'source': self, 'dest': dest_file}]
+        if type(dest_file) is type(self):
+            self._copy_objects(objects)
+        else:
+            self._stream_objects(objects)
+
+    def copytree(self, dest, condition=None, use_manifest=False, **kwargs):
+        """Copies a directory to a destination directory.
+
+        Objects are copied server-side to destinations on the same service (S3 to S3
+        and Swift to Swift), without downloading them. Objects are streamed to other OBS
+        services without being written to disk, see `_stream_objects`. Like `upload` and
+        `download`, the contents of the directory are copied under ``dest``. For DX
+        destinations that already exist, the directory is copied under ``dest`` as
+        with `DXPath.copytree`. Other destinations are handled by `utils.copytree`.
+
+        Args:
+            dest (Path|str): The directory to copy to.
+            condition (function(results) -> bool): The method will only return
+                when the paths of the copied objects match the condition.
+            use_manifest (bool): List the directory with its data manifest (see
+                `upload`), and save a manifest of the copied objects in ``dest``
+                before copying them. The copied objects are validated against it.
+
+        Returns:
+            dict: The ``completed`` and ``failed`` copies, with the ``source`` and
+            ``dest`` of each object.
+
+        Raises:
+            FailedTransferError: Objects could not be copied.
+            ConditionNotMetError: The copied objects did not meet the condition.
+            TargetExistsError: The directory already exists under a DX destination.
+        """
+        dest = Path(dest)
+        if not utils.is_obs_path(dest):
+            return super(OBSPath, self).copytree(dest, condition=condition,
+                                                 use_manifest=use_manifest, **kwargs)
+        utils.validate_condition(condition)
+
+        source = utils.with_trailing_slash(self)
+        if utils.is_dx_path(dest) and (utils.has_trailing_slash(dest) or dest.isdir()):
+            dest = dest / utils.remove_trailing_slash(self).name
+            if dest.isdir():
+                raise exceptions.TargetExistsError(
+                    'Destination path ({}) already exists, will not cause '
+                    'duplicate folders to exist. Remove the original first'
+                    .format(dest)
+                )
+        dest = utils.with_trailing_slash(dest)
+        entries = source._list_copy_entries(use_manifest)
+        if use_manifest:
+            # The names in a manifest are relative to the bucket, container or project,
+            # so the copied objects need a manifest of their own names
+            source_prefix = str(source.resource or '')
+            dest_prefix = str(dest.resource or '')
+            object_names = [
+                dest_prefix + name[len(source_prefix):] if name.startswith(source_prefix)
+                else name
+                for name in utils.get_data_manifest_contents(source)
+            ]
+            utils.generate_and_save_data_manifest(dest, object_names)
+            source_manifest = source / utils.DATA_MANIFEST_FILE_NAME
+            entries = [entry for entry in entries if entry.path != source_manifest]
+
+            manifest_cond = partial(utils.validate_manifest_list, object_names)
+            condition = (utils.join_conditions(condition, manifest_cond)
+                         if condition else manifest_cond)
+
+        objects = [
+            {
+                'source': entry.path,
+                'dest': Path(dest + entry.path[len(source):]),
+                'size': entry.size
+            }
+            for entry in entries
+        ]
+        if type(dest) is type(self):
+            copied = self._copy_objects(objects)
+        else:
+            copied = self._stream_objects(objects)
+        utils.check_condition(condition, [r['dest'] for r in copied['completed']])
+        return copied
+
+    def _list_copy_entries(self, use_manifest=False):
+        """Lists the objects of a directory for `copytree`
+
+        Returns:
+            List[OBSListEntry]: The objects, with their sizes if they are listed.
+        """
+        return self.list(use_manifest=use_manifest, with_metadata=True)
+
+    def _copy_objects(self, objects):
+        """Copies objects server-side to paths of the same service
+
+        Args:
+            objects (List[dict]): The ``source`` and ``dest`` path of each object, and
+                its ``size`` if known.
+
+        Returns:
+            dict: The ``completed`` and ``failed`` copies.
+        """
+        raise NotImplementedError
+
+    def _stream_object(self, source, dest, size=None, part_size=None, max_workers=None,
+                       buffer_pool=None):
+        """Streams a single object to a path of another service. Helper for threaded
+        streaming copies.
+
+        Parts of ``part_size`` bytes are read with ranged requests and written to a
+        multipart upload (or static large object) of ``dest`` by ``max_workers``
+        threads. Each part reserves its size in the ``buffer_pool`` while it is held in
+        memory.
+        """
+        result = {
+            'source': source,
+            'dest': dest,
+            'size': size,
+            'success': True
+        }
+        try:
+            if utils.has_trailing_slash(source):
+                # Directory markers
+                result['size'] = 0
+                if utils.is_dx_path(dest):
+                    dest.makedirs_p()
+                else:
+                    dest.write_object(b'')
+                return result
+
+            if size is None:
+                size = result['size'] = source.getsize()
+            multipart_writer = dest._get_multipart_writer()
+            # Parts are made larger if needed to stay within the maximum number of parts
+            part_size = max(part_size, -(-size // multipart_writer.max_parts))
+            if size <= part_size:
+                with buffer_pool.reserve(size):
+                    dest.write_object(source.read_object_range(0, size - 1) if size else b'')
+                return result
+
+            def transfer_part(part_number):
+                start = (part_number - 1) * part_size
+                end = min(start + part_size, size) - 1
+                with buffer_pool.reserve(end - start + 1):
+                    return multipart_writer.upload_part(part_number,
+                                                        source.read_object_range(start, end))
+
+            num_parts = -(-size // part_size)
+            multipart_writer.start()
+            try:
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    parts = list(executor.map(transfer_part, range(1, num_parts + 1)))
+                multipart_writer.complete(parts)
+            except Exception:
+                multipart_writer.abort()
+                raise
+        except exceptions.RemoteError as e:
+            result['success'] = False
+            result['error'] = e
+        return result
+
+    def _stream_objects(self, objects):
+        """Copies objects to paths of another OBS service without writing them to disk.
+
+        Each object is read in parts with ranged requests, and the parts are uploaded
+        to a multipart upload (S3), static large object (Swift) or file (DX) as they
+        arrive. ``object_threads`` objects are copied at a time, each with
+        ``segment_threads`` threads (configured in the ``stor:transfer`` settings).
+        Parts held in memory by the copies of all threads never take more than
+        ``max_memory`` bytes.
+
+        Args:
+            objects (List[dict]): The ``source`` and ``dest`` path of each object, and
+                its ``size`` if known.
+
+        Returns:
+            dict: The ``completed`` and ``failed`` copies.
+
+        Raises:
+            FailedTransferError: Objects could not be copied.
+        """
+        options = stor.settings.get_section('stor:transfer')
+        stream_w_options = partial(
+            self._stream_object,
+            part_size=utils.str_to_bytes(options['segment_size']),
+            max_workers=options['segment_threads'],
+            buffer_pool=_get_buffer_pool())
+
+        return _run_transfers(stream_w_options, objects, options['object_threads'])
 
     def dirname(self):
         """
@@ -136,6 +582,23 @@ class OBSPath(Path):
         """
         raise NotImplementedError
 
+    def read_object_range(self, start, end):
+        """Reads a byte range of an individual object from OBS.
+
+        Args:
+            start (int): The offset of the first byte to read
+            end (int): The offset of the last byte to read (inclusive)
+
+        Returns:
+            bytes: the raw bytes of the range from the object on OBS.
+        """
+        raise NotImplementedError
+
+    def _get_range_reader(self):
+        """Returns a function that reads byte ranges of the object like
+        `read_object_range`. Used by `OBSRangeReader` for all the ranges of one stream."""
+        return self.read_object_range
+
     def write_object(self, content):
         """Writes an individual object.
 
@@ -144,7 +607,17 @@ class OBSPath(Path):
         """
         raise NotImplementedError
 
-    def open(self, mode='r', encoding=None):
+    def _get_multipart_writer(self):
+        """Returns an object that writes the path in segments for `OBSSegmentWriter`
+        and streaming copies.
+
+        The writer has ``segment_size`` and ``max_parts`` attributes and ``start()``,
+        ``upload_part(part_number, data)``, ``complete(parts)`` and ``abort()`` methods.
+        ``complete`` is called with the results of ``upload_part`` in part order.
+        """
+        raise NotImplementedError
+
+    def open(self, mode='r', encoding=None, stream=False):
         """
         Opens a OBSFile that can be read or written to and is uploaded to
         the remote service.
@@ -157,6 +630,9 @@ class OBSPath(Path):
                 ("r" or "rb") and writing ("w", "wb")
             encoding (str): text encoding to use. Defaults to
                 ``locale.getpreferredencoding(False)``
+            stream (bool): In read modes, fetch the object in byte ranges as it is
+                read instead of reading the whole object into memory when opened. In write
+                modes, upload the object in segments as it is written.
 
         Returns:
             OBSFile: The file object for Swift/S3/DX.
@@ -166,7 +642,7 @@ class OBSPath(Path):
             DNAnexusError: A dxpy client error occured.
             RemoteError: A s3 client error occurred.
         """
-        return OBSFile(self, mode=mode, encoding=encoding)
+        return OBSFile(self, mode=mode, encoding=encoding, stream=stream)
 
     def list(self):
         """List contents using the resource of the path as a prefix."""
@@ -250,6 +726,56 @@ class OBSPath(Path):
             if pattern is None or f.fnmatch(pattern):
                 yield f
 
+    def _get_identical_uploads(self, upload_objs, segment_size, max_workers):
+        """Finds the upload objects whose source files are identical to the objects they
+        would replace. Helper for ``skip_identical`` uploads.
+
+        The path is listed with its metadata (a single object is looked up with a HEAD
+        request instead), and the ETags of objects with the same size as their source
+        files are compared with the hashes of the files (see `stor.hash_cache`) by
+        ``max_workers`` threads.
+
+        Returns:
+            set: The identical `OBSUploadObject` objects
+        """
+        from stor import hash_cache
+
+        if len(upload_objs) == 1:
+            entry = self._get_object_entry(upload_objs[0].object_name)
+            listed = {str(upload_objs[0].object_name): entry} if entry else {}
+        else:
+            try:
+                entries = utils.with_trailing_slash(self).list(
+                    ignore_dir_markers=True, with_metadata=True)
+            except exceptions.NotFoundError:
+                return set()
+            listed = {str(entry.path.resource): entry for entry in entries}
+        candidates = []
+        for upload_obj in upload_objs:
+            entry = listed.get(str(upload_obj.object_name))
+            if (entry is not None and isinstance(upload_obj.source, str) and
+                    os.path.isfile(upload_obj.source) and
+                    os.path.getsize(upload_obj.source) == entry.size):
+                candidates.append((upload_obj, entry))
+        if not candidates:
+            return set()
+
+        cache = hash_cache.get_cache()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            matches = executor.map(
+                lambda candidate: hash_cache.etag_matches(candidate[0].source, candidate[1],
+                                                          segment_size, cache=cache),
+                candidates)
+            return {
+                upload_obj for (upload_obj, _), match in zip(candidates, matches) if match
+            }
+
+    def _get_object_entry(self, object_name):
+        """Returns an `OBSListEntry` with the size and ETag of the object named
+        ``object_name`` in the bucket or container of the path, or ``None`` if there
+        is no such object."""
+        raise NotImplementedError
+
     def download_object(self, dest):
         """Download a single path or object to file."""
         raise NotImplementedError
@@ -317,6 +843,206 @@ class OBSPath(Path):
         raise NotImplementedError
 
 
+class OBSRangeReader(io.RawIOBase):
+    """
+    A seekable, raw binary stream that reads an object with ranged requests.
+
+    Each ``readinto`` fetches only the requested bytes with `OBSPath.read_object_range`
+    (through `OBSPath._get_range_reader`),
+    so the stream is wrapped in an ``io.BufferedReader`` to read ahead in ranges of
+    the buffer size. ``readall`` reads the rest of the object in ranges of
+    ``range_size`` bytes. The size of the object is looked up on the first read or
+    seek relative to the end of the object.
+    """
+    def __init__(self, pth, range_size):
+        self._path = pth
+        self._read_range = pth._get_range_reader()
+        self._range_size = range_size
+        self._pos = 0
+        self._size = None
+
+    @property
+    def size(self):
+        """The size of the object in bytes"""
+        if self._size is None:
+            self._size = self._path.getsize()
+        return self._size
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self.size + offset
+        else:
+            raise ValueError('invalid whence (%r, should be 0, 1 or 2)' % whence)
+        if pos < 0:
+            raise ValueError('negative seek position %r' % pos)
+        self._pos = pos
+        return self._pos
+
+    def readinto(self, b):
+        if self._pos >= self.size or not len(b):
+            return 0
+        end = min(self._pos + len(b), self.size) - 1
+        data = self._read_range(self._pos, end)
+        b[:len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+    def readall(self):
+        ranges = []
+        while self._pos < self.size:
+            end = min(self._pos + self._range_size, self.size) - 1
+            data = self._read_range(self._pos, end)
+            if not data:  # pragma: no cover
+                break
+            ranges.append(data)
+            self._pos += len(data)
+        return b''.join(ranges)
+
+
+class OBSSegmentWriter(io.RawIOBase):
+    """
+    A raw binary stream that uploads an object in segments as it is written.
+
+    Written data is buffered until a full segment is available. The multipart upload is
+    then started and segments are uploaded on up to ``max_pending`` background threads
+    while more data is written, so at most ``max_pending + 1`` segments are held in
+    memory. Objects smaller than one segment are written with `OBSPath.write_object`
+    when the stream is closed, and nothing is written if no data was.
+
+    Segments have the ``segment_size`` of the multipart writer, and double in size after
+    every tenth of its ``max_parts`` (up to 5 GB), so that streams of unknown length fit.
+    Only objects of at most a tenth of ``max_parts`` segments have segments of one size,
+    whose ETags can be checked by `hash_cache.etag_matches` when syncing. Larger objects
+    do not match their source and are transferred again.
+    """
+    def __init__(self, pth, max_pending):
+        self._path = pth
+        self._max_pending = max_pending
+        self._multipart_writer = pth._get_multipart_writer()
+        self._buf = io.BytesIO()
+        self._executor = None
+        self._pending = deque()
+        self._parts = []
+        self._num_written = 0
+        self._failed = False
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self._num_written
+
+    def _segment_size(self, part_number):
+        """Returns the size of segment ``part_number``"""
+        segment_size = self._multipart_writer.segment_size
+        growth_interval = max(self._multipart_writer.max_parts // 10, 1)
+        grown_size = segment_size * 2 ** ((part_number - 1) // growth_interval)
+        return max(min(grown_size, _MAX_SEGMENT_SIZE), segment_size)
+
+    def write(self, b):
+        if self.closed:
+            raise ValueError('I/O operation on closed file.')
+        data = memoryview(b).cast('B')
+        num_bytes = len(data)
+        while data:
+            segment_size = self._segment_size(len(self._parts) + len(self._pending) + 1)
+            num_missing = segment_size - self._buf.tell()
+            self._buf.write(data[:num_missing])
+            data = data[num_missing:]
+            if self._buf.tell() < segment_size:
+                break
+            self._upload_segment(self._take_buffer())
+        self._num_written += num_bytes
+        return num_bytes
+
+    def _take_buffer(self):
+        """Returns the buffered data and empties the buffer. ``BytesIO.getvalue()``
+        returns the data without copying it when the buffer is not written again."""
+        data = self._buf.getvalue()
+        self._buf = io.BytesIO()
+        return data
+
+    def _upload_segment(self, segment):
+        """Uploads a segment in the background, waiting for the oldest pending
+        segment if ``max_pending`` segments are already uploading"""
+        try:
+            part_number = len(self._parts) + len(self._pending) + 1
+            if part_number > self._multipart_writer.max_parts:
+                raise ValueError('cannot write more than %s segments to %s, '
+                                 'increase the segment_size setting'
+                                 % (self._multipart_writer.max_parts, self._path))
+            if self._executor is None:
+                self._multipart_writer.start()
+                self._executor = ThreadPoolExecutor(max_workers=self._max_pending)
+            while len(self._pending) >= self._max_pending:
+                self._parts.append(self._pending.popleft().result())
+            self._pending.append(self._executor.submit(self._multipart_writer.upload_part,
+                                                       part_number, segment))
+        except Exception:
+            self._abort()
+            raise
+
+    def _abort(self):
+        self._failed = True
+        for fut in self._pending:
+            fut.cancel()
+        # Segments that are already uploading are waited for, since parts that finish
+        # after the abort would be left behind
+        wait(self._pending)
+        self._pending.clear()
+        try:
+            self._multipart_writer.abort()
+        except Exception:
+            # Do not hide the error that caused the abort
+            logger.exception('failed to abort segmented write of %s', self._path)
+
+    def abort(self):
+        """Aborts the upload and closes the stream without writing the object"""
+        if self.closed:
+            return
+        if not self._failed:
+            self._abort()
+        self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self._failed:
+                pass
+            elif self._executor is None:
+                if self._buf.tell():
+                    self._path.write_object(self._take_buffer())
+            else:
+                if self._buf.tell():
+                    self._upload_segment(self._take_buffer())
+                try:
+                    while self._pending:
+                        self._parts.append(self._pending.popleft().result())
+                    self._multipart_writer.complete(self._parts)
+                except Exception:
+                    self._abort()
+                    raise
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+            self._buf = io.BytesIO()
+            super(OBSSegmentWriter, self).close()
+
+
 class OBSFile(object):
     """
     Provides methods for reading and writing OBS objects returned by
@@ -352,6 +1078,21 @@ class OBSFile(object):
     By instantiating ``stor.obs.OBSFile`` for ``open``, this is no longer needed, while maintaining
     the support that is standard by stor without any real decrease in functionality.
 
+    By default, objects opened for reading are read into memory in full on the first read.
+    Large objects can be opened with ``stream=True`` to instead read them in ranges of
+    ``READ_RANGE_SIZE`` bytes as they are consumed. Streamed files only hold one range in
+    memory, and seeking outside of the current range discards it::
+
+        with Path('s3://bucket/large.bam').open(mode='rb', stream=True) as obj:
+            obj.seek(1024 ** 3)
+            header = obj.read(4096)
+
+    Objects opened for writing with ``stream=True`` are uploaded in segments as they are
+    written, using a multipart upload on S3, a static large object on Swift and file
+    parts on DNAnexus. At most a few segments are held in memory, but streamed files
+    cannot seek. If an exception leaves the ``with`` statement, the upload is aborted
+    instead of writing the partial object. See `OBSSegmentWriter`.
+
     .. note::
         Unlike python file objects, OBSFile does not create an empty sentinel file if you
         call open and then do not close it.
@@ -360,11 +1101,15 @@ class OBSFile(object):
     _READ_MODES = ('r', 'rb')
     _WRITE_MODES = ('w', 'wb')
     _VALID_MODES = _READ_MODES + _WRITE_MODES
+    #: The number of bytes fetched by each ranged request when streaming reads
+    READ_RANGE_SIZE = 8 * 1024 * 1024
+    #: The number of segments uploaded in the background when streaming writes
+    MAX_PENDING_SEGMENTS = 2
     # we have to know whether we've generated a buffer at all
     # to know whether we need to close the underlying buffer
     _buffer = None
 
-    def __init__(self, pth, mode='r', encoding=None):
+    def __init__(self, pth, mode='r', encoding=None, stream=False):
         """Initializes a file object
 
         Args:
@@ -377,12 +1122,16 @@ class OBSFile(object):
                 ``locale.getpreferredencoding(False)`` if not set. We *strongly* encourage you to
                 use binary mode OR explicitly set an encoding when reading/writing text (because
                 writers from different computers may store data on OBS in different ways).
+            stream (bool): In read modes, read the object in ranges as it is consumed
+                instead of reading the whole object on the first read. In write modes,
+                upload the object in segments as it is written instead of on close.
         """
         if mode not in self._VALID_MODES:
             raise ValueError('invalid mode for file: %r' % mode)
         self._path = pth
         self.mode = mode
         self.encoding = encoding or locale.getpreferredencoding(False)
+        self.stream = stream
 
     def __enter__(self):
         if self.closed:
@@ -390,6 +1139,20 @@ class OBSFile(object):
         return self
 
     def __exit__(self, type, value, traceback):
+        if value is not None:
+            # Do not complete the upload of a partially written stream
+            self.abort()
+        self.close()
+
+    def abort(self):
+        """Aborts a streamed write, closing the file without writing the object.
+
+        Files that are not streamed writes are closed normally.
+        """
+        if self.stream and self._buffer and self.mode in self._WRITE_MODES:
+            segment_writer = self._buffer.buffer if self.mode == 'w' else self._buffer
+            segment_writer.abort()
+            self.closed = True
         self.close()
 
     def __iter__(self):
@@ -410,7 +1173,18 @@ class OBSFile(object):
         if self._buffer:
             return self._buffer
 
-        if self.mode == 'r':
+        if self.stream and self.mode in self._READ_MODES:
+            buf = io.BufferedReader(OBSRangeReader(self._path, self.READ_RANGE_SIZE),
+                                    buffer_size=self.READ_RANGE_SIZE)
+            if self.mode == 'r':
+                # Like io.StringIO, only split lines on "\n" and do not translate newlines
+                buf = io.TextIOWrapper(buf, encoding=self.encoding, newline='\n')
+        elif self.stream and self.mode in self._WRITE_MODES:
+            buf = OBSSegmentWriter(self._path, self.MAX_PENDING_SEGMENTS)
+            if self.mode == 'w':
+                buf = io.TextIOWrapper(buf, encoding=self.encoding, newline='\n',
+                                       write_through=True)
+        elif self.mode == 'r':
             buf = self.stream_cls(self._path.read_object().decode(self.encoding))
         elif self.mode == 'rb':
             buf = self.stream_cls(self._path.read_object())
@@ -425,6 +1199,7 @@ class OBSFile(object):
     tell = _delegate_to_buffer('tell', valid_modes=_VALID_MODES)
 
     read = _delegate_to_buffer('read', valid_modes=_READ_MODES)
+    read1 = _delegate_to_buffer('read1', valid_modes=_READ_MODES)
     readlines = _delegate_to_buffer('readlines', valid_modes=_READ_MODES)
     readline = _delegate_to_buffer('readline', valid_modes=_READ_MODES)
 
@@ -444,18 +1219,25 @@ class OBSFile(object):
         if self._buffer:
             if self.mode in self._WRITE_MODES:
                 self.flush()
+                # Closing a streamed buffer writes or completes the object, so the buffer is
+                # closed before waiting for the object to close
+                self._buffer.close()
                 # we want to wait_on_close on DXPath only if no error was thrown while writing the
                 # file
                 if not any(sys.exc_info()):  # pragma: no cover
                     self._wait_on_close()
-            self._buffer.close()
+            else:
+                self._buffer.close()
         self.closed = True
 
     def _wait_on_close(self):
-        if isinstance(self._path, stor.dx.DXPath):
-            wait_on_close = stor.settings.get()['dx']['wait_on_close']
+        if utils.is_dx_path(self._path):
+            wait_on_close = stor.settings.get_section('dx')['wait_on_close']
             if wait_on_close:
-                with stor.dx._wrap_dx_calls():
+                import dxpy
+                from stor.dx import _wrap_dx_calls
+
+                with _wrap_dx_calls():
                     f = dxpy.DXFile(dxid=self._path.canonical_resource,
                                     project=self._path.canonical_project)
                     try:
@@ -472,6 +1254,10 @@ class OBSFile(object):
                             (self._WRITE_MODES,))
         if not self._buffer:
             return
+        if self.stream:
+            # Streamed data is uploaded as it is written and completed on close
+            self._buffer.flush()
+            return
         # NOTE: this helps ensure that only non-zero objects are uploaded with open.
         # Otherwise you have weird behavior where calling open().tell() will cause an empty object
         # to be created on OBS on exit. Instead, philosophy is "if buffer has data, we'll upload it
@@ -491,4 +1277,4 @@ class OBSFile(object):
         return self.mode in self._WRITE_MODES
 
     def seekable(self):
-        return True
+        return not (self.stream and self.mode in self._WRITE_MODES)
@@ -1,29 +1,50 @@
 """
 An experimental implementation of S3 in stor
 """
+from collections import deque
 from functools import partial
+from itertools import islice
 import logging
 from concurrent.futures import as_completed, ThreadPoolExecutor
 import os
-import tempfile
 import threading
 
 import boto3
 from boto3 import exceptions as boto3_exceptions
 from boto3.s3.transfer import S3Transfer
 from boto3.s3.transfer import TransferConfig
+from botocore import config as botocore_config
 from botocore import exceptions as botocore_exceptions
 
 from stor import exceptions
 from stor import settings
 from stor import utils
 from stor.base import Path
+from stor.obs import OBSListEntry
 from stor.obs import OBSPath
 from stor.obs import OBSUploadObject
+from stor.obs import _iter_shards_parallel
+from stor.obs import _run_transfers
 
-# Thread-local variable used to cache the client
+# Thread-local variable used to cache transfer objects
 _thread_local = threading.local()
 
+# The maximum number of keys that can be deleted with one delete_objects call
+_DELETE_BATCH_SIZE = 1000
+
+# The number of directory levels that are descended with delimiter listings when
+# splitting a prefix into shards for a parallel listing
+_LIST_SHARD_MAX_DEPTH = 3
+# The maximum number of delimiter listing pages read while splitting a prefix into shards
+_LIST_SHARD_MAX_DISCOVERY_PAGES = 20
+# The number of pages of a shard that are listed (and held in memory) at once
+_LIST_SHARD_MAX_PAGES = 10
+
+# Objects larger than this cannot be copied with copy_object and are copied in parts
+_MAX_COPY_OBJECT_SIZE = 5 * 1024 ** 3
+# The maximum number of parts of a multipart upload
+_MAX_MULTIPART_PARTS = 10000
+
 logger = logging.getLogger(__name__)
 progress_logger = logging.getLogger('%s.progress' % __name__)
 
@@ -63,33 +84,67 @@ def _parse_s3_error(exc, **kwargs):
         return exceptions.RemoteError(msg, exc)
 
 
+class _S3ClientManager(object):
+    """Creates and shares one boto3 client across all threads of a process.
+
+    boto3 sessions are not thread-safe, but the clients they create are. A single
+    session is created and its client's connection pool is sized for the configured
+    ``object_threads * segment_threads`` transfer concurrency. The client is only
+    rebuilt when the ``[s3]`` settings or the pool size change, or after a fork.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._client = None
+        self._client_key = None
+
+    def get_client(self):
+        """Returns the shared client, creating it if the settings have changed."""
+        # only pass through keyword arguments that are set to avoid
+        # overriding Boto3's default lookup behavior
+        session_kwargs = {k: v for k, v in settings.get_section('s3').items() if v}
+        max_pool_connections = max(
+            (settings.get_section(section).get('object_threads') or 1) *
+            (settings.get_section(section).get('segment_threads') or 1)
+            for section in ('s3:upload', 's3:download')
+        )
+        client_key = (os.getpid(), sorted(session_kwargs.items()), max_pool_connections)
+
+        with self._lock:
+            if self._client is None or self._client_key != client_key:
+                session = boto3.session.Session(**session_kwargs)
+                self._client = session.client(
+                    's3',
+                    config=botocore_config.Config(max_pool_connections=max_pool_connections))
+                self._client_key = client_key
+            return self._client
+
+    def clear(self):
+        """Discards the shared client so that the next call creates a new one."""
+        with self._lock:
+            self._client = None
+            self._client_key = None
+
+
+_s3_client_manager = _S3ClientManager()
+
+
 def _get_s3_client():
     """Returns the boto3 client and initializes one if it doesn't already exist.
 
-    We use a different boto3 client for each thread/process because boto3 clients
-    are not thread-safe.
+    The client is shared by every thread of the process. See `_S3ClientManager`.
 
     Returns:
         boto3.Client: An instance of the S3 client.
     """
-    if not hasattr(_thread_local, 's3_client'):
-        kwargs = {}
-        for k, v in settings.get()['s3'].items():
-            # only pass through keyword arguments that are set to avoid
-            # overriding Boto3's default lookup behavior
-            if v:
-                kwargs[k] = v
-        session = boto3.session.Session(**kwargs)
-        _thread_local.s3_client = session.client('s3')
-    return _thread_local.s3_client
+    return _s3_client_manager.get_client()
 
 
 def _get_s3_transfer(config=None):
     """Returns a boto3 S3Transfer object and initializes one if it doesn't
-    already exist or if config options are different.
+    already exist or if config options (or the shared client) are different.
 
-    Like the boto3 client, we use a different transfer for each thread/process
-    for thread-safety.
+    Transfers wrap the shared boto3 client, but we still use a different transfer
+    for each thread for thread-safety.
 
     Args:
         config (dict): A dict of config options
@@ -97,13 +152,16 @@ def _get_s3_transfer(config=None):
     Returns:
         boto3.s3.S3Transfer: An instance of an S3Transfer object.
     """
+    client = _get_s3_client()
     if (not hasattr(_thread_local, 's3_transfer') or
-            getattr(_thread_local, 's3_transfer_config', None) != config):
+            getattr(_thread_local, 's3_transfer_config', None) != config or
+            getattr(_thread_local, 's3_transfer_client', None) is not client):
         transfer_config = None
         if config:
             transfer_config = TransferConfig(**config)
-        _thread_local.s3_transfer = S3Transfer(_get_s3_client(), config=transfer_config)
+        _thread_local.s3_transfer = S3Transfer(client, config=transfer_config)
         _thread_local.s3_transfer_config = config
+        _thread_local.s3_transfer_client = client
     return _thread_local.s3_transfer
 
 
@@ -137,6 +195,37 @@ class S3DownloadLogger(utils.BaseProgressLogger):
         ) % (self.num_results, self.total_download_objects, formatted_elapsed_time, mb, mb_s)
 
 
+class S3DeleteLogger(utils.BaseProgressLogger):
+    def __init__(self, delete_path):
+        super(S3DeleteLogger, self).__init__(progress_logger)
+        self.delete_path = delete_path
+        self.deleted_objects = 0
+        self.failed_objects = 0
+
+    def update_progress(self, result):
+        """Tracks the keys deleted (or failed) by each delete_objects response"""
+        self.deleted_objects += len(result.get('Deleted', []))
+        self.failed_objects += len(result.get('Errors', []))
+
+    def get_start_message(self):
+        return 'starting delete of %s' % self.delete_path
+
+    def get_finish_message(self):
+        return 'delete complete - %s' % self.get_progress_message()
+
+    def get_progress_message(self):
+        elapsed_time = self.get_elapsed_time()
+        formatted_elapsed_time = self.format_time(elapsed_time)
+        objects_s = (self.deleted_objects / elapsed_time.total_seconds()
+                     if elapsed_time else 0.0)
+        return (
+            '%s deleted\t'
+            '%s failed\t'
+            '%s\t'
+            '%0.2f objects/s'
+        ) % (self.deleted_objects, self.failed_objects, formatted_elapsed_time, objects_s)
+
+
 class S3UploadLogger(utils.BaseProgressLogger):
     def __init__(self, total_upload_objects):
         super(S3UploadLogger, self).__init__(progress_logger)
@@ -167,6 +256,51 @@ class S3UploadLogger(utils.BaseProgressLogger):
         ) % (self.num_results, self.total_upload_objects, formatted_elapsed_time, mb, mb_s)
 
 
+class _S3MultipartWriter(object):
+    """Writes an object with a multipart upload.
+
+    Used by `OBSSegmentWriter`, `S3Path.write_object` and copies. ``headers`` are passed
+    to ``create_multipart_upload``.
+    """
+    max_parts = _MAX_MULTIPART_PARTS
+
+    def __init__(self, pth, headers=None):
+        self._path = pth
+        self.segment_size = utils.str_to_bytes(
+            settings.get_section('s3:upload')['segment_size'])
+        self._headers = headers or {}
+        self._upload_id = None
+
+    def _call(self, method_name, **kwargs):
+        return self._path._s3_client_call(method_name,
+                                          Bucket=self._path.bucket,
+                                          Key=self._path.resource,
+                                          **kwargs)
+
+    def start(self):
+        self._upload_id = self._call('create_multipart_upload', **self._headers)['UploadId']
+
+    def upload_part(self, part_number, data):
+        response = self._call('upload_part', UploadId=self._upload_id,
+                              PartNumber=part_number, Body=data)
+        return {'ETag': response['ETag'], 'PartNumber': part_number}
+
+    def upload_part_copy(self, part_number, copy_source, start, end):
+        """Copies the bytes ``start`` to ``end`` (inclusive) of an object as a part"""
+        response = self._call('upload_part_copy', UploadId=self._upload_id,
+                              PartNumber=part_number, CopySource=copy_source,
+                              CopySourceRange='bytes=%d-%d' % (start, end))
+        return {'ETag': response['CopyPartResult']['ETag'], 'PartNumber': part_number}
+
+    def complete(self, parts):
+        self._call('complete_multipart_upload', UploadId=self._upload_id,
+                   MultipartUpload={'Parts': parts})
+
+    def abort(self):
+        if self._upload_id:
+            self._call('abort_multipart_upload', UploadId=self._upload_id)
+
+
 class S3Path(OBSPath):
     """
     Provides the ability to manipulate and access S3 resources
@@ -228,6 +362,9 @@ class S3Path(OBSPath):
              limit=None,
              condition=None,
              use_manifest=False,
+             parallel=None,
+             split_points=None,
+             with_metadata=False,
              # hidden args
              list_as_dir=False,
              ignore_dir_markers=False,
@@ -235,6 +372,10 @@ class S3Path(OBSPath):
         """
         List contents using the resource of the path as a prefix.
 
+        .. warning::
+            Prefer `list_iter()` to this method when listing large prefixes. This method
+            holds every result in memory and only returns after the last page is listed.
+
         Args:
             starts_with (str): Allows for an additional search path to be
                 appended to the current swift path. The current path will be
@@ -244,16 +385,20 @@ class S3Path(OBSPath):
                 when the results matches the condition.
             use_manifest (bool): Perform the list and use the data manfest file to validate
                 the list.
+            parallel (int): The number of shards to list concurrently. See `list_iter()`.
+            split_points (List[str]): Keys, relative to the listed path, at which the
+                listing is split into shards when ``parallel`` is set.
+            with_metadata (bool): Return an `OBSListEntry` with the size, ETag, last
+                modified time and storage class of each object instead of its path.
+                See `list_iter()`.
 
         Returns:
-            List[S3Path]: Every path in the listing
+            List[S3Path|OBSListEntry]: Every path (or entry) in the listing
 
         Raises:
             RemoteError: An s3 client error occurred.
             ConditionNotMetError: Results were returned, but they did not meet the condition.
         """
-        bucket = self.bucket
-        prefix = self.resource
         utils.validate_condition(condition)
 
         if use_manifest:
@@ -262,6 +407,73 @@ class S3Path(OBSPath):
             condition = (utils.join_conditions(condition, manifest_cond)
                          if condition else manifest_cond)
 
+        list_results = list(self.list_iter(starts_with=starts_with,
+                                           limit=limit,
+                                           parallel=parallel,
+                                           split_points=split_points,
+                                           with_metadata=with_metadata,
+                                           list_as_dir=list_as_dir,
+                                           ignore_dir_markers=ignore_dir_markers))
+        utils.check_condition(condition, [r.path for r in list_results]
+                              if with_metadata else list_results)
+        return list_results
+
+    def list_iter(self,
+                  starts_with=None,
+                  limit=None,
+                  condition=None,
+                  parallel=None,
+                  split_points=None,
+                  with_metadata=False,
+                  # hidden args
+                  list_as_dir=False,
+                  ignore_dir_markers=False):
+        """
+        Iterate over contents using the resource of the path as a prefix.
+
+        Paths are yielded as each ``list_objects_v2`` page arrives, so memory use does not
+        grow with the size of the listing and iteration can be stopped at any time.
+
+        When ``parallel`` is greater than one, the key space is split into shards that are
+        listed concurrently and yielded in key order. Shards are found by descending
+        into the common prefixes of delimiter listings until there are at least
+        ``parallel`` of them, or are the key ranges between the given ``split_points``.
+        Shards are listed up to ``_LIST_SHARD_MAX_PAGES`` pages at a time, and up to
+        ``2 * parallel`` of these are held in memory at once.
+
+        With ``with_metadata``, an `OBSListEntry` is yielded for each path with the
+        metadata that ``list_objects_v2`` returns along with it, so no ``stat()`` is
+        needed to find the size or ETag of listed objects.
+
+        Args:
+            starts_with (str): Allows for an additional search path to be
+                appended to the current path. The current path will be
+                treated as a directory.
+            limit (int): Limit the amount of results returned.
+            condition (function(results) -> bool|IncrementalCondition): Checked against
+                the results once the final page has been listed. Function conditions need
+                every result, which are retained for the check. A
+                `utils.IncrementalCondition` is instead updated as each page arrives.
+            parallel (int): The number of shards to list concurrently. Ignored when listing
+                as a directory.
+            split_points (List[str]): Keys, relative to the listed path, at which the
+                listing is split into shards when ``parallel`` is set. Each shard ends with
+                (and includes) its split point.
+            with_metadata (bool): Yield an `OBSListEntry` with the ``size``, ``etag``,
+                ``last_modified`` and ``storage_class`` of each object instead of its path.
+                Conditions are still checked against the listed paths.
+
+        Returns:
+            Iter[S3Path|OBSListEntry]: Every path (or entry) in the listing
+
+        Raises:
+            RemoteError: An s3 client error occurred.
+            ConditionNotMetError: Results were returned, but they did not meet the condition.
+        """
+        bucket = self.bucket
+        prefix = self.resource
+        utils.validate_condition(condition)
+
         if starts_with:
             prefix = prefix / starts_with if prefix else starts_with
         else:
@@ -281,34 +493,195 @@ class S3Path(OBSPath):
             list_kwargs['Prefix'] = utils.with_trailing_slash(prefix) if prefix else ''
             list_kwargs['Delimiter'] = '/'
 
-        path_prefix = S3Path('%s%s' % (self.drive, bucket))
+        if parallel and parallel > 1 and not list_as_dir:
+            shards = self._get_list_shards(list_kwargs, parallel, split_points=split_points)
+            list_shard = partial(self._list_shard, ignore_dir_markers=ignore_dir_markers,
+                                 with_metadata=with_metadata)
+            pages = _iter_shards_parallel(list_shard, shards, parallel, limit=limit)
+        else:
+            pages = self._iter_list_pages(list_kwargs,
+                                          list_as_dir=list_as_dir,
+                                          ignore_dir_markers=ignore_dir_markers,
+                                          with_metadata=with_metadata)
+
+        yield from utils.iter_checked_pages(pages, condition, with_metadata=with_metadata)
+
+    def _get_list_results(self, contents, common_prefixes=(), ignore_dir_markers=False,
+                          with_metadata=False):
+        """
+        Returns the paths (or `OBSListEntry` objects) of the ``Contents`` and
+        ``CommonPrefixes`` of a ``list_objects_v2`` page.
+        """
+        path_prefix = self.drive + self.bucket + '/'
+        if ignore_dir_markers:
+            contents = [c for c in contents if not utils.has_trailing_slash(c['Key'])]
+        if not with_metadata:
+            results = [S3Path._from_validated(path_prefix + c['Key']) for c in contents]
+            results.extend(S3Path._from_validated(path_prefix + p['Prefix'])
+                           for p in common_prefixes)
+            return results
+
+        results = [
+            OBSListEntry(S3Path._from_validated(path_prefix + c['Key']),
+                         size=c.get('Size'),
+                         etag=c['ETag'].strip('"') if c.get('ETag') else None,
+                         last_modified=c.get('LastModified'),
+                         storage_class=c.get('StorageClass'))
+            for c in contents
+        ]
+        results.extend(OBSListEntry(S3Path._from_validated(path_prefix + p['Prefix']))
+                       for p in common_prefixes)
+        return results
+
+    def _iter_list_pages(self, list_kwargs, list_as_dir=False, ignore_dir_markers=False,
+                         with_metadata=False, end_key=None):
+        """
+        Yields a list of paths for each ``list_objects_v2`` page, stopping once
+        a key is past ``end_key`` (if provided).
+        """
+        for page in self._iter_s3_pages('list_objects_v2', **list_kwargs):
+            page_results, past_end = self._get_page_results(page, list_as_dir=list_as_dir,
+                                                            ignore_dir_markers=ignore_dir_markers,
+                                                            with_metadata=with_metadata,
+                                                            end_key=end_key)
+            yield page_results
+            if past_end:
+                return
+
+    def _get_page_results(self, page, list_as_dir=False, ignore_dir_markers=False,
+                          with_metadata=False, end_key=None):
+        """
+        Returns the paths (or `OBSListEntry` objects) of a ``list_objects_v2`` page up
+        to ``end_key`` (if provided), and whether the page goes past it.
+        """
+        contents = page.get('Contents', [])
+        past_end = bool(end_key is not None and contents and contents[-1]['Key'] > end_key)
+        if past_end:
+            contents = [c for c in contents if c['Key'] <= end_key]
+        page_results = self._get_list_results(
+            contents,
+            page.get('CommonPrefixes', []) if list_as_dir else (),
+            ignore_dir_markers=ignore_dir_markers,
+            with_metadata=with_metadata)
+        return page_results, past_end
+
+    def _get_list_shards(self, list_kwargs, parallel, split_points=None):
+        """
+        Splits the keys listed by ``list_kwargs`` into shards, in key order, for a
+        parallel listing.
+
+        Returns:
+            List[dict]: Shards with the ``list_kwargs`` (and optional inclusive ``end_key``)
+                used to list them. Objects found while discovering shards are returned as
+                shards with their ``contents`` instead.
+        """
+        prefix = str(list_kwargs['Prefix'])
+        if split_points:
+            split_prefix = utils.with_trailing_slash(prefix) if prefix else ''
+            bounds = [None] + sorted(split_prefix + point for point in split_points) + [None]
+            return [
+                {
+                    'list_kwargs': dict(list_kwargs, **({'StartAfter': start} if start else {})),
+                    'end_key': end
+                }
+                for start, end in zip(bounds[:-1], bounds[1:])
+            ]
+
+        contents, prefixes = [], [prefix]
+        num_pages = 0
+        for _ in range(_LIST_SHARD_MAX_DEPTH):
+            if len(prefixes) >= parallel or num_pages >= _LIST_SHARD_MAX_DISCOVERY_PAGES:
+                break
+            sub_prefixes = []
+            for sub_prefix in prefixes:
+                pages = list(islice(self._iter_s3_pages('list_objects_v2', Bucket=self.bucket,
+                                                        Prefix=sub_prefix, Delimiter='/'),
+                                    _LIST_SHARD_MAX_DISCOVERY_PAGES - num_pages))
+                num_pages += len(pages)
+                if not pages or pages[-1].get('IsTruncated'):
+                    # Prefixes that take too many pages to split are listed as one shard
+                    sub_prefixes.append(sub_prefix)
+                    continue
+                for page in pages:
+                    contents.extend(page.get('Contents', []))
+                    sub_prefixes.extend(result['Prefix']
+                                        for result in page.get('CommonPrefixes', []))
+            prefixes = sub_prefixes
+
+        # Every key under a common prefix sorts next to the prefix itself, so ordering
+        # keys and prefixes together orders the shards
+        shards = []
+        for name, content in sorted([(c['Key'], c) for c in contents] +
+                                    [(sub_prefix, None) for sub_prefix in prefixes],
+                                    key=lambda item: item[0]):
+            if content is None:
+                shards.append({'list_kwargs': dict(list_kwargs, Prefix=name)})
+            elif shards and 'contents' in shards[-1]:
+                shards[-1]['contents'].append(content)
+            else:
+                shards.append({'contents': [content]})
+        return shards
+
+    def _list_shard(self, shard, ignore_dir_markers=False, with_metadata=False):
+        """Lists up to ``_LIST_SHARD_MAX_PAGES`` pages of a shard. Helper for threaded
+        listing.
 
-        results = self._get_s3_iterator('list_objects_v2', **list_kwargs)
-        list_results = []
+        Returns:
+            tuple: The paths (or entries) listed, and a shard with the rest of the
+            listing (or None). See `obs._iter_shards_parallel`.
+        """
+        if 'contents' in shard:
+            return self._get_list_results(shard['contents'],
+                                          ignore_dir_markers=ignore_dir_markers,
+                                          with_metadata=with_metadata), None
+        results = []
+        list_kwargs = shard['list_kwargs']
+        pages = self._iter_s3_pages('list_objects_v2', **list_kwargs)
+        for num_pages, page in enumerate(pages, 1):
+            page_results, past_end = self._get_page_results(page,
+                                                            ignore_dir_markers=ignore_dir_markers,
+                                                            with_metadata=with_metadata,
+                                                            end_key=shard.get('end_key'))
+            results.extend(page_results)
+            if past_end:
+                break
+            if num_pages == _LIST_SHARD_MAX_PAGES and page.get('IsTruncated'):
+                rest = dict(list_kwargs, StartAfter=page['Contents'][-1]['Key'])
+                return results, dict(shard, list_kwargs=rest)
+        return results, None
+
+    def _iter_s3_pages(self, method_name, **kwargs):
+        """
+        Yields pages from the ``method_name`` paginator, converting client errors
+        raised while fetching a page into stor exceptions.
+        """
         try:
-            for page in results:
-                if 'Contents' in page:
-                    list_results.extend([
-                        path_prefix / result['Key']
-                        for result in page['Contents']
-                        if not ignore_dir_markers or
-                        (ignore_dir_markers and not utils.has_trailing_slash(result['Key']))
-                    ])
-                if list_as_dir and 'CommonPrefixes' in page:
-                    list_results.extend([
-                        path_prefix / result['Prefix']
-                        for result in page['CommonPrefixes']
-                    ])
+            for page in self._get_s3_iterator(method_name, **kwargs):
+                yield page
         except botocore_exceptions.ClientError as e:
             raise _parse_s3_error(e) from e
 
-        utils.check_condition(condition, list_results)
-        return list_results
-
     def listdir(self, **kwargs):
         """List the path as a dir, returning top-level directories and files."""
         return self.list(list_as_dir=True, **kwargs)
 
+    def walkfiles(self, pattern=None, **kwargs):
+        """Iterates over files recursively, yielding each page of results as it is listed.
+
+        Args:
+            pattern (str, optional): Limits the results to files
+                with names that match the pattern.  For example,
+                ``mydir.walkfiles('*.tmp')`` yields only files with the ``.tmp``
+                extension.
+            **kwargs: Keyword arguments passed to `S3Path.list_iter`
+
+        Returns:
+            Iter[S3Path]: Files recursively under the path
+        """
+        for f in self.list_iter(ignore_dir_markers=True, **kwargs):
+            if pattern is None or f.fnmatch(pattern):
+                yield f
+
     def exists(self):
         """
         Checks existence of the path.
@@ -396,27 +769,79 @@ class S3Path(OBSPath):
         Removes a resource and all of its contents. The path should point to a directory.
 
         If the specified resource is an object, nothing will happen.
+
+        Keys are deleted as they are listed. Batches of up to 1000 keys are passed to
+        ``delete_objects`` by ``object_threads`` threads (configured in the ``s3:delete``
+        settings), so the listing is never held in memory. Keys that fail to delete do not
+        stop the removal of the remaining keys.
+
+        Raises:
+            RemoteError: Any keys failed to delete. The ``caught_exception`` of the error
+                holds the ``Errors`` of every failed key.
         """
         # Ensure there is a trailing slash (path is a dir)
         delete_path = utils.with_trailing_slash(self)
-        delete_list = delete_path.list()
-
-        while len(delete_list) > 0:
-            # boto3 only allows deletion of up to 1000 objects at a time
-            len_range = min(len(delete_list), 1000)
-            objects = {
-                'Objects': [
-                    {'Key': delete_list.pop(0).resource}
-                    for i in range(len_range)
-                ]
-            }
-            response = self._s3_client_call('delete_objects', Bucket=self.bucket, Delete=objects)
-
-            if 'Errors' in response:
-                raise exceptions.RemoteError('an error occurred while using rmtree: %s, Key: %s'
-                                             % (response['Errors'][0].get('Message'),
-                                                response['Errors'][0].get('Key')),
-                                             response['Errors'])
+        options = settings.get_section('s3:delete')
+        max_workers = options.get('object_threads')
+        errors = []
+
+        with S3DeleteLogger(delete_path) as dl:
+            def collect(fut):
+                response = fut.result()
+                errors.extend(response.get('Errors', []))
+                dl.add_result(response)
+
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                pending = deque()
+                try:
+                    batch = []
+                    for path in delete_path.list_iter():
+                        batch.append({'Key': path.resource})
+                        # boto3 only allows deletion of up to 1000 objects at a time
+                        if len(batch) == _DELETE_BATCH_SIZE:
+                            pending.append(executor.submit(self._delete_batch, batch))
+                            batch = []
+                        # Bound the number of batches waiting to be deleted
+                        while len(pending) > 2 * max_workers:
+                            collect(pending.popleft())
+                    if batch:
+                        pending.append(executor.submit(self._delete_batch, batch))
+                    while pending:
+                        collect(pending.popleft())
+                finally:
+                    for fut in pending:
+                        fut.cancel()
+
+        if errors:
+            raise exceptions.RemoteError('%s error(s) occurred while using rmtree: %s, Key: %s'
+                                         % (len(errors),
+                                            errors[0].get('Message'),
+                                            errors[0].get('Key')),
+                                         errors)
+
+    def _delete_batch(self, objects):
+        """Deletes a batch of keys with delete_objects. Helper for threaded rmtree."""
+        return self._s3_client_call('delete_objects', Bucket=self.bucket,
+                                    Delete={'Objects': objects})
+
+    def _remove_objects(self, objects):
+        """Removes objects of this bucket in batches, like `rmtree`. Helper for sync."""
+        keys = [{'Key': S3Path(obj).resource} for obj in objects]
+        batches = [
+            keys[i:i + _DELETE_BATCH_SIZE] for i in range(0, len(keys), _DELETE_BATCH_SIZE)
+        ]
+        errors = []
+        max_workers = settings.get_section('s3:delete').get('object_threads')
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for response in executor.map(self._delete_batch, batches):
+                errors.extend(response.get('Errors', []))
+
+        if errors:
+            raise exceptions.RemoteError('%s error(s) occurred while removing objects: %s, Key: %s'
+                                         % (len(errors),
+                                            errors[0].get('Message'),
+                                            errors[0].get('Key')),
+                                         errors)
 
     def stat(self):
         """
@@ -471,6 +896,20 @@ class S3Path(OBSPath):
         """Get content type for path (using ContentType field from Boto) or empty string."""
         return self.stat().get('ContentType', '')
 
+    def _get_object_entry(self, object_name):
+        """Returns an `OBSListEntry` for an object of the bucket with a HEAD request, or
+        ``None`` if it does not exist. Helper for ``skip_identical`` uploads."""
+        try:
+            response = self._s3_client_call('head_object', Bucket=self.bucket,
+                                            Key=str(object_name))
+        except exceptions.NotFoundError:
+            return None
+        return OBSListEntry(S3Path(self.drive + self.bucket) / object_name,
+                            size=response['ContentLength'],
+                            etag=response['ETag'].strip('"'),
+                            last_modified=response.get('LastModified'),
+                            storage_class=response.get('StorageClass'))
+
     def read_object(self):
         """Read an individual object from OBS.
 
@@ -480,22 +919,69 @@ class S3Path(OBSPath):
         body = self._s3_client_call('get_object', Bucket=self.bucket, Key=self.resource)['Body']
         return body.read()
 
-    def write_object(self, content: bytes) -> None:
+    def read_object_range(self, start, end):
+        """Reads a byte range of an individual object with an HTTP Range request.
+
+        Args:
+            start (int): The offset of the first byte to read
+            end (int): The offset of the last byte to read (inclusive)
+
+        Returns:
+            bytes: the raw bytes of the range from the object on OBS.
+        """
+        body = self._s3_client_call('get_object',
+                                    Bucket=self.bucket,
+                                    Key=self.resource,
+                                    Range='bytes=%d-%d' % (start, end))['Body']
+        return body.read()
+
+    def write_object(self, content: bytes, headers=None) -> None:
         """Writes an individual object.
 
-        Note that this method writes the provided content to a temporary
-        file before uploading.
+        The content is uploaded from memory with ``put_object``. Content larger than the
+        ``segment_size`` of the ``s3:upload`` settings is uploaded with a multipart upload
+        of ``segment_threads`` concurrent parts.
 
         Args:
             content: raw bytes to write to OBS
+            headers (dict): Extra arguments for ``put_object`` (or
+                ``create_multipart_upload``), such as ``ContentType``.
+
+        Raises:
+            RemoteError: An s3 client error occurred.
         """
         if not isinstance(content, bytes):  # pragma: no cover
             raise TypeError('write_object() expects bytes, not text data')
-        mode = 'wb' if isinstance(content, bytes) else 'w'
-        with tempfile.NamedTemporaryFile(mode) as fp:
-            fp.write(content)
-            fp.flush()
-            self.upload([OBSUploadObject(fp.name, self.resource)])
+        headers = headers or {}
+        multipart_writer = _S3MultipartWriter(self, headers=headers)
+        segment_size = multipart_writer.segment_size
+        if len(content) <= segment_size:
+            self._s3_client_call('put_object',
+                                 Bucket=self.bucket,
+                                 Key=self.resource,
+                                 Body=content,
+                                 **headers)
+            return
+
+        def upload_part(part_number):
+            # Slice in the worker so that only the parts being uploaded are copied
+            start = (part_number - 1) * segment_size
+            return multipart_writer.upload_part(part_number,
+                                                content[start:start + segment_size])
+
+        num_parts = (len(content) + segment_size - 1) // segment_size
+        options = settings.get_section('s3:upload')
+        multipart_writer.start()
+        try:
+            with ThreadPoolExecutor(max_workers=options.get('segment_threads')) as executor:
+                parts = list(executor.map(upload_part, range(1, num_parts + 1)))
+            multipart_writer.complete(parts)
+        except Exception:
+            multipart_writer.abort()
+            raise
+
+    def _get_multipart_writer(self):
+        return _S3MultipartWriter(self)
 
     def download_object(self, dest, config=None, **kwargs):
         """
@@ -568,8 +1054,47 @@ class S3Path(OBSPath):
             {'source': file, 'dest': dest}
             for file in source.list()
         ]
+        downloaded = self._download_files(files_to_download)
 
-        options = settings.get()['s3:download']
+        utils.check_condition(condition, [r['source'] for r in downloaded['completed']])
+        return downloaded
+
+    def download_objects(self, dest, objects):
+        """See baseclass for complete method documentation
+
+        Objects are downloaded by ``object_threads`` threads (configured in the
+        ``s3:download`` settings).
+
+        Args:
+            dest (str): The destination folder to download to. The directory
+                will be created if it doesnt exist.
+            objects (List[str|PosixPath|S3Path]): The list of objects to
+                download. The objects can be paths relative to the download path
+                or absolute s3 paths. Any absolute s3 path must be
+                children of the download path
+
+        Returns:
+            dict: A mapping of all requested ``objs`` to their location on
+                disk
+        """
+        source = utils.with_trailing_slash(self)
+        objs_to_download = {
+            obj: S3Path(obj) if utils.is_s3_path(obj) else source / obj
+            for obj in objects
+        }
+        for obj, s3_obj in objs_to_download.items():
+            if not s3_obj.startswith(source):
+                raise ValueError('"%s" must be child of download path "%s"' % (obj, self))
+
+        downloaded = self._download_files([
+            {'source': s3_obj, 'dest': dest} for s3_obj in objs_to_download.values()
+        ])
+        results = {r['source']: r['dest'] for r in downloaded['completed']}
+        return {obj: results[objs_to_download[obj]] for obj in objects}
+
+    def _download_files(self, files_to_download):
+        """Downloads objects under this path with a thread pool. Helper for download."""
+        options = settings.get_section('s3:download')
         segment_size = utils.str_to_bytes(options.get('segment_size'))
         transfer_config = {
             'multipart_threshold': segment_size,
@@ -604,8 +1129,6 @@ class S3Path(OBSPath):
             raise exceptions.FailedDownloadError(
                 f"An error occurred while downloading the following files: {downloaded}"
             )
-
-        utils.check_condition(condition, [r['source'] for r in downloaded['completed']])
         return downloaded
 
     def _upload_object(self, upload_obj, config=None):
@@ -675,6 +1198,10 @@ class S3Path(OBSPath):
 
         - This method uploads to paths relative to the current
           directory.
+
+        - With the ``skip_identical`` setting of ``s3:upload``, files that are identical
+          to the objects they would replace are not uploaded. Their results are
+          ``completed`` with ``skipped`` set.
         """
         if use_manifest and not (len(source) == 1 and os.path.isdir(source[0])):
             raise ValueError('can only upload one directory with use_manifest=True')
@@ -714,7 +1241,7 @@ class S3Path(OBSPath):
             condition = (utils.join_conditions(condition, manifest_cond)
                          if condition else manifest_cond)
 
-        options = settings.get()['s3:upload']
+        options = settings.get_section('s3:upload')
         segment_size = utils.str_to_bytes(options.get('segment_size'))
         transfer_config = {
             'multipart_threshold': segment_size,
@@ -724,6 +1251,20 @@ class S3Path(OBSPath):
         upload_w_config = partial(self._upload_object, config=transfer_config)
 
         uploaded = {'completed': [], 'failed': []}
+        if options.get('skip_identical'):
+            identical = self._get_identical_uploads(files_to_upload, segment_size,
+                                                    options.get('object_threads'))
+            uploaded['completed'].extend(
+                {
+                    'source': obj.source,
+                    'dest': S3Path(self.drive + self.bucket) / obj.object_name,
+                    'success': True,
+                    'skipped': True
+                }
+                for obj in files_to_upload if obj in identical
+            )
+            files_to_upload = [obj for obj in files_to_upload if obj not in identical]
+
         with S3UploadLogger(len(files_to_upload)) as ul:
             with ThreadPoolExecutor(max_workers=options.get("object_threads")) as executor:
                 futures = {
@@ -753,6 +1294,73 @@ class S3Path(OBSPath):
         utils.check_condition(condition, [r['dest'] for r in uploaded['completed']])
         return uploaded
 
+    def _copy_object_parts(self, copy_source, head, part_size, max_workers):
+        """Copies an object to this path with a multipart upload of ``upload_part_copy``
+        parts. The content type and metadata of the object (from its ``head``) are kept.
+        """
+        size = head['ContentLength']
+        # Parts are made larger if needed to stay within the maximum number of parts
+        part_size = max(part_size, -(-size // _MAX_MULTIPART_PARTS))
+        headers = {'Metadata': head.get('Metadata', {})}
+        if head.get('ContentType'):
+            headers['ContentType'] = head['ContentType']
+        multipart_writer = _S3MultipartWriter(self, headers=headers)
+
+        def copy_part(part_number):
+            start = (part_number - 1) * part_size
+            return multipart_writer.upload_part_copy(part_number, copy_source, start,
+                                                     min(start + part_size, size) - 1)
+
+        num_parts = -(-size // part_size)
+        multipart_writer.start()
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                parts = list(executor.map(copy_part, range(1, num_parts + 1)))
+            multipart_writer.complete(parts)
+        except Exception:
+            multipart_writer.abort()
+            raise
+
+    def _copy_object(self, source, dest, size=None, options=None):
+        """Copies a single object server-side. Helper for threaded copy."""
+        result = {
+            'source': source,
+            'dest': dest,
+            'size': size,
+            'success': True
+        }
+        copy_source = {'Bucket': source.bucket, 'Key': str(source.resource)}
+        try:
+            head = None
+            if size is None or size > _MAX_COPY_OBJECT_SIZE:
+                head = self._s3_client_call('head_object', **copy_source)
+                result['size'] = head['ContentLength']
+            if result['size'] <= _MAX_COPY_OBJECT_SIZE:
+                self._s3_client_call('copy_object',
+                                     Bucket=dest.bucket,
+                                     Key=str(dest.resource),
+                                     CopySource=copy_source)
+            else:
+                dest._copy_object_parts(copy_source, head,
+                                        utils.str_to_bytes(options['segment_size']),
+                                        options['segment_threads'])
+        except exceptions.RemoteError as e:
+            result['success'] = False
+            result['error'] = e
+        return result
+
+    def _copy_objects(self, objects):
+        """Copies objects server-side to other S3 paths. See `OBSPath.copytree`.
+
+        Objects are copied with ``copy_object`` by ``object_threads`` threads (configured
+        in the ``s3:upload`` settings). Objects larger than 5 GB are copied with
+        multipart uploads of ``segment_size`` parts, ``segment_threads`` at a time.
+        """
+        options = settings.get_section('s3:upload')
+        copy_w_options = partial(self._copy_object, options=options)
+
+        return _run_transfers(copy_w_options, objects, options['object_threads'])
+
     def to_url(self):
         """Returns HTTP url for object (virtual host-style)"""
         return u'https://{bucket}.s3.amazonaws.com/{key}'.format(bucket=self.bucket,
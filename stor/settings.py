@@ -1,7 +1,7 @@
 import ast
-import copy
 import os
 import threading
+from types import MappingProxyType
 
 from configparser import ConfigParser
 
@@ -29,9 +29,63 @@ to config sections and values are dictionaries where the keys are the option
 names and values are the environment variables.s
 """
 
-_global_settings = {}
+
+class _GlobalSettings(dict):
+    """
+    The global settings dictionary. Any change made to it or to one of its sections
+    directly (rather than through `update`) invalidates the settings snapshot.
+
+    Nested dictionaries are stored as `_GlobalSettings` so that changes to them, e.g.
+    ``_global_settings['s3']['option'] = value``, also invalidate the snapshot.
+    """
+    def __init__(self, *args, **kwargs):
+        super(_GlobalSettings, self).__init__()
+        self.update(*args, **kwargs)
+
+    def __setitem__(self, key, value):
+        if isinstance(value, dict) and not isinstance(value, _GlobalSettings):
+            value = _GlobalSettings(value)
+        try:
+            dict.__setitem__(self, key, value)
+        finally:
+            _invalidate()
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def _invalidating(name):
+        method = getattr(dict, name)
+
+        def wrapper(self, *args, **kwargs):
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                _invalidate()
+        wrapper.__name__ = name
+        return wrapper
+
+    __delitem__ = _invalidating('__delitem__')
+    clear = _invalidating('clear')
+    pop = _invalidating('pop')
+    popitem = _invalidating('popitem')
+    del _invalidating
+
+
+_global_settings = _GlobalSettings()
 thread_local = threading.local()
 
+# The version of ``_global_settings``. It is incremented whenever they change
+_version = 0
+# The (version, snapshot) of the last read-only snapshot of ``_global_settings``
+_snapshot = (None, None)
+_snapshot_lock = threading.Lock()
+
 
 def _parse_config_val(value):
     try:
@@ -118,8 +172,8 @@ def _update(d, updates, validate=True):
     in the dictionary.
     """
     for key, value in updates.items():
-        if type(value) is dict:
-            if key not in d or not type(d[key]) is dict:
+        if isinstance(value, dict):
+            if key not in d or not isinstance(d[key], dict):
                 if validate:
                     raise ValueError('\'%s\' is not a valid setting' % key)
                 d[key] = {}
@@ -130,17 +184,81 @@ def _update(d, updates, validate=True):
             d[key] = value
 
 
-def get():
+def _invalidate():
+    """Marks the snapshot of global settings as out of date"""
+    global _version
+    _version += 1
+
+
+def _freeze(value):
+    """Returns a read-only copy of a nested settings value"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(val) for key, val in value.items()})
+    elif isinstance(value, list):
+        return tuple(_freeze(val) for val in value)
+    return value
+
+
+def _thaw(value):
+    """Returns a mutable copy of a value frozen with `_freeze`"""
+    if isinstance(value, MappingProxyType):
+        return {key: _thaw(val) for key, val in value.items()}
+    elif isinstance(value, tuple):
+        return [_thaw(val) for val in value]
+    return value
+
+
+def _get_snapshot():
     """
-    Returns a deep copy of global settings as a dictionary.
+    Returns the read-only snapshot of the settings in use by this thread.
 
-    This function should always be used rather than accessing
-    ``global_settings`` directly.
+    The snapshot of global settings is only rebuilt after they change.
     """
+    global _snapshot
     try:
-        return copy.deepcopy(thread_local.settings)
+        return thread_local.settings
     except AttributeError:
-        return copy.deepcopy(_global_settings)
+        pass
+
+    version, snapshot = _snapshot
+    if version != _version:
+        with _snapshot_lock:
+            version, snapshot = _snapshot
+            if version != _version:
+                version = _version
+                snapshot = _freeze(_global_settings)
+                _snapshot = (version, snapshot)
+    return snapshot
+
+
+def get():
+    """
+    Returns a copy of global settings as a dictionary.
+
+    This function should always be used rather than accessing
+    ``global_settings`` directly. Changing the returned dictionary
+    does not change the settings.
+    """
+    return _thaw(_get_snapshot())
+
+
+def get_section(name):
+    """
+    Returns a read-only mapping of the options of one settings section.
+
+    Unlike `get`, no copy of the settings is made, so this is cheap enough
+    to call on every request.
+
+    Arguments:
+        name (str): The name of the section, e.g. ``'swift:upload'``.
+
+    Returns:
+        Mapping: The options of the section.
+
+    Raises:
+        KeyError: The section does not exist.
+    """
+    return _get_snapshot()[name]
 
 
 def update(settings=None,
@@ -158,7 +276,10 @@ def update(settings=None,
     if hasattr(thread_local, 'settings'):
         raise RuntimeError('update() cannot be called from within a settings context manager')
     if settings:
-        _update(_global_settings, settings, validate=validate)
+        try:
+            _update(_global_settings, settings, validate=validate)
+        finally:
+            _invalidate()
 
 
 class _Use(object):
@@ -168,19 +289,17 @@ class _Use(object):
     def __init__(self, settings=None):
         settings = settings or {}
 
-        if hasattr(thread_local, 'settings'):
-            self.old_settings = get()
-        else:
-            self.old_settings = None
-        self.temp_settings = get()
-        _update(self.temp_settings, settings)
+        self.old_settings = getattr(thread_local, 'settings', None)
+        temp_settings = get()
+        _update(temp_settings, settings)
+        self.temp_settings = _freeze(temp_settings)
         thread_local.settings = self.temp_settings
 
     def __enter__(self):
         pass
 
     def __exit__(self, type, value, traceback):
-        if self.old_settings:
+        if self.old_settings is not None:
             thread_local.settings = self.old_settings
         else:
             del thread_local.settings
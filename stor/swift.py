@@ -32,14 +32,15 @@ Examples:
 More examples and documentations for swift methods can be found under
 the `SwiftPath` class.
 """
+from concurrent.futures import ThreadPoolExecutor
 import copy
 from functools import partial
 from functools import wraps
 import json
 import logging
 import os
-import tempfile
 import threading
+import time
 
 from urllib import parse
 from swiftclient import exceptions as swift_exceptions
@@ -52,8 +53,11 @@ from stor import is_swift_path
 from stor import settings
 from stor import utils
 from stor.base import Path
+from stor.obs import OBSListEntry
 from stor.obs import OBSPath
 from stor.obs import OBSUploadObject
+from stor.obs import _iter_shards_parallel
+from stor.obs import _run_transfers
 from stor.posix import PosixPath
 from stor.third_party.backoff import with_backoff
 
@@ -86,9 +90,32 @@ swift_client.get_auth_keystone = patched_get_auth_keystone
 _cached_auth_token_map = {}
 _singleton_lock = threading.Lock()
 
+# Per-thread caches of Connection objects, which are not thread-safe. Caches from an
+# older generation are discarded, which allows clearing the caches of every thread
+_client_cache_local = threading.local()
+_client_cache_generation = 0
+# SwiftService objects shared by every thread, keyed by their connection options.
+# Each service has its own thread pools, so they are not created for every thread
+_swift_services = {}
+
 # Content types that are assigned to empty directories
 DIR_MARKER_TYPES = ('text/directory', 'application/directory')
 
+# The number of results requested for each page of a listing. This is the
+# default maximum number of results swift returns for a single request
+_LIST_PAGE_SIZE = 10000
+
+# The number of candidate markers sampled per worker when splitting a listing
+# into marker ranges for a parallel listing
+_LIST_SHARD_SAMPLES = 4
+# The number of pages of a marker range that are listed (and held in memory) at once
+_LIST_SHARD_MAX_PAGES = 2
+
+# Objects larger than this are static large objects, which are copied by segment
+_MAX_COPY_OBJECT_SIZE = 5 * 1024 ** 3
+# The default maximum number of segments of a static large object
+_MAX_SLO_SEGMENTS = 1000
+
 # These variables are used to configure retry logic for swift.
 # These variables can also be passed to the methods themselves
 initial_retry_sleep = 1
@@ -104,6 +131,13 @@ UnauthorizedError = stor_exceptions.UnauthorizedError
 SwiftUploadObject = OBSUploadObject
 
 
+def _to_swift_upload_object(upload_obj):
+    """Converts an OBSUploadObject to the SwiftUploadObject that SwiftService expects"""
+    return swift_service.SwiftUploadObject(upload_obj.source,
+                                           object_name=upload_obj.object_name,
+                                           options=upload_obj.options)
+
+
 def _default_retry_sleep_function(t, attempt):
     return t * 2
 
@@ -129,7 +163,7 @@ def _get_or_create_auth_credentials(tenant_name):
     If any auth setting is updated, all cached auth credentials are
     cleared and new auth credentials are created for the requested tenant.
     """
-    options = settings.get()['swift']
+    options = settings.get_section('swift')
     auth_url = options.get('auth_url')
     username = options.get('username')
     password = options.get('password')
@@ -170,6 +204,69 @@ def _get_or_create_auth_credentials(tenant_name):
 def _clear_cached_auth_credentials():
     with _singleton_lock:
         _cached_auth_token_map.clear()
+    _clear_cached_swift_clients()
+
+
+def _clear_cached_swift_clients():
+    """Discards the cached Connection objects of every thread and the shared
+    SwiftService objects.
+
+    Discarded services shut down their thread pools once the calls that are still
+    using them finish.
+    """
+    global _client_cache_generation
+    with _singleton_lock:
+        _client_cache_generation += 1
+        _swift_services.clear()
+
+
+def _get_or_create_swift_client(client_type, factory, conn_opts):
+    """
+    Gets the ``client_type`` client cached for the connection options or creates one with
+    ``factory(conn_opts)``.
+
+    Connections are not thread-safe, so each thread caches its own. Services only
+    submit work to their thread pools, so one service is shared by every thread.
+    Since the options include the tenant and the auth token, clients are cached
+    per tenant and are evicted when credentials are cleared.
+    """
+    key = json.dumps(conn_opts, sort_keys=True, default=str)
+    if client_type == 'service':
+        with _singleton_lock:
+            if key not in _swift_services:
+                _swift_services[key] = factory(conn_opts)
+            return _swift_services[key]
+
+    if getattr(_client_cache_local, 'generation', None) != _client_cache_generation:
+        _client_cache_local.clients = {}
+        _client_cache_local.generation = _client_cache_generation
+    if key not in _client_cache_local.clients:
+        _client_cache_local.clients[key] = factory(conn_opts)
+    return _client_cache_local.clients[key]
+
+
+def _sample_list_markers(names, num_markers, prefix=''):
+    """
+    Returns candidate markers that split the names listed after ``names`` (the
+    first page of a listing under ``prefix``) into roughly ``num_markers`` ranges.
+
+    Later names are assumed to use the characters that follow the common prefix of
+    the first and last names of the page. Candidates replace a character of the last
+    name with a greater one, starting from the first character after the common
+    prefix and moving towards ``prefix`` until there are enough candidates.
+    """
+    common = os.path.commonprefix([names[0], names[-1]])
+    last = names[-1]
+    alphabet = sorted({char for name in names for char in name[len(common):]})
+    candidates = []
+    for pos in reversed(range(len(prefix), len(common) + 1)):
+        if pos < len(last):
+            candidates.extend(last[:pos] + char for char in alphabet if char > last[pos])
+        if len(candidates) >= num_markers:
+            break
+
+    step = max(len(candidates) // num_markers, 1)
+    return sorted(candidates)[::step]
 
 
 class FailedUploadError(stor_exceptions.FailedUploadError, UnavailableError):
@@ -213,7 +310,7 @@ def _swift_retry(exceptions=None):
     def decorated(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
-            retries = kwargs.pop('num_retries', settings.get()['swift']['num_retries'])
+            retries = kwargs.pop('num_retries', settings.get_section('swift')['num_retries'])
             initial_sleep = kwargs.pop('initial_retry_sleep',
                                        initial_retry_sleep)
             sleep_function = kwargs.pop('retry_sleep_function',
@@ -414,6 +511,75 @@ class SwiftUploadLogger(utils.BaseProgressLogger):
         ) % (self.num_results, self.total_upload_objects, formatted_elapsed_time, mb, mb_s)
 
 
+class _SwiftSLOWriter(object):
+    """Writes an object as a static large object (SLO). Used by `OBSSegmentWriter` and
+    copies.
+
+    Segments are uploaded to the same segment container as `SwiftPath.upload` uses.
+    ``headers`` are set on the manifest. The ``segment_size`` defaults to the one of the
+    ``swift:upload`` settings.
+    """
+    max_parts = _MAX_SLO_SEGMENTS
+
+    def __init__(self, pth, headers=None, segment_size=None):
+        self._path = pth
+        self._headers = headers or {}
+        self.segment_size = segment_size or utils.str_to_bytes(
+            settings.get_section('swift:upload')['segment_size'])
+        self._segment_container = '.segments_%s' % pth.container
+        self._segment_prefix = '%s/slo/%f/%s' % (pth.resource, time.time(), self.segment_size)
+        self._segment_names = []
+
+    def start(self):
+        self._path._swift_connection_call('put_container', self._segment_container)
+
+    def upload_part(self, part_number, data):
+        segment_name = '%s/%08d' % (self._segment_prefix, part_number)
+        self._segment_names.append(segment_name)
+        etag = self._path._swift_connection_call('put_object', self._segment_container,
+                                                 segment_name, data)
+        return {
+            'path': '/%s/%s' % (self._segment_container, segment_name),
+            'etag': etag,
+            'size_bytes': len(data)
+        }
+
+    def copy_part(self, part_number, source, segment):
+        """Copies a segment of the static large object ``source``, as listed in its
+        manifest, with a COPY request"""
+        segment_name = '%s/%08d' % (self._segment_prefix, part_number)
+        self._segment_names.append(segment_name)
+        segment_container, segment_object = segment['name'].lstrip('/').split('/', 1)
+        headers = ({'Destination-Account': self._path.tenant}
+                   if source.tenant != self._path.tenant else {})
+        source._swift_connection_call('copy_object', segment_container, segment_object,
+                                      destination='/%s/%s' % (self._segment_container,
+                                                              segment_name),
+                                      headers=headers)
+        return {
+            'path': '/%s/%s' % (self._segment_container, segment_name),
+            'etag': segment['hash'],
+            'size_bytes': segment['bytes']
+        }
+
+    def complete(self, parts):
+        put_kwargs = {'headers': self._headers} if self._headers else {}
+        self._path._swift_connection_call('put_object',
+                                          self._path.container,
+                                          self._path.resource,
+                                          json.dumps(parts),
+                                          query_string='multipart-manifest=put',
+                                          **put_kwargs)
+
+    def abort(self):
+        for segment_name in self._segment_names:
+            try:
+                self._path._swift_connection_call('delete_object', self._segment_container,
+                                                  segment_name)
+            except NotFoundError:  # pragma: no cover
+                pass
+
+
 class SwiftPath(OBSPath):
     """
     Provides the ability to manipulate and access resources on swift
@@ -468,7 +634,7 @@ class SwiftPath(OBSPath):
             ConfigurationError: The needed swift environment variables
                 aren't set.
         """
-        global_options = settings.get()['swift']
+        global_options = settings.get_section('swift')
         auth_url = global_options.get('auth_url')
         username = global_options.get('username')
         password = global_options.get('password')
@@ -507,10 +673,11 @@ class SwiftPath(OBSPath):
                 into swift service creation.
 
         Returns:
-            swiftclient.service.SwiftService: The service instance.
+            swiftclient.service.SwiftService: The service instance. Services are
+            shared by every thread for the connection options.
         """
         conn_opts = self._get_swift_connection_options(**options)
-        return swift_service.SwiftService(conn_opts)
+        return _get_or_create_swift_client('service', swift_service.SwiftService, conn_opts)
 
     def _get_swift_connection(self, **options):
         """Initialize a swift client connection based on the path.
@@ -525,10 +692,11 @@ class SwiftPath(OBSPath):
                 into swift connection creation.
 
         Returns:
-            swiftclient.client.Connection: The connection instance.
+            swiftclient.client.Connection: The connection instance. Connections are
+            cached per thread for the connection options.
         """
         conn_opts = self._get_swift_connection_options(**options)
-        return swift_service.get_conn(conn_opts)
+        return _get_or_create_swift_client('connection', swift_service.get_conn, conn_opts)
 
     @_retry_on_cached_auth_err
     @_propagate_swift_exceptions
@@ -594,6 +762,32 @@ class SwiftPath(OBSPath):
                                                        self.resource)
         return content
 
+    @_swift_retry(exceptions=(NotFoundError, UnavailableError,
+                              InconsistentDownloadError, UnauthorizedError))
+    def read_object_range(self, start, end):
+        """Reads a byte range of an individual object with an HTTP Range request.
+
+        Args:
+            start (int): The offset of the first byte to read
+            end (int): The offset of the last byte to read (inclusive)
+
+        Returns:
+            bytes: the raw bytes of the range from the object on OBS.
+
+        This method retries ``num_retries`` times if swift is unavailable or if
+        the object is not found. View
+        `module-level documentation <swiftretry>` for more
+        information about configuring retry logic at the module or method
+        level.
+        """
+        headers, content = self._swift_connection_call('get_object',
+                                                       self.container,
+                                                       self.resource,
+                                                       headers={
+                                                           'Range': 'bytes=%d-%d' % (start, end)
+                                                       })
+        return content
+
     def temp_url(self, lifetime=300, method='GET', inline=True, filename=None):
         """Obtains a temporary URL to an object.
 
@@ -608,7 +802,7 @@ class SwiftPath(OBSPath):
             filename (str, optional): A urlencoded filename to use for
                 attachment, otherwise defaults to object name
         """
-        global_options = settings.get()['swift']
+        global_options = settings.get_section('swift')
         auth_url = global_options.get('auth_url')
         temp_url_key = global_options.get('temp_url_key')
 
@@ -647,27 +841,50 @@ class SwiftPath(OBSPath):
                                  '&'.join(query),
                                  auth_url_parts.fragment))
 
+    @_swift_retry(exceptions=(UnavailableError, UnauthorizedError, AuthenticationError))
     def write_object(self, content: bytes):
         """Writes an individual object.
 
-        Note that this method writes the provided content to a temporary
-        file before uploading. This allows us to reuse code from swift's
-        uploader (static large object support, etc.).
+        The content is uploaded from memory with ``put_object``. Content larger than the
+        ``segment_size`` of the ``swift:upload`` settings is uploaded as a static large
+        object of ``segment_threads`` concurrent segments.
 
-        For information about the retry logic of this method, view
-        `SwiftPath.upload`.
+        This method retries ``num_retries`` times if swift is unavailable. View
+        `module-level documentation <swiftretry>` for more information about configuring
+        retry logic at the module or method level.
 
         Args:
             content (bytes): raw bytes to write to OBS
         """
         if not isinstance(content, bytes):  # pragma: no cover
             raise TypeError('write_object() expects bytes, not text data')
-        mode = 'wb' if type(content) == bytes else 'wt'
-        with tempfile.NamedTemporaryFile(mode=mode) as fp:
-            fp.write(content)
-            fp.flush()
-            suo = OBSUploadObject(fp.name, object_name=self.resource)
-            return self.upload([suo])
+        slo_writer = _SwiftSLOWriter(self)
+        segment_size = slo_writer.segment_size
+        if len(content) <= segment_size:
+            self._swift_connection_call('put_object', self.container, self.resource, content)
+            return
+
+        def upload_part(part_number):
+            # Slice in the worker so that only the segments being uploaded are copied
+            start = (part_number - 1) * segment_size
+            return slo_writer.upload_part(part_number, content[start:start + segment_size])
+
+        num_parts = (len(content) + segment_size - 1) // segment_size
+        options = settings.get_section('swift:upload')
+        slo_writer.start()
+        try:
+            with ThreadPoolExecutor(max_workers=options['segment_threads']) as executor:
+                parts = list(executor.map(upload_part, range(1, num_parts + 1)))
+            slo_writer.complete(parts)
+        except Exception:
+            slo_writer.abort()
+            raise
+
+    def _get_multipart_writer(self):
+        # Streamed writes hold a few segments in memory, so they use smaller segments
+        segment_size = utils.str_to_bytes(
+            settings.get_section('swift:upload')['stream_segment_size'])
+        return _SwiftSLOWriter(self, segment_size=segment_size)
 
     @_swift_retry(exceptions=(ConditionNotMetError, UnavailableError))
     def list(self,
@@ -675,6 +892,9 @@ class SwiftPath(OBSPath):
              limit=None,
              condition=None,
              use_manifest=False,
+             parallel=None,
+             split_points=None,
+             with_metadata=False,
              # intentionally not documented
              list_as_dir=False,
              ignore_segment_containers=True,
@@ -698,18 +918,22 @@ class SwiftPath(OBSPath):
                 when the results matches the condition.
             use_manifest (bool): Perform the list and use the data manfest file to validate
                 the list.
+            parallel (int): The number of marker ranges to list concurrently. See
+                `list_iter()`.
+            split_points (List[str]): Names, relative to the listed path, at which the
+                listing is split into marker ranges when ``parallel`` is set.
+            with_metadata (bool): Return an `OBSListEntry` with the size, ETag, last
+                modified time and content type of each object instead of its path.
+                See `list_iter()`.
 
         Returns:
-            List[SwiftPath]: Every path in the listing.
+            List[SwiftPath|OBSListEntry]: Every path (or entry) in the listing.
 
         Raises:
             SwiftError: A swift client error occurred.
             ConditionNotMetError: Results were returned, but they did not
                 meet the condition.
         """
-        tenant = self.tenant
-        prefix = self.resource
-        full_listing = limit is None
         utils.validate_condition(condition)
 
         if use_manifest:
@@ -718,6 +942,94 @@ class SwiftPath(OBSPath):
             condition = (utils.join_conditions(condition, manifest_cond)
                          if condition else manifest_cond)
 
+        # Pages are not retried individually since the entire listing is
+        # retried by this method
+        pages = self._iter_listing(self._get_list_kwargs(starts_with, list_as_dir),
+                                   limit=limit,
+                                   parallel=parallel,
+                                   split_points=split_points,
+                                   list_as_dir=list_as_dir,
+                                   ignore_segment_containers=ignore_segment_containers,
+                                   ignore_dir_markers=ignore_dir_markers,
+                                   with_metadata=with_metadata,
+                                   page_retries=0)
+        results = [r for page_results in pages for r in page_results]
+
+        utils.check_condition(condition, [r.path for r in results]
+                              if with_metadata else results)
+        return results
+
+    def list_iter(self,
+                  starts_with=None,
+                  limit=None,
+                  condition=None,
+                  parallel=None,
+                  split_points=None,
+                  with_metadata=False,
+                  # intentionally not documented
+                  list_as_dir=False,
+                  ignore_segment_containers=True,
+                  ignore_dir_markers=False):
+        """Iterate over contents using the resource of the path as a prefix.
+
+        Listings are requested a page at a time with ``marker`` and ``limit``, and
+        paths are yielded in listing order as each page arrives. Each page request
+        is retried ``num_retries`` times if swift is unavailable.
+
+        When ``parallel`` is greater than one and the container listing is longer
+        than one page, the names after the first page are split into ranges with
+        ``marker`` and ``end_marker`` that are listed concurrently and yielded in
+        order. Range boundaries are found by sampling names like those of the first
+        page, or by looking up the first name after each of the given ``split_points``.
+        Ranges are listed up to ``_LIST_SHARD_MAX_PAGES`` pages at a time, and up to
+        ``2 * parallel`` of these are held in memory at once.
+
+        With ``with_metadata``, an `OBSListEntry` is yielded for each path with the
+        metadata that the listing returns along with it, so no ``stat()`` is needed
+        to find the size or ETag of listed objects.
+
+        Args:
+            starts_with (str): Allows for an additional search path to
+                be appended to the resource of the swift path. Note that the
+                current resource path is treated as a directory
+            limit (int): Limit the amount of results returned
+            condition (function(results) -> bool|IncrementalCondition): Checked against
+                the results once the final page has been listed. Function conditions need
+                every result, which are retained for the check. A
+                `utils.IncrementalCondition` is instead updated as each page arrives.
+            parallel (int): The number of marker ranges to list concurrently. Ignored when
+                listing a tenant or listing as a directory.
+            split_points (List[str]): Names, relative to the listed path, at which the
+                listing is split into marker ranges when ``parallel`` is set.
+            with_metadata (bool): Yield an `OBSListEntry` with the ``size``, ``etag``,
+                ``last_modified`` and ``content_type`` of each object instead of its path.
+                Conditions are still checked against the listed paths.
+
+        Returns:
+            Iter[SwiftPath|OBSListEntry]: Every path (or entry) in the listing.
+
+        Raises:
+            SwiftError: A swift client error occurred.
+            ConditionNotMetError: Results were returned, but they did not
+                meet the condition.
+        """
+        utils.validate_condition(condition)
+
+        pages = self._iter_listing(self._get_list_kwargs(starts_with, list_as_dir),
+                                   limit=limit,
+                                   parallel=parallel,
+                                   split_points=split_points,
+                                   list_as_dir=list_as_dir,
+                                   ignore_segment_containers=ignore_segment_containers,
+                                   ignore_dir_markers=ignore_dir_markers,
+                                   with_metadata=with_metadata)
+
+        yield from utils.iter_checked_pages(pages, condition, with_metadata=with_metadata)
+
+    def _get_list_kwargs(self, starts_with=None, list_as_dir=False):
+        """Returns the keyword arguments of the swift listing call for this path"""
+        prefix = self.resource
+
         # When starts_with is provided, treat the resource as a
         # directory that has the starts_with parameter after it. This allows
         # the user to specify a path like tenant/container/mydir
@@ -726,8 +1038,7 @@ class SwiftPath(OBSPath):
             prefix = prefix / starts_with if prefix else starts_with
 
         list_kwargs = {
-            'full_listing': full_listing,
-            'limit': limit,
+            'full_listing': False,
             'prefix': prefix
         }
         if self.container and list_as_dir:
@@ -739,6 +1050,11 @@ class SwiftPath(OBSPath):
             # Ensure that the prefix has a '/' at the end of it for listdir
             list_kwargs['prefix'] = utils.with_trailing_slash(list_kwargs['prefix'])
 
+        return list_kwargs
+
+    @_swift_retry(exceptions=UnavailableError)
+    def _get_list_page(self, list_kwargs):
+        """Returns the results of a single page of a container or tenant listing"""
         if self.container:
             results = self._swift_connection_call('get_container',
                                                   self.container,
@@ -746,23 +1062,148 @@ class SwiftPath(OBSPath):
         else:
             results = self._swift_connection_call('get_account',
                                                   **list_kwargs)
+        return results[1]
+
+    def _iter_listing(self, list_kwargs, limit=None, parallel=None, split_points=None,
+                      list_as_dir=False, page_retries=None, **path_kwargs):
+        """Yields a list of paths for each page or range of the listing"""
+        if parallel and parallel > 1 and self.container and not list_as_dir:
+            shards = self._get_list_shards(list_kwargs, parallel,
+                                           split_points=split_points,
+                                           page_retries=page_retries)
+            list_shard = partial(self._list_shard, page_retries=page_retries, **path_kwargs)
+            return _iter_shards_parallel(list_shard, shards, parallel, limit=limit)
+        else:
+            return self._iter_list_pages(list_kwargs, limit=limit, list_as_dir=list_as_dir,
+                                         page_retries=page_retries, **path_kwargs)
 
-        result_objs = results[1]
+    def _get_list_paths(self, result_objs, ignore_segment_containers=True,
+                        ignore_dir_markers=False, with_metadata=False):
+        """Returns the paths (or `OBSListEntry` objects) of the results of a listing page"""
+        path_pre = self.drive + self.tenant + '/' + utils.with_trailing_slash(self.container or '')
         if ignore_dir_markers:
             result_objs = [r for r in result_objs if r.get('content_type') not in DIR_MARKER_TYPES]
-
-        path_pre = SwiftPath('%s%s' % (self.drive, tenant)) / (self.container or '')
-        paths = list({
-            path_pre / (r.get('name') or r['subdir'].rstrip('/'))
+        paths = [
+            SwiftPath._from_validated(path_pre + (r.get('name') or r['subdir'].rstrip('/')))
             for r in result_objs
-        })
-
+        ]
+        if with_metadata:
+            paths = [
+                OBSListEntry(p,
+                             size=r.get('bytes'),
+                             etag=r.get('hash'),
+                             last_modified=r.get('last_modified'),
+                             content_type=r.get('content_type'))
+                for p, r in zip(paths, result_objs)
+            ]
         if ignore_segment_containers:
-            paths = [p for p in paths if not p.is_segment_container()]
-
-        utils.check_condition(condition, paths)
+            paths = [p for p in paths
+                     if not (p.path if with_metadata else p).is_segment_container()]
         return paths
 
+    def _iter_list_pages(self, list_kwargs, limit=None, list_as_dir=False, page_retries=None,
+                         with_metadata=False, **path_kwargs):
+        """
+        Yields a list of paths for each page of the listing, requesting the next
+        page with the name of the last result as the ``marker``.
+        """
+        retry_kwargs = {'num_retries': page_retries} if page_retries is not None else {}
+        # An object and a subdirectory of the same name are listed as a single
+        # path when listing as a directory
+        seen = set() if list_as_dir else None
+        remaining = limit
+        page_kwargs = dict(list_kwargs)
+        while remaining is None or remaining > 0:
+            page_kwargs['limit'] = min(remaining or _LIST_PAGE_SIZE, _LIST_PAGE_SIZE)
+            page = self._get_list_page(page_kwargs, **retry_kwargs)
+            if not page:
+                return
+
+            if remaining is not None:
+                remaining -= len(page)
+
+            page_results = self._get_list_paths(page, with_metadata=with_metadata,
+                                                **path_kwargs)
+            if seen is not None:
+                page_results = [
+                    r for r in page_results
+                    if not ((r.path if with_metadata else r) in seen or
+                            seen.add(r.path if with_metadata else r))
+                ]
+            yield page_results
+
+            if len(page) < page_kwargs['limit']:
+                return
+            page_kwargs = dict(page_kwargs, marker=page[-1].get('name') or page[-1]['subdir'])
+
+    def _get_list_shards(self, list_kwargs, parallel, split_points=None, page_retries=None):
+        """
+        Splits a container listing into marker ranges, in name order, for a parallel
+        listing.
+
+        The first page is listed to find where the ranges start. The first name after
+        each sampled marker (or split point) is then looked up concurrently. Since
+        markers are exclusive, these names are the boundaries of the ranges and are
+        returned as shards of their own.
+
+        Returns:
+            List[dict]: Shards with the ``list_kwargs`` used to list them. Results found
+                while splitting the listing are returned as shards with a ``results``
+                entry instead.
+        """
+        retry_kwargs = {'num_retries': page_retries} if page_retries is not None else {}
+        first_page = self._get_list_page(dict(list_kwargs, limit=_LIST_PAGE_SIZE),
+                                         **retry_kwargs)
+        shards = [{'results': first_page}]
+        if len(first_page) < _LIST_PAGE_SIZE:
+            return shards
+
+        start = first_page[-1]['name']
+        prefix = str(list_kwargs['prefix'] or '')
+        if split_points:
+            split_prefix = utils.with_trailing_slash(prefix) if prefix else ''
+            markers = [split_prefix + point for point in split_points]
+        else:
+            markers = _sample_list_markers([r['name'] for r in first_page],
+                                           parallel * _LIST_SHARD_SAMPLES,
+                                           prefix=prefix)
+        markers = sorted(marker for marker in set(markers) if marker > start)
+
+        get_boundary = partial(self._get_list_page, **retry_kwargs)
+        with ThreadPoolExecutor(max_workers=parallel) as executor:
+            pages = executor.map(get_boundary,
+                                 [dict(list_kwargs, limit=1, marker=marker) for marker in markers])
+            boundaries = {page[0]['name']: page[0] for page in pages if page}
+
+        for name in sorted(boundaries):
+            shards.append({'list_kwargs': dict(list_kwargs, marker=start, end_marker=name)})
+            shards.append({'results': [boundaries[name]]})
+            start = name
+        shards.append({'list_kwargs': dict(list_kwargs, marker=start)})
+        return shards
+
+    def _list_shard(self, shard, page_retries=None, **path_kwargs):
+        """Lists up to ``_LIST_SHARD_MAX_PAGES`` pages of a shard. Helper for threaded
+        listing.
+
+        Returns:
+            tuple: The paths (or entries) listed, and a shard with the rest of the
+            listing (or None). See `obs._iter_shards_parallel`.
+        """
+        if 'results' in shard:
+            return self._get_list_paths(shard['results'], **path_kwargs), None
+        retry_kwargs = {'num_retries': page_retries} if page_retries is not None else {}
+        results = []
+        page_kwargs = dict(shard['list_kwargs'], limit=_LIST_PAGE_SIZE)
+        for _ in range(_LIST_SHARD_MAX_PAGES):
+            page = self._get_list_page(page_kwargs, **retry_kwargs)
+            results.extend(self._get_list_paths(page, **path_kwargs))
+            if len(page) < _LIST_PAGE_SIZE:
+                return results, None
+            page_kwargs = dict(page_kwargs, marker=page[-1]['name'])
+        rest = dict(shard['list_kwargs'], marker=page_kwargs['marker'])
+        return results, dict(shard, list_kwargs=rest)
+
     def listdir(self, ignore_segment_containers=True, **kwargs):
         """Lists the path as a dir, returning top-level directories and files
 
@@ -921,7 +1362,7 @@ class SwiftPath(OBSPath):
                 raise ValueError(
                     '"%s" must be child of download path "%s"' % (obj, self))
 
-        options = settings.get()['swift:download']
+        options = settings.get_section('swift:download')
 
         service_options = {
             'object_dd_threads': options['object_threads'],
@@ -989,13 +1430,14 @@ class SwiftPath(OBSPath):
             # Do a full list with the manifest before the download. This will retry until
             # all results in the manifest can be listed, which helps ensure the download
             # can be performed without having to be retried
-            self.list(use_manifest=True)
+            self.list(use_manifest=True,
+                      parallel=settings.get_section('swift:download')['object_threads'])
             object_names = utils.get_data_manifest_contents(self)
             manifest_cond = partial(_validate_manifest_download, object_names)
             condition = (utils.join_conditions(condition, manifest_cond)
                          if condition else manifest_cond)
 
-        options = settings.get()['swift:download']
+        options = settings.get_section('swift:download')
         service_options = {
             'object_dd_threads': options['object_threads'],
             'container_threads': options['container_threads']
@@ -1135,14 +1577,15 @@ class SwiftPath(OBSPath):
             manifest_obj = OBSUploadObject(manifest_file_name,
                                            object_name=manifest_obj_name,
                                            options=upload_object_options)
-            self._swift_service_call('upload', self.container, [manifest_obj])
+            self._swift_service_call('upload', self.container,
+                                     [_to_swift_upload_object(manifest_obj)])
 
             # Make a condition for validating the upload
             manifest_cond = partial(_validate_manifest_upload, object_names)
             condition = (utils.join_conditions(condition, manifest_cond)
                          if condition else manifest_cond)
 
-        options = settings.get()['swift:upload']
+        options = settings.get_section('swift:upload')
         service_options = {
             'object_uu_threads': options['object_threads'],
             'segment_threads': options['segment_threads']
@@ -1153,20 +1596,113 @@ class SwiftPath(OBSPath):
             'segment_container': '.segments_%s' % self.container,
             'leave_segments': options['leave_segments'],
             'changed': options['changed'],
-            'skip_identical': options['skip_identical'],
+            'skip_identical': False,
             'checksum': options['checksum']
         }
+        skipped_results = []
+        if options['skip_identical']:
+            # Identical objects are found with a listing and cached hashes instead of by
+            # swiftclient, which reads every local file that exists on both sides
+            identical = self._get_identical_uploads(swift_upload_objects,
+                                                    utils.str_to_bytes(options['segment_size']),
+                                                    options['object_threads'])
+            skipped_results = [
+                {
+                    'action': 'upload_object',
+                    'object': str(o.object_name),
+                    'path': o.source,
+                    'success': True,
+                    'status': 'skipped-identical'
+                }
+                for o in swift_upload_objects if o in identical
+            ]
+            swift_upload_objects = [o for o in swift_upload_objects if o not in identical]
+
         with SwiftUploadLogger(len(swift_upload_objects), all_files_to_upload) as ul:
             results = self._swift_service_call('upload',
                                                self.container,
-                                               swift_upload_objects,
+                                               [_to_swift_upload_object(o)
+                                                for o in swift_upload_objects],
                                                options=upload_options,
                                                _progress_logger=ul,
                                                _service_options=service_options)
+        results = skipped_results + results
 
         utils.check_condition(condition, results)
         return results
 
+    def _copy_object_segments(self, source, headers, max_workers):
+        """Copies the static large object ``source`` to this path by copying each of its
+        segments. The content type and metadata of the object (from its ``headers``)
+        are kept.
+        """
+        _, manifest = source._swift_connection_call('get_object', source.container,
+                                                    source.resource,
+                                                    query_string='multipart-manifest=get')
+        segments = json.loads(manifest)
+        manifest_headers = {
+            name: value for name, value in headers.items()
+            if name == 'content-type' or name.startswith('x-object-meta-')
+        }
+        slo_writer = _SwiftSLOWriter(self, headers=manifest_headers,
+                                     segment_size=segments[0]['bytes'])
+
+        def copy_part(part):
+            return slo_writer.copy_part(part[0], source, part[1])
+
+        slo_writer.start()
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                parts = list(executor.map(copy_part, enumerate(segments, 1)))
+            slo_writer.complete(parts)
+        except Exception:
+            slo_writer.abort()
+            raise
+
+    def _copy_object(self, source, dest, size=None, options=None):
+        """Copies a single object server-side with a COPY request. Helper for
+        threaded copy."""
+        result = {
+            'source': source,
+            'dest': dest,
+            'size': size,
+            'success': True
+        }
+        try:
+            headers = None
+            if size is None or size > _MAX_COPY_OBJECT_SIZE:
+                headers = source._swift_connection_call('head_object', source.container,
+                                                        source.resource)
+                result['size'] = int(headers['content-length'])
+            if (result['size'] > _MAX_COPY_OBJECT_SIZE and
+                    headers.get('x-static-large-object', '').lower() == 'true'):
+                dest._copy_object_segments(source, headers, options['segment_threads'])
+            else:
+                copy_headers = ({'Destination-Account': dest.tenant}
+                                if source.tenant != dest.tenant else {})
+                source._swift_connection_call('copy_object', source.container,
+                                              source.resource,
+                                              destination='/%s/%s' % (dest.container,
+                                                                      dest.resource),
+                                              headers=copy_headers)
+        except SwiftError as e:
+            result['success'] = False
+            result['error'] = e
+        return result
+
+    def _copy_objects(self, objects):
+        """Copies objects server-side to other Swift paths. See `OBSPath.copytree`.
+
+        Objects are copied with COPY requests by ``object_threads`` threads (configured
+        in the ``swift:upload`` settings). Static large objects larger than 5 GB, which
+        cannot be copied with one request, are copied to new static large objects by
+        copying their segments, ``segment_threads`` at a time.
+        """
+        options = settings.get_section('swift:upload')
+        copy_w_options = partial(self._copy_object, options=options)
+
+        return _run_transfers(copy_w_options, objects, options['object_threads'])
+
     @_swift_retry(exceptions=(UnavailableError, UnauthorizedError))
     def remove(self):
         """Removes a single object.
@@ -1188,6 +1724,17 @@ class SwiftPath(OBSPath):
                                         self.container,
                                         [self.resource])
 
+    def _remove_objects(self, objects):
+        """Removes objects of this container with ``object_threads`` threads (configured
+        in the ``swift:delete`` settings). Helper for sync."""
+        service_options = {
+            'object_dd_threads': settings.get_section('swift:delete')['object_threads']
+        }
+        return self._swift_service_call('delete',
+                                        self.container,
+                                        [SwiftPath(obj).resource for obj in objects],
+                                        _service_options=service_options)
+
     @_swift_retry(exceptions=(UnavailableError, ConflictError,
                               ConditionNotMetError, UnauthorizedError))
     def rmtree(self):
@@ -1226,10 +1773,8 @@ class SwiftPath(OBSPath):
                            'when their associated objects or containers are '
                            'deleted.', self.container)
 
-        options = settings.get()
-
         service_options = {
-            'object_dd_threads': options['swift:delete']['object_threads']
+            'object_dd_threads': settings.get_section('swift:delete')['object_threads']
         }
 
         def _ignore_not_found(service_call):
@@ -1424,6 +1969,20 @@ class SwiftPath(OBSPath):
         """Returns content-type. Empty string if not set or if an account or container"""
         return self.stat().get('Content-Type') or ''
 
+    def _get_object_entry(self, object_name):
+        """Returns an `OBSListEntry` for an object of the container with a HEAD request,
+        or ``None`` if it does not exist. Helper for ``skip_identical`` uploads."""
+        try:
+            headers = self._swift_connection_call('head_object', self.container,
+                                                  str(object_name))
+        except NotFoundError:
+            return None
+        return OBSListEntry(SwiftPath(self.drive + self.tenant + '/' + self.container) /
+                            object_name,
+                            size=int(headers['content-length']),
+                            etag=headers['etag'].strip('"'),
+                            content_type=headers.get('content-type'))
+
     @_swift_retry(exceptions=(UnavailableError, UnauthorizedError))
     def post(self, options=None):
         """Post operations on the path.
@@ -1494,19 +2053,20 @@ class SwiftPath(OBSPath):
 
     @_swift_retry(exceptions=UnavailableError)
     def walkfiles(self, pattern=None, **kwargs):
-        """Iterates over listed files that match an optional pattern.
+        """Iterates over listed files that match an optional pattern, yielding each
+        page of results as it is listed.
 
         Args:
             pattern (str, optional): Only return files that match this pattern
+            **kwargs: Keyword arguments passed to `SwiftPath.list_iter`
 
         Returns:
             Iter[SwiftPath]: All files that match the optional pattern. Swift directory
                 markers are not returned.
         """
-        with settings.use({'swift': {'num_retries': 0}}):
-            for f in self.list(ignore_dir_markers=True):
-                if pattern is None or f.fnmatch(pattern):
-                    yield f
+        for f in self.list_iter(ignore_dir_markers=True, **kwargs):
+            if pattern is None or f.fnmatch(pattern):
+                yield f
 
     def to_url(self):
         """Returns URI for object (based on storage URL)
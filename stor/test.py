@@ -10,11 +10,13 @@ import uuid
 import dxpy
 import vcr
 
+from stor import dx
 from stor import Path
 from stor import s3
 from stor.s3 import S3Path
 from stor.swift import SwiftPath
 from stor import settings
+from stor import swift
 
 
 class SwiftTestMixin(object):
@@ -95,6 +97,8 @@ class SwiftTestMixin(object):
         _cache_patcher = mock.patch.dict('stor.swift._cached_auth_token_map', clear=True)
         self.addCleanup(_cache_patcher.stop)
         _cache_patcher.start()
+        swift._clear_cached_swift_clients()
+        self.addCleanup(swift._clear_cached_swift_clients)
 
     def assertSwiftListResultsEqual(self, r1, r2):
         """
@@ -210,6 +214,8 @@ class DXTestMixin(object):
         but playback from two same set of requests errors in certain scenarios.
         """
         super(DXTestMixin, self).setUp()
+        dx._resolution_cache.clear()
+        self.addCleanup(dx._resolution_cache.clear)
         self.cassette = None
         if self.vcr_enabled:
             myvcr = vcr.VCR(cassette_library_dir=self._get_cassette_library_dir(),
@@ -217,6 +223,12 @@ class DXTestMixin(object):
             cm = myvcr.use_cassette(self._get_cassette_name())
             self.cassette = cm.__enter__()
             self.addCleanup(cm.__exit__, None, None, None)
+            # Cassettes play back identical requests in the order they were recorded,
+            # so files are transferred one at a time
+            serial = settings.use({section: {'object_threads': 1}
+                                   for section in ('dx:upload', 'dx:download', 'dx:delete')})
+            serial.__enter__()
+            self.addCleanup(serial.__exit__, None, None, None)
         if self.cassette and self.cassette.rewound:
             patcher = mock.patch('time.sleep')
             self.addCleanup(patcher.stop)
@@ -259,6 +271,8 @@ class S3TestCase(unittest.TestCase, S3TestMixin):
     def setUp(self):
         super(S3TestCase, self).setUp()
         self.setup_s3_mocks()
+        s3._s3_client_manager.clear()
+        self.addCleanup(s3._s3_client_manager.clear)
         try:
             del s3._thread_local.s3_transfer
             del s3._thread_local.s3_transfer_config
@@ -10,6 +10,8 @@ import functools
 import gc
 import gzip
 import io
+import threading
+import time
 
 from unittest import mock
 
@@ -34,6 +36,40 @@ def mock_method_on_Path(method_name):
 
 mock_write_object = mock_method_on_Path('write_object')
 mock_read_object = mock_method_on_Path('read_object')
+mock_read_object_range = mock_method_on_Path('read_object_range')
+mock_getsize = mock_method_on_Path('getsize')
+
+
+class FakeMultipartWriter(object):
+    """Records the calls made by OBSSegmentWriter to a multipart writer"""
+    segment_size = 10
+    max_parts = 10000
+
+    def __init__(self, fail_part=None):
+        self.fail_part = fail_part
+        self.calls = []
+
+    def start(self):
+        self.calls.append('start')
+
+    def upload_part(self, part_number, data):
+        if part_number == self.fail_part:
+            raise ValueError('upload failed')
+        self.calls.append(('upload_part', part_number, data))
+        return part_number
+
+    def complete(self, parts):
+        self.calls.append(('complete', parts))
+
+    def abort(self):
+        self.calls.append('abort')
+
+
+def range_reader(data):
+    """Returns a read_object_range side effect that reads ranges of data"""
+    def read_object_range(pth, start, end):
+        return data[start:end + 1]
+    return read_object_range
 
 
 class SharedOBSFileCases(object):
@@ -219,3 +255,253 @@ class SharedOBSFileCases(object):
         self.assertFalse(write_obj.readable())
         self.assertTrue(write_obj.writable())
         self.assertTrue(write_obj.seekable())
+
+
+class SharedOBSStreamFileCases(object):
+    """Tests for streamed reads that only rely on read_object_range() and getsize() on the
+    underlying path class (for backends that support ranged reads)"""
+    drive = None
+    path_class = None
+
+    @mock_getsize
+    @mock_read_object_range
+    @mock_read_object
+    def test_stream_read_in_ranges(self, mock_read_object, mock_read_object_range, mock_getsize):
+        data = bytes(range(256)) * 100
+        mock_getsize.return_value = len(data)
+        mock_read_object_range.side_effect = range_reader(data)
+
+        with mock.patch.object(obs.OBSFile, 'READ_RANGE_SIZE', 1000):
+            with self.normal_path.open(mode='rb', stream=True) as obj:
+                self.assertEquals(obj.read(10), data[:10])
+                self.assertEquals(obj.read(10), data[10:20])
+                # Both reads are served from a single range
+                mock_read_object_range.assert_called_once_with(self.normal_path, 0, 999)
+                self.assertEquals(obj.tell(), 20)
+
+                # Seeking outside of the range fetches a new one
+                obj.seek(-100, io.SEEK_END)
+                self.assertEquals(obj.tell(), len(data) - 100)
+                self.assertEquals(obj.read(), data[-100:])
+                self.assertEquals(obj.read(10), b'')
+                self.assertEquals(mock_read_object_range.call_args_list[-1],
+                                  mock.call(self.normal_path, len(data) - 100, len(data) - 1))
+
+                obj.seek(0)
+                self.assertEquals(obj.read(), data)
+
+        self.assertFalse(mock_read_object.called)
+        mock_getsize.assert_called_once_with(self.normal_path)
+
+    @mock_getsize
+    @mock_read_object_range
+    def test_stream_read_all_in_ranges(self, mock_read_object_range, mock_getsize):
+        data = bytes(range(256)) * 400
+        mock_getsize.return_value = len(data)
+        mock_read_object_range.side_effect = range_reader(data)
+
+        with mock.patch.object(obs.OBSFile, 'READ_RANGE_SIZE', 20000):
+            with self.normal_path.open(mode='rb', stream=True) as obj:
+                self.assertEquals(obj.read(10), data[:10])
+                self.assertEquals(obj.read(), data[10:])
+        # The rest of the object is read in ranges of READ_RANGE_SIZE bytes, not in
+        # small chunks
+        self.assertEquals(mock_read_object_range.call_args_list, [
+            mock.call(self.normal_path, start, min(start + 20000, len(data)) - 1)
+            for start in range(0, len(data), 20000)
+        ])
+
+    @mock_getsize
+    @mock_read_object_range
+    def test_stream_read_bounded_ranges(self, mock_read_object_range, mock_getsize):
+        data = b'x' * 10000
+        mock_getsize.return_value = len(data)
+        mock_read_object_range.side_effect = range_reader(data)
+
+        with mock.patch.object(obs.OBSFile, 'READ_RANGE_SIZE', 1000):
+            with self.normal_path.open(mode='rb', stream=True) as obj:
+                while obj.read(100):
+                    pass
+        self.assertEquals(len(mock_read_object_range.call_args_list), 10)
+        for call in mock_read_object_range.call_args_list:
+            start, end = call[0][1:]
+            self.assertLessEqual(end - start + 1, 1000)
+
+    @mock_getsize
+    @mock_read_object_range
+    def test_stream_read_text(self, mock_read_object_range, mock_getsize):
+        data = 'line1\nline2\r\nline3\n'.encode('utf-16')
+        mock_getsize.return_value = len(data)
+        mock_read_object_range.side_effect = range_reader(data)
+
+        with self.normal_path.open(mode='r', encoding='utf-16', stream=True) as obj:
+            self.assertEquals(list(obj), ['line1\n', 'line2\r\n', 'line3\n'])
+
+    @mock_getsize
+    @mock_read_object_range
+    def test_stream_read_empty(self, mock_read_object_range, mock_getsize):
+        mock_getsize.return_value = 0
+        with self.normal_path.open(mode='rb', stream=True) as obj:
+            self.assertEquals(obj.read(), b'')
+        self.assertFalse(mock_read_object_range.called)
+
+    @mock_getsize
+    @mock_read_object_range
+    def test_stream_works_with_gzip(self, mock_read_object_range, mock_getsize):
+        gzip_path = stor.join(stor.dirname(__file__),
+                              'file_data', 's_3_2126.bcl.gz')
+        data = stor.open(gzip_path, 'rb').read()
+        mock_getsize.return_value = len(data)
+        mock_read_object_range.side_effect = range_reader(data)
+
+        with stor.open(stor.join(self.drive, 'A/C/s_3_2126.bcl.gz'), 'rb', stream=True) as obj:
+            with gzip.GzipFile(fileobj=obj) as fp:
+                with gzip.open(gzip_path) as gzip_fp:
+                    assert_same_data(fp, gzip_fp)
+
+    @mock_write_object
+    def test_stream_write_segments(self, mock_write_object):
+        writer = FakeMultipartWriter()
+        with mock.patch.object(self.path_class, '_get_multipart_writer', return_value=writer):
+            with self.normal_path.open(mode='wb', stream=True) as obj:
+                self.assertFalse(obj.seekable())
+                obj.write(b'a' * 8)
+                self.assertEquals(writer.calls, [])
+                obj.write(b'b' * 15)
+                self.assertEquals(obj.tell(), 23)
+                obj.flush()
+                # The final partial segment is only uploaded on close
+                self.assertNotIn(('upload_part', 3, b'b' * 3), writer.calls)
+
+        self.assertEquals(writer.calls, [
+            'start',
+            ('upload_part', 1, b'a' * 8 + b'b' * 2),
+            ('upload_part', 2, b'b' * 10),
+            ('upload_part', 3, b'b' * 3),
+            ('complete', [1, 2, 3])
+        ])
+        self.assertFalse(mock_write_object.called)
+
+    @mock_write_object
+    def test_stream_write_text(self, mock_write_object):
+        writer = FakeMultipartWriter()
+        with mock.patch.object(self.path_class, '_get_multipart_writer', return_value=writer):
+            with self.normal_path.open(mode='w', encoding='utf-8', stream=True) as obj:
+                obj.write('line1\n')
+                obj.writelines(['\u00e9\r\n'] * 2)
+
+        data = b''.join(call[2] for call in writer.calls if call[0] == 'upload_part')
+        self.assertEquals(data, 'line1\n\u00e9\r\n\u00e9\r\n'.encode('utf-8'))
+
+    @mock_write_object
+    def test_stream_write_small_object(self, mock_write_object):
+        writer = FakeMultipartWriter()
+        with mock.patch.object(self.path_class, '_get_multipart_writer', return_value=writer):
+            with self.normal_path.open(mode='wb', stream=True) as obj:
+                obj.write(b'small')
+            with self.normal_path.open(mode='wb', stream=True) as obj:
+                obj.write(b'')
+
+        self.assertEquals(writer.calls, [])
+        mock_write_object.assert_called_once_with(self.normal_path, b'small')
+
+    @mock_write_object
+    def test_stream_write_uniform_segments(self, mock_write_object):
+        writer = FakeMultipartWriter()
+        with mock.patch.object(self.path_class, '_get_multipart_writer', return_value=writer):
+            with self.normal_path.open(mode='wb', stream=True) as obj:
+                for i in range(5):
+                    obj.write(b'a' * 23)
+
+        # Segments all have the same size so that ETags can be compared when syncing
+        self.assertEquals([len(call[2]) for call in writer.calls if call[0] == 'upload_part'],
+                          [10] * 11 + [5])
+
+    @mock_write_object
+    def test_stream_write_grows_segments(self, mock_write_object):
+        writer = FakeMultipartWriter()
+        writer.max_parts = 20
+        with mock.patch.object(self.path_class, '_get_multipart_writer', return_value=writer):
+            with self.normal_path.open(mode='wb', stream=True) as obj:
+                obj.write(b'a' * 100)
+                obj.write(b'b' * 50)
+
+        # Segments double in size after every tenth of the maximum number of parts
+        segments = [call[2] for call in writer.calls if call[0] == 'upload_part']
+        self.assertEquals([len(segment) for segment in segments], [10, 10, 20, 20, 40, 40, 10])
+        self.assertEquals(b''.join(segments), b'a' * 100 + b'b' * 50)
+
+    @mock_write_object
+    def test_stream_write_too_many_segments(self, mock_write_object):
+        writer = FakeMultipartWriter()
+        writer.max_parts = 3
+        with mock.patch.object(self.path_class, '_get_multipart_writer', return_value=writer):
+            with self.assertRaisesRegex(ValueError, 'more than 3 segments'):
+                with self.normal_path.open(mode='wb', stream=True) as obj:
+                    obj.write(b'a' * 200)
+
+        self.assertEquals(writer.calls[-1], 'abort')
+        self.assertNotIn('complete', [call[0] for call in writer.calls])
+
+    @mock_write_object
+    def test_stream_write_abort(self, mock_write_object):
+        writer = FakeMultipartWriter()
+        with mock.patch.object(self.path_class, '_get_multipart_writer', return_value=writer):
+            obj = self.normal_path.open(mode='wb', stream=True)
+            obj.write(b'a' * 25)
+            obj.abort()
+
+        self.assertTrue(obj.closed)
+        self.assertEquals(writer.calls[-1], 'abort')
+        self.assertNotIn('complete', [call[0] for call in writer.calls])
+        self.assertFalse(mock_write_object.called)
+
+    @mock_write_object
+    def test_stream_write_aborted_on_exception(self, mock_write_object):
+        writer = FakeMultipartWriter()
+        with mock.patch.object(self.path_class, '_get_multipart_writer', return_value=writer):
+            with self.assertRaisesRegex(RuntimeError, 'stopped'):
+                with self.normal_path.open(mode='wb', stream=True) as obj:
+                    obj.write(b'a' * 25)
+                    raise RuntimeError('stopped')
+
+        self.assertEquals(writer.calls[-1], 'abort')
+        self.assertNotIn('complete', [call[0] for call in writer.calls])
+        self.assertFalse(mock_write_object.called)
+
+    @mock_write_object
+    def test_stream_write_error(self, mock_write_object):
+        writer = FakeMultipartWriter(fail_part=1)
+        with mock.patch.object(self.path_class, '_get_multipart_writer', return_value=writer):
+            with self.assertRaisesRegex(ValueError, 'upload failed'):
+                with self.normal_path.open(mode='wb', stream=True) as obj:
+                    for i in range(10):
+                        obj.write(b'a' * 10)
+
+        self.assertEquals(writer.calls[0], 'start')
+        self.assertEquals(writer.calls[-1], 'abort')
+        self.assertNotIn('complete', [call[0] for call in writer.calls])
+        self.assertFalse(mock_write_object.called)
+
+    @mock_write_object
+    def test_stream_write_error_waits_for_running_parts(self, mock_write_object):
+        part_started = threading.Event()
+
+        class SlowPartWriter(FakeMultipartWriter):
+            def upload_part(self, part_number, data):
+                if part_number == 1:
+                    # Fail once the second part is uploading
+                    part_started.wait(5)
+                    raise ValueError('upload failed')
+                part_started.set()
+                time.sleep(0.2)
+                return super(SlowPartWriter, self).upload_part(part_number, data)
+
+        writer = SlowPartWriter()
+        with mock.patch.object(self.path_class, '_get_multipart_writer', return_value=writer):
+            with self.assertRaisesRegex(ValueError, 'upload failed'):
+                with self.normal_path.open(mode='wb', stream=True) as obj:
+                    obj.write(b'a' * 20)
+
+        # The multipart upload is only aborted after the running part finished
+        self.assertEquals(writer.calls, ['start', ('upload_part', 2, b'a' * 10), 'abort'])
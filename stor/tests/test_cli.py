@@ -14,9 +14,11 @@ from stor.posix import PosixPath
 from stor.s3 import S3Path
 from stor.swift import SwiftPath
 from stor import cli
+from stor import NamedTemporaryDirectory
 from stor import exceptions
 from stor import settings
 from stor import test
+from stor.tests.shared_obs import FakeMultipartWriter
 
 
 class BaseCliTest(test.S3TestCase, test.SwiftTestCase):
@@ -90,6 +92,17 @@ class TestCliBasics(BaseCliTest):
     def test_cli_config(self, mock_copytree):
         expected_settings = {
             'stor': {},
+            'stor:hash_cache': {
+                'enabled': True,
+                'path': '',
+                'max_entries': 1000000
+            },
+            'stor:transfer': {
+                'segment_size': 16777216,
+                'object_threads': 10,
+                'segment_threads': 4,
+                'max_memory': 268435456
+            },
             's3': {
                 'aws_access_key_id': '',
                 'aws_secret_access_key': '',
@@ -100,13 +113,17 @@ class TestCliBasics(BaseCliTest):
             's3:upload': {
                 'segment_size': 8388608,
                 'object_threads': 10,
-                'segment_threads': 10
+                'segment_threads': 10,
+                'skip_identical': False
             },
             's3:download': {
                 'segment_size': 8388608,
                 'object_threads': 10,
                 'segment_threads': 10
             },
+            's3:delete': {
+                'object_threads': 10
+            },
             'swift': {
                 'username': 'fake_user',
                 'password': 'fake_password',
@@ -131,12 +148,25 @@ class TestCliBasics(BaseCliTest):
                 'segment_size': 1073741824,
                 'segment_threads': 10,
                 'skip_identical': False,
+                'stream_segment_size': 16777216,
                 'use_slo': True
             },
             'dx': {
                 'auth_token': 'fake_token',
                 'wait_on_close': 0,
-                'file_proxy_url': ''
+                'file_proxy_url': '',
+                'resolution_cache_ttl': 0,
+                'resolution_cache_size': 100000
+            },
+            'dx:upload': {
+                'object_threads': 10,
+                'segment_size': 16777216
+            },
+            'dx:download': {
+                'object_threads': 10
+            },
+            'dx:delete': {
+                'object_threads': 10
             }
         }
         filename = os.path.join(os.path.dirname(__file__), 'file_data', 'test.cfg')
@@ -348,6 +378,25 @@ class TestList(BaseCliTest):
             mock.call(S3Path('s3://some-bucket'), starts_with='dir', limit=2, canonicalize=True)
         ])
 
+    @mock.patch.object(S3Path, 'list', autospec=True)
+    def test_list_parallel(self, mock_list):
+        mock_list.return_value = [S3Path('s3://a/b')]
+        self.parse_args('stor list s3://a --parallel 8')
+        self.assertEquals(sys.stdout.getvalue(), 's3://a/b\n')
+        mock_list.assert_called_once_with(S3Path('s3://a'), parallel=8)
+
+    @mock.patch.object(SwiftPath, 'list', autospec=True)
+    def test_list_parallel_swift(self, mock_list):
+        mock_list.return_value = [SwiftPath('swift://t/c/file1')]
+        self.parse_args('stor list swift://t/c/ --parallel 8')
+        mock_list.assert_called_once_with(SwiftPath('swift://t/c/'), parallel=8)
+
+    @mock.patch.object(PosixPath, 'list', autospec=True)
+    def test_list_parallel_ignored_for_posix(self, mock_list):
+        mock_list.return_value = [PosixPath('dir/file1')]
+        self.parse_args('stor list dir --parallel 8')
+        mock_list.assert_called_once_with(PosixPath('dir'))
+
     @mock.patch.object(S3Path, 'list', autospec=True)
     def test_list_not_found(self, mock_list):
         mock_list.side_effect = exceptions.NotFoundError('not found')
@@ -409,17 +458,88 @@ class TestCopy(BaseCliTest):
         self.parse_args('stor cp s3://bucket/file.txt ./file1')
         mock_copy.assert_called_once_with(source='s3://bucket/file.txt', dest='./file1')
 
-    @mock.patch('sys.stdin', new=io.StringIO('some stdin input\n'))
+    @mock.patch('sys.stdin', new=io.TextIOWrapper(io.BytesIO(b'\x00\xffsome stdin input\n')))
     def test_copy_stdin(self, mock_copy):
-        mock_copy.side_effect = self.mock_copy_source
-        with NamedTemporaryFile(delete=False) as ntf:
-            test_file = ntf.name
+        with NamedTemporaryDirectory() as tmp_d:
+            test_file = tmp_d / 'dir' / 'file'
             self.parse_args('stor cp - %s' % test_file)
-        self.assertEquals(open(test_file).read(), 'some stdin input\n')
-        temp_file = mock_copy.call_args_list[0][1]['source']
-        self.assertFalse(os.path.exists(temp_file))
-        os.remove(test_file)
-        self.assertFalse(os.path.exists(test_file))
+            self.assertEquals(open(test_file, 'rb').read(), b'\x00\xffsome stdin input\n')
+        self.assertFalse(mock_copy.called)
+
+    @mock.patch('sys.stdin', new=io.TextIOWrapper(io.BytesIO(b'a' * 25)))
+    def test_copy_stdin_obs(self, mock_copy):
+        writer = FakeMultipartWriter()
+        with mock.patch.object(S3Path, '_get_multipart_writer', return_value=writer), \
+                mock.patch('stor.cli.STDIN_CHUNK_SIZE', 7):
+            self.parse_args('stor cp - s3://bucket/file.txt')
+        self.assertEquals(writer.calls, [
+            'start',
+            ('upload_part', 1, b'a' * 10),
+            ('upload_part', 2, b'a' * 10),
+            ('upload_part', 3, b'a' * 5),
+            ('complete', [1, 2, 3])
+        ])
+        self.assertFalse(mock_copy.called)
+
+    def test_copy_stdin_read_error(self, mock_copy):
+        writer = FakeMultipartWriter()
+        mock_stdin = mock.Mock()
+        mock_stdin.buffer.read.side_effect = [b'a' * 20, OSError('read failed')]
+        with mock.patch.object(S3Path, '_get_multipart_writer', return_value=writer), \
+                mock.patch('sys.stdin', mock_stdin):
+            with self.assertRaisesRegex(OSError, 'read failed'):
+                self.parse_args('stor cp - s3://bucket/file.txt')
+        self.assertEquals(writer.calls[-1], 'abort')
+        self.assertNotIn('complete', [call[0] for call in writer.calls])
+
+    def test_copy_stdin_directory_error(self, mock_copy):
+        with self.assertOutputMatches(exit_status='1', stderr='must be a file'):
+            self.parse_args('stor cp - s3://bucket/dir/')
+        with self.assertOutputMatches(exit_status='1', stderr='OBS destination'):
+            self.parse_args('stor cp - s3://bucket/dir')
+
+    @mock.patch('sys.stdin', new=io.StringIO('s3://bucket/file1\n'))
+    def test_copy_stdin_from_file_error(self, mock_copy):
+        with self.assertOutputMatches(exit_status='1', stderr='- cannot be used with --from'):
+            self.parse_args('stor cp - ./dir --from-file -')
+        self.assertFalse(mock_copy.called)
+
+    def test_copy_many(self, mock_copy):
+        self.parse_args('stor cp s3://bucket/file1 s3://bucket/file2 ./dir')
+        mock_copy.assert_has_calls([
+            mock.call(source='s3://bucket/file1', dest='./dir/'),
+            mock.call(source='s3://bucket/file2', dest='./dir/'),
+        ], any_order=True)
+        self.assertIn('cp complete - 2/2', sys.stdout.getvalue())
+
+    def test_copy_from_file(self, mock_copy):
+        with NamedTemporaryFile(mode='w') as ntf:
+            ntf.write('s3://bucket/file2\n\ns3://bucket/file3\n')
+            ntf.flush()
+            self.parse_args('stor cp s3://bucket/file1 ./dir/ --from-file %s' % ntf.name)
+        self.assertEquals(mock_copy.call_count, 3)
+        self.assertEquals({c[1]['source'] for c in mock_copy.call_args_list},
+                          {'s3://bucket/file1', 's3://bucket/file2', 's3://bucket/file3'})
+
+    @mock.patch('sys.stdin', new=io.StringIO('s3://bucket/file1\n'))
+    def test_copy_from_stdin(self, mock_copy):
+        self.parse_args('stor cp --from-file - ./file1')
+        mock_copy.assert_called_once_with(source='s3://bucket/file1', dest='./file1')
+
+    def test_copy_many_failed(self, mock_copy):
+        mock_copy.side_effect = [None, exceptions.NotFoundError('not found')]
+        with self.assertOutputMatches(exit_status='1', stdout='cp complete - 2/2.*1 failed',
+                                      stderr='NotFoundError.*\n.*1 of 2 paths failed'):
+            self.parse_args('stor cp --threads 1 s3://bucket/file1 s3://bucket/file2 ./dir')
+
+    def test_copy_no_sources(self, mock_copy):
+        with self.assertOutputMatches(exit_status='1', stderr='no paths to cp'):
+            self.parse_args('stor cp ./dir')
+        self.assertFalse(mock_copy.called)
+
+    def test_copy_stdin_with_other_sources(self, mock_copy):
+        with self.assertOutputMatches(exit_status='2', stderr='- cannot be used with other'):
+            self.parse_args('stor cp - s3://bucket/file1 ./dir')
 
 
 @mock.patch('stor.copytree', autospec=True)
@@ -428,11 +548,39 @@ class TestCopytree(BaseCliTest):
         self.parse_args('stor cp -r s3://bucket .')
         mock_copytree.assert_called_once_with(source='s3://bucket', dest='.')
 
+    def test_copytree_many(self, mock_copytree):
+        self.parse_args('stor cp -r s3://bucket/dir1 s3://bucket/dir2/ swift://t/c/dir')
+        mock_copytree.assert_has_calls([
+            mock.call(source='s3://bucket/dir1', dest='swift://t/c/dir/dir1'),
+            mock.call(source='s3://bucket/dir2/', dest='swift://t/c/dir/dir2'),
+        ], any_order=True)
+
     def test_copytree_stdin_error(self, mock_copytree):
         with self.assertOutputMatches(exit_status='2', stderr='- cannot be used with -r'):
             self.parse_args('stor cp -r - s3://bucket')
 
 
+@mock.patch('stor.sync', autospec=True)
+class TestSync(BaseCliTest):
+    def test_sync(self, mock_sync):
+        self.parse_args('stor sync ./dir s3://bucket/dir')
+        mock_sync.assert_called_once_with(source='./dir', dest='s3://bucket/dir',
+                                          compare='etag')
+
+    def test_sync_args(self, mock_sync):
+        self.parse_args('stor sync swift://t/c/dir ./dir --compare mtime --delete --parallel 4')
+        mock_sync.assert_called_once_with(source='swift://t/c/dir', dest='./dir',
+                                          compare='mtime', delete=True, parallel=4)
+
+
+class TestPruneHashCache(BaseCliTest):
+    @mock.patch('stor.hash_cache.prune', autospec=True, return_value=3)
+    def test_prune(self, mock_prune):
+        self.parse_args('stor prune-hash-cache --max-age 2')
+        mock_prune.assert_called_once_with(max_age=2 * 24 * 60 * 60)
+        self.assertEquals(sys.stdout.getvalue(), 'removed 3 hash cache entries\n')
+
+
 class TestRemove(BaseCliTest):
     @mock.patch.object(S3Path, 'remove', autospec=True)
     def test_remove_s3(self, mock_remove):
@@ -444,6 +592,25 @@ class TestRemove(BaseCliTest):
         self.parse_args('stor rm swift://t/c/file1')
         mock_remove.assert_called_once_with(SwiftPath('swift://t/c/file1'))
 
+    @mock.patch.object(S3Path, 'remove', autospec=True)
+    def test_remove_many(self, mock_remove):
+        with NamedTemporaryFile(mode='w') as ntf:
+            ntf.write('s3://bucket/file3\n')
+            ntf.flush()
+            self.parse_args('stor rm s3://bucket/file1 s3://bucket/file2 --from-file %s'
+                            % ntf.name)
+        mock_remove.assert_has_calls([
+            mock.call(S3Path('s3://bucket/file1')),
+            mock.call(S3Path('s3://bucket/file2')),
+            mock.call(S3Path('s3://bucket/file3')),
+        ], any_order=True)
+        self.assertIn('starting rm of 3 paths', sys.stdout.getvalue())
+
+    @mock.patch.object(S3Path, 'rmtree', autospec=True)
+    def test_rmtree_many(self, mock_rmtree):
+        self.parse_args('stor rm -r s3://bucket/dir1 s3://bucket/dir2')
+        self.assertEquals(mock_rmtree.call_count, 2)
+
     @mock.patch.object(S3Path, 'rmtree', autospec=True)
     def test_rmtree_s3(self, mock_rmtree):
         self.parse_args('stor rm -r s3://bucket/dir')
@@ -540,19 +707,77 @@ class TestToUri(BaseCliTest):
 
 
 class TestCat(BaseCliTest):
-    @mock.patch.object(S3Path, 'read_object', autospec=True)
-    def test_cat_s3(self, mock_read):
-        mock_read.return_value = b'hello world\n'
+    def setUp(self):
+        patcher = mock.patch.object(sys, 'stdout', io.TextIOWrapper(io.BytesIO()))
+        self.addCleanup(patcher.stop)
+        patcher.start()
+
+    def get_output(self):
+        return sys.stdout.buffer.getvalue()
+
+    @mock.patch.object(S3Path, 'read_object_range', autospec=True)
+    @mock.patch.object(S3Path, 'getsize', autospec=True, return_value=12)
+    def test_cat_s3(self, mock_getsize, mock_read_range):
+        mock_read_range.return_value = b'hello world\n'
         self.parse_args('stor cat s3://test/file')
-        self.assertEquals(sys.stdout.getvalue(), 'hello world\n')
-        mock_read.assert_called_once_with(S3Path('s3://test/file'))
+        self.assertEquals(self.get_output(), b'hello world\n')
+        mock_read_range.assert_called_once_with(S3Path('s3://test/file'), 0, 11)
 
-    @mock.patch.object(SwiftPath, 'read_object', autospec=True)
-    def test_cat_swift(self, mock_read):
-        mock_read.return_value = b'hello world'
+    @mock.patch.object(SwiftPath, 'read_object_range', autospec=True)
+    @mock.patch.object(SwiftPath, 'getsize', autospec=True, return_value=11)
+    def test_cat_swift(self, mock_getsize, mock_read_range):
+        mock_read_range.return_value = b'hello world'
         self.parse_args('stor cat swift://some/test/file')
-        self.assertEquals(sys.stdout.getvalue(), 'hello world\n')
-        mock_read.assert_called_once_with(SwiftPath('swift://some/test/file'))
+        self.assertEquals(self.get_output(), b'hello world')
+        mock_read_range.assert_called_once_with(SwiftPath('swift://some/test/file'), 0, 10)
+
+    @mock.patch.object(S3Path, 'read_object_range', autospec=True)
+    @mock.patch.object(S3Path, 'getsize', autospec=True, return_value=30)
+    def test_cat_in_ranges(self, mock_getsize, mock_read_range):
+        mock_read_range.side_effect = lambda pth, start, end: bytes(range(start, end + 1))
+        with mock.patch('stor.obs.OBSFile.READ_RANGE_SIZE', 8), \
+                mock.patch('stor.cli.CAT_FIRST_CHUNK_SIZE', 4):
+            self.parse_args('stor cat s3://test/file')
+        self.assertEquals(self.get_output(), bytes(range(30)))
+        # A small first range is written before the rest is read
+        self.assertEquals([call[0][1:] for call in mock_read_range.call_args_list],
+                          [(0, 3), (4, 11), (12, 19), (20, 27), (28, 29)])
+
+    @mock.patch.object(S3Path, 'read_object_range', autospec=True)
+    @mock.patch.object(S3Path, 'getsize', autospec=True, return_value=30)
+    def test_cat_range(self, mock_getsize, mock_read_range):
+        mock_read_range.side_effect = lambda pth, start, end: bytes(range(start, end + 1))
+        self.parse_args('stor cat s3://test/file --range 5-9')
+        self.assertEquals(self.get_output(), bytes(range(5, 10)))
+
+        sys.stdout.buffer.seek(0)
+        sys.stdout.buffer.truncate()
+        self.parse_args('stor cat s3://test/file --range 25-')
+        self.assertEquals(self.get_output(), bytes(range(25, 30)))
+
+    def test_cat_posix_range(self):
+        with NamedTemporaryFile() as ntf:
+            ntf.write(b'hello world')
+            ntf.flush()
+            self.parse_args('stor cat %s --range 6-' % ntf.name)
+        self.assertEquals(self.get_output(), b'world')
+
+    @mock.patch.object(sys, 'stdout', io.StringIO())
+    def test_cat_invalid_range(self):
+        for byte_range in ('5', '9-5', 'a-b', '-5'):
+            with self.assertOutputMatches(exit_status='2', stderr='invalid range'):
+                self.parse_args('stor cat s3://test/file --range=%s' % byte_range)
+
+    @mock.patch('os.dup2', autospec=True)
+    @mock.patch.object(S3Path, 'read_object_range', autospec=True, return_value=b'data')
+    @mock.patch.object(S3Path, 'getsize', autospec=True, return_value=4)
+    def test_cat_broken_pipe(self, mock_getsize, mock_read_range, mock_dup2):
+        mock_stdout = mock.Mock()
+        mock_stdout.buffer.write.side_effect = BrokenPipeError
+        with mock.patch.object(sys, 'stdout', mock_stdout):
+            with self.assertRaises(SystemExit):
+                self.parse_args('stor cat s3://test/file')
+        self.assertEquals(mock_dup2.call_args[0][1], mock_stdout.fileno.return_value)
 
 
 class TestCd(BaseCliTest):
@@ -11,11 +11,13 @@ from testfixtures import LogCapture
 
 import stor
 from stor import exceptions
+from stor import NamedTemporaryDirectory
 from stor import Path
 from stor import utils
 from stor.dx import DXPath
 import stor.dx as dx
 from stor.test import DXTestCase
+from stor.tests.shared_obs import FakeMultipartWriter
 from stor.tests.shared_obs import SharedOBSFileCases
 
 
@@ -342,7 +344,45 @@ class TestDXOBSFile(SharedOBSFileCases, unittest.TestCase):
         super(TestDXOBSFile, self).setUp()
         patcher = mock.patch('stor.obs.OBSFile._wait_on_close')
         self.addCleanup(patcher.stop)
-        patcher.start()
+        self.mock_wait_on_close = patcher.start()
+
+    @mock.patch.object(DXPath, 'write_object', autospec=True)
+    def test_stream_write_wait_on_close_after_write(self, mock_write_object):
+        writer = FakeMultipartWriter()
+        mock_write_object.side_effect = lambda pth, data: writer.calls.append('write_object')
+        self.mock_wait_on_close.side_effect = lambda: writer.calls.append('wait_on_close')
+        with mock.patch.object(DXPath, '_get_multipart_writer', return_value=writer):
+            with self.normal_path.open(mode='wb', stream=True) as obj:
+                obj.write(b'small')
+            with self.normal_path.open(mode='wb', stream=True) as obj:
+                obj.write(b'a' * 15)
+
+        # The file is only waited for once it is written
+        self.assertEquals(writer.calls, [
+            'write_object',
+            'wait_on_close',
+            'start',
+            ('upload_part', 1, b'a' * 10),
+            ('upload_part', 2, b'a' * 5),
+            ('complete', [1, 2]),
+            'wait_on_close'
+        ])
+
+    @mock.patch.object(DXPath, 'getsize', autospec=True, return_value=30)
+    @mock.patch('dxpy.DXFile', autospec=True)
+    def test_stream_read_one_file_handler(self, mock_dxfile, mock_getsize):
+        mock_dxfile.return_value.read.side_effect = lambda length: b'a' * length
+        dx_p = DXPath('dx://project-123456789012345678901234:file-123456789012345678901234')
+        with mock.patch.object(stor.obs.OBSFile, 'READ_RANGE_SIZE', 8):
+            with dx_p.open(mode='rb', stream=True) as obj:
+                self.assertEquals(obj.read(), b'a' * 30)
+
+        # All ranges are read with the same DXFile, which is only described once
+        mock_dxfile.assert_called_once_with(dxid='file-123456789012345678901234',
+                                            project='project-123456789012345678901234',
+                                            mode='rb')
+        self.assertEquals(mock_dxfile.return_value.seek.call_args_list,
+                          [mock.call(0), mock.call(8), mock.call(16), mock.call(24)])
 
     def test_makedirs_p_does_nothing(self):
         # skipping dumb test in superClass SharedOBSFileCases...
@@ -427,6 +467,135 @@ class TestCanonicalResource(DXTestCase):
         self.assertEqual(dx_p.virtual_project, self.project)
 
 
+PROJ_ID = 'project-' + 'a' * 24
+
+
+def _file_id(i):
+    return 'file-%024d' % i
+
+
+@mock.patch('dxpy.resolve_data_objects', autospec=True)
+@mock.patch('dxpy.find_one_project', autospec=True)
+class TestResolutionCache(unittest.TestCase):
+    def setUp(self):
+        dx._resolution_cache.clear()
+        self.addCleanup(dx._resolution_cache.clear)
+        use_cache = stor.settings.use({'dx': {'resolution_cache_ttl': 300}})
+        use_cache.__enter__()
+        self.addCleanup(use_cache.__exit__, None, None, None)
+
+    def test_shared_between_paths(self, mock_find_project, mock_resolve):
+        mock_find_project.return_value = {'id': PROJ_ID}
+        mock_resolve.return_value = [[{'project': PROJ_ID, 'id': _file_id(1)}]]
+
+        for _ in range(3):
+            dx_p = DXPath('dx://proj:/dir/file.txt')
+            self.assertEqual(dx_p.canonical_path, 'dx://%s:/%s' % (PROJ_ID, _file_id(1)))
+        self.assertEqual(len(mock_find_project.call_args_list), 1)
+        self.assertEqual(len(mock_resolve.call_args_list), 1)
+
+    def test_ttl(self, mock_find_project, mock_resolve):
+        mock_find_project.return_value = {'id': PROJ_ID}
+        with mock.patch('time.monotonic', return_value=100):
+            DXPath('dx://proj').canonical_project
+        with mock.patch('time.monotonic', return_value=399):
+            DXPath('dx://proj').canonical_project
+        self.assertEqual(len(mock_find_project.call_args_list), 1)
+        with mock.patch('time.monotonic', return_value=401):
+            DXPath('dx://proj').canonical_project
+        self.assertEqual(len(mock_find_project.call_args_list), 2)
+
+    def test_disabled(self, mock_find_project, mock_resolve):
+        mock_find_project.return_value = {'id': PROJ_ID}
+        with stor.settings.use({'dx': {'resolution_cache_ttl': 0}}):
+            DXPath('dx://proj').canonical_project
+            DXPath('dx://proj').canonical_project
+        self.assertEqual(len(mock_find_project.call_args_list), 2)
+
+    def test_lru_eviction(self, mock_find_project, mock_resolve):
+        with stor.settings.use({'dx': {'resolution_cache_size': 2}}):
+            dx._resolution_cache.set(('project', 'a'), 'project-a')
+            dx._resolution_cache.set(('project', 'b'), 'project-b')
+            dx._resolution_cache.get(('project', 'a'))
+            dx._resolution_cache.set(('project', 'c'), 'project-c')
+        self.assertEqual(dx._resolution_cache.get(('project', 'a')), 'project-a')
+        self.assertIsNone(dx._resolution_cache.get(('project', 'b')))
+        self.assertEqual(dx._resolution_cache.get(('project', 'c')), 'project-c')
+
+    def test_clear_cached_properties(self, mock_find_project, mock_resolve):
+        mock_find_project.return_value = {'id': PROJ_ID}
+        mock_resolve.return_value = [
+            [{'project': PROJ_ID, 'id': _file_id(1)}],
+            [{'project': PROJ_ID, 'id': _file_id(2)}],
+            [{'project': PROJ_ID, 'id': _file_id(3)}]
+        ]
+        dx.resolve_many(['dx://proj:/dir/a', 'dx://proj:/dir/sub/b', 'dx://proj:/dirc'])
+
+        DXPath('dx://proj:/dir/').clear_cached_properties()
+        self.assertEqual(dx._resolution_cache.get_many([
+            ('file', PROJ_ID, '/dir', 'a'),
+            ('file', PROJ_ID, '/dir/sub', 'b'),
+            ('file', PROJ_ID, '/', 'dirc')
+        ]), {('file', PROJ_ID, '/', 'dirc'): _file_id(3)})
+
+        DXPath('dx://%s:%s' % (PROJ_ID, _file_id(3))).clear_cached_properties()
+        self.assertIsNone(dx._resolution_cache.get(('file', PROJ_ID, '/', 'dirc')))
+        self.assertEqual(dx._resolution_cache.get(('project', 'proj')), PROJ_ID)
+
+
+@mock.patch('dxpy.resolve_data_objects', autospec=True)
+@mock.patch('dxpy.find_one_project', autospec=True)
+class TestResolveMany(unittest.TestCase):
+    def setUp(self):
+        dx._resolution_cache.clear()
+        self.addCleanup(dx._resolution_cache.clear)
+        use_cache = stor.settings.use({'dx': {'resolution_cache_ttl': 300}})
+        use_cache.__enter__()
+        self.addCleanup(use_cache.__exit__, None, None, None)
+
+    def test_batched(self, mock_find_project, mock_resolve):
+        mock_find_project.return_value = {'id': PROJ_ID}
+        mock_resolve.side_effect = lambda objects, batchsize: [
+            [{'project': PROJ_ID, 'id': _file_id(int(obj['name']))}] for obj in objects
+        ]
+        paths = ['dx://proj:/dir/%d' % i for i in range(1500)]
+        canonical = 'dx://%s:%s' % (PROJ_ID, _file_id(12))
+
+        results = dx.resolve_many(paths + [canonical, 'dx://proj:'])
+        self.assertEqual(results[:1500], [
+            'dx://%s:/%s' % (PROJ_ID, _file_id(i)) for i in range(1500)
+        ])
+        self.assertEqual(results[1500:], [canonical, 'dx://%s:/' % PROJ_ID])
+        self.assertEqual(len(mock_find_project.call_args_list), 1)
+        self.assertEqual(len(mock_resolve.call_args_list), 1)
+        self.assertEqual(mock_resolve.call_args[1]['batchsize'], 1000)
+
+        # Resolved paths are shared with new path objects
+        self.assertEqual(DXPath(paths[5]).canonical_resource, _file_id(5))
+        dx.resolve_many(paths[:10])
+        self.assertEqual(len(mock_resolve.call_args_list), 1)
+
+    def test_not_found(self, mock_find_project, mock_resolve):
+        mock_find_project.return_value = {'id': PROJ_ID}
+        mock_resolve.return_value = [[{'project': PROJ_ID, 'id': _file_id(1)}], []]
+        with pytest.raises(exceptions.NotFoundError, match='dx://proj:/b'):
+            dx.resolve_many(['dx://proj:/a', 'dx://proj:/b'])
+        # The resolved file is still cached
+        self.assertEqual(DXPath('dx://proj:/a').canonical_resource, _file_id(1))
+
+    def test_multiple_objects(self, mock_find_project, mock_resolve):
+        mock_find_project.return_value = {'id': PROJ_ID}
+        mock_resolve.return_value = [[{'project': PROJ_ID, 'id': _file_id(1)},
+                                      {'project': PROJ_ID, 'id': _file_id(2)}]]
+        with pytest.raises(dx.MultipleObjectsSameNameError, match='Multiple objects found'):
+            dx.resolve_many(['dx://proj:/a'])
+
+    def test_folder_path(self, mock_find_project, mock_resolve):
+        with pytest.raises(ValueError, match='folder path'):
+            dx.resolve_many(['dx://proj:/dir/'])
+        self.assertFalse(mock_find_project.called)
+
+
 class TestListDir(DXTestCase):
     def test_listdir_project(self):
         self.setup_temporary_project()
@@ -1462,16 +1631,19 @@ class TestCopy(DXTestCase):
         self.setup_file('/temp_folder/folder_file.txt')
         dx_p = DXPath('dx://' + self.project + ':/temp_folder/file.txt')
         obs_p = Path('swift://tenant/container/folder/file.txt')
-        with pytest.raises(ValueError, match='cannot copy'):
+        with mock.patch('stor.obs.OBSPath._stream_objects', autospec=True) as mock_stream:
             dx_p.copy(obs_p)
+        mock_stream.assert_called_once_with(dx_p, [{'source': dx_p, 'dest': obs_p}])
 
     def test_other_obs_to_dx(self):
         self.setup_temporary_project()
         self.setup_file('/temp_folder/folder_file.txt')
         dx_p = DXPath('dx://' + self.project + ':/temp_folder/file.txt')
         obs_p = Path('swift://tenant/container/folder/file.txt')
-        with pytest.raises(ValueError, match='cannot copy'):
+        with mock.patch.object(DXPath, 'isdir', autospec=True, return_value=False), \
+                mock.patch('stor.obs.OBSPath._stream_objects', autospec=True) as mock_stream:
             obs_p.copy(dx_p)
+        mock_stream.assert_called_once_with(obs_p, [{'source': obs_p, 'dest': dx_p}])
 
     def test_dx_canonical_to_dx_file(self):
         self.setup_temporary_project()
@@ -1625,16 +1797,25 @@ class TestCopyTree(DXTestCase):
         self.setup_files(['/temp_folder/folder_file.txt'])
         dx_p = DXPath('dx://' + self.project + ':/temp_folder/')
         obs_p = Path('swift://tenant/container/folder/')
-        with pytest.raises(ValueError, match='cannot copy'):
+        with mock.patch.object(DXPath, '_list_copy_entries', autospec=True,
+                               return_value=[]), \
+                mock.patch('stor.obs.OBSPath._stream_objects', autospec=True,
+                           return_value={'completed': [], 'failed': []}) as mock_stream:
             dx_p.copytree(obs_p)
+        mock_stream.assert_called_once_with(dx_p, [])
 
     def test_other_obs_to_dx(self):
         self.setup_temporary_project()
         self.setup_files(['/temp_folder/folder_file.txt'])
         dx_p = DXPath('dx://' + self.project + ':/temp_folder/')
         obs_p = Path('swift://tenant/container/folder/')
-        with pytest.raises(ValueError, match='cannot copy'):
+        with mock.patch.object(DXPath, 'isdir', autospec=True, return_value=False), \
+                mock.patch.object(type(obs_p), '_list_copy_entries', autospec=True,
+                                  return_value=[]), \
+                mock.patch('stor.obs.OBSPath._stream_objects', autospec=True,
+                           return_value={'completed': [], 'failed': []}) as mock_stream:
             obs_p.copytree(dx_p)
+        mock_stream.assert_called_once_with(obs_p, [])
 
     def test_dx_dir_to_dx_dir(self):
         self.setup_temporary_project()
@@ -1823,7 +2004,8 @@ class TestUpload(DXTestCase):
         files_to_upload.append(stor.obs.OBSUploadObject(posix_p / 'file.txt', '/folder/file2.txt'))
         with LogCapture('stor.dx') as log:
             dx_folder_p.upload(files_to_upload)
-            assert 'will not cause duplicate file objects' in log.records[-1].getMessage()
+            assert any('will not cause duplicate file objects' in record.getMessage()
+                       for record in log.records)
 
         dx_p = DXPath('dx://' + self.project + ':/folder/file2.txt')
         self.assertTrue(dx_p.exists())
@@ -1831,6 +2013,120 @@ class TestUpload(DXTestCase):
             self.assertEqual(uploaded_file.read(), 'data')
 
 
+class TestWriteObject(unittest.TestCase):
+    @mock.patch.object(DXPath, 'isfile', autospec=True, return_value=False)
+    @mock.patch('dxpy.upload_string', autospec=True)
+    def test_upload_kwargs_not_passed(self, mock_upload_string, mock_isfile):
+        dx_p = DXPath('dx://%s:/dir/file.txt' % PROJ_ID)
+        dx_p.write_object(b'data', some_upload_option=True)
+        mock_upload_string.assert_called_once_with(b'data', project=PROJ_ID, folder='/dir',
+                                                   parents=True, name='file.txt')
+
+
+@mock.patch('dxpy.upload_local_file', autospec=True)
+@mock.patch('dxpy.resolve_data_objects', autospec=True)
+class TestUploadConcurrent(unittest.TestCase):
+    def setUp(self):
+        self.tmp_d = stor.NamedTemporaryDirectory()
+        self.tmp_dir = self.tmp_d.__enter__()
+        self.addCleanup(self.tmp_d.__exit__, None, None, None)
+        for name in ('a.txt', 'b.txt', 'sub/c.txt'):
+            (self.tmp_dir / name).parent.makedirs_p()
+            with open(self.tmp_dir / name, 'w') as fp:
+                fp.write('data')
+
+    def test_upload_skips_existing(self, mock_resolve, mock_upload):
+        mock_resolve.side_effect = lambda objects, batchsize: [
+            [{'project': PROJ_ID, 'id': _file_id(1)}] if obj['name'] == 'b.txt' else []
+            for obj in objects
+        ]
+        dx_p = DXPath('dx://%s:/dest' % PROJ_ID)
+        with stor.settings.use({'dx:upload': {'object_threads': 2}}):
+            with LogCapture('stor.dx') as log:
+                dx_p.upload([
+                    stor.obs.OBSUploadObject(self.tmp_dir / 'a.txt', 'dest/a.txt'),
+                    stor.obs.OBSUploadObject(self.tmp_dir / 'b.txt', 'dest/b.txt'),
+                    stor.obs.OBSUploadObject(self.tmp_dir / 'sub/c.txt', 'dest/sub/c.txt'),
+                    stor.obs.OBSUploadObject(self.tmp_dir / 'a.txt', 'dest/sub/c.txt')
+                ])
+
+        # The destinations are resolved with one batched call
+        mock_resolve.assert_called_once_with(objects=[
+            {'project': PROJ_ID, 'folder': '/dest', 'name': 'a.txt'},
+            {'project': PROJ_ID, 'folder': '/dest', 'name': 'b.txt'},
+            {'project': PROJ_ID, 'folder': '/dest/sub', 'name': 'c.txt'}
+        ], batchsize=1000)
+        self.assertEqual(sorted((c[1]['folder'], c[1]['name'], c[1]['filename'])
+                                for c in mock_upload.call_args_list), [
+            ('/dest', 'a.txt', self.tmp_dir / 'a.txt'),
+            ('/dest/sub', 'c.txt', self.tmp_dir / 'sub/c.txt')
+        ])
+        messages = [record.getMessage() for record in log.records]
+        self.assertEqual(len([m for m in messages if 'will not cause duplicate' in m]), 2)
+        self.assertIn('starting upload of 2 objects', messages)
+        self.assertTrue(messages[-1].startswith('upload complete - 2/2'))
+
+    def test_upload_directory(self, mock_resolve, mock_upload):
+        mock_resolve.side_effect = lambda objects, batchsize: [[] for _ in objects]
+        dx_p = DXPath('dx://%s:/dest' % PROJ_ID)
+        with NamedTemporaryDirectory(change_dir=True):
+            os.makedirs('dir/sub')
+            for name in ('dir/a.txt', 'dir/sub/b.txt'):
+                with open(name, 'w') as fp:
+                    fp.write('data')
+            dx_p.upload(['dir'])
+
+        self.assertEqual(sorted((c[1]['folder'], c[1]['name'])
+                                for c in mock_upload.call_args_list), [
+            ('/dest/dir', 'a.txt'),
+            ('/dest/dir/sub', 'b.txt')
+        ])
+
+    def test_upload_error(self, mock_resolve, mock_upload):
+        mock_resolve.return_value = [[]]
+        mock_upload.side_effect = dxpy.exceptions.DXError('upload failed')
+        dx_p = DXPath('dx://%s:/dest' % PROJ_ID)
+        with pytest.raises(dx.DNAnexusError, match='upload failed'):
+            dx_p.upload([stor.obs.OBSUploadObject(self.tmp_dir / 'a.txt', 'dest/a.txt')])
+
+    def test_missing_source(self, mock_resolve, mock_upload):
+        dx_p = DXPath('dx://%s:/dest' % PROJ_ID)
+        with pytest.raises(exceptions.NotFoundError, match='does not exist'):
+            dx_p.upload([stor.obs.OBSUploadObject(self.tmp_dir / 'missing', 'dest/missing')])
+        self.assertFalse(mock_upload.called)
+
+
+@mock.patch('dxpy.api.project_remove_folder', autospec=True)
+@mock.patch('dxpy.api.project_remove_objects', autospec=True)
+@mock.patch('dxpy.api.project_list_folder', autospec=True)
+@mock.patch('dxpy.find_data_objects', autospec=True)
+class TestRmtreeProjectConcurrent(unittest.TestCase):
+    def test_rmtree_project_batches(self, mock_find, mock_list, mock_remove_objects,
+                                    mock_remove_folder):
+        file_ids = ['file-%024d' % i for i in range(2500)]
+        mock_find.return_value = iter({'id': file_id} for file_id in file_ids)
+        mock_list.return_value = {'folders': ['/a', '/b'], 'objects': []}
+        mock_remove_folder.return_value = {'completed': True}
+        with stor.settings.use({'dx:delete': {'object_threads': 2}}):
+            DXPath('dx://%s:' % PROJ_ID).rmtree()
+
+        mock_find.assert_called_once_with(project=PROJ_ID, folder='/', recurse=True)
+        removed = [c[0][1]['objects'] for c in mock_remove_objects.call_args_list]
+        self.assertEqual(sorted(len(batch) for batch in removed), [500, 1000, 1000])
+        self.assertEqual(sorted(sum(removed, [])), file_ids)
+        self.assertEqual(sorted(c[0][1]['folder'] for c in mock_remove_folder.call_args_list),
+                         ['/a', '/b'])
+
+    def test_rmtree_project_errors(self, mock_find, mock_list, mock_remove_objects,
+                                   mock_remove_folder):
+        mock_find.return_value = iter([{'id': 'file-%024d' % 0}])
+        mock_list.return_value = {'folders': ['/a', '/b'], 'objects': []}
+        mock_remove_folder.side_effect = dxpy.exceptions.DXError('remove failed')
+        with pytest.raises(dx.DNAnexusError, match='2 error'):
+            DXPath('dx://%s:' % PROJ_ID).rmtree()
+        self.assertEqual(mock_remove_objects.call_count, 1)
+
+
 class TestGetSize(DXTestCase):
     def test_project(self):
         self.setup_temporary_project()
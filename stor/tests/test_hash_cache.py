@@ -0,0 +1,124 @@
+import hashlib
+import os
+import unittest
+from unittest import mock
+
+from stor import hash_cache
+from stor import NamedTemporaryDirectory
+from stor import Path
+from stor import settings
+from stor.obs import OBSListEntry
+
+
+def _md5(data):
+    return hashlib.md5(data).hexdigest()
+
+
+class HashCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        tmp_d = NamedTemporaryDirectory()
+        self.tmp_d = tmp_d.__enter__()
+        self.addCleanup(tmp_d.__exit__, None, None, None)
+        self.data = b'a' * 10 + b'b' * 10 + b'c' * 5
+        self.file_name = self.write_file('file', self.data)
+        self.cache = hash_cache.HashCache(self.tmp_d / 'cache' / 'hashes.sqlite',
+                                          max_entries=6)
+
+    def write_file(self, name, data):
+        with open(self.tmp_d / name, 'wb') as fp:
+            fp.write(data)
+        return self.tmp_d / name
+
+
+class TestGetFileHashes(HashCacheTestCase):
+    def test_hashes(self):
+        self.assertEquals(hash_cache.get_file_hashes(self.file_name), {'md5': _md5(self.data)})
+
+        part_md5s = [hashlib.md5(part) for part in (b'a' * 10, b'b' * 10, b'c' * 5)]
+        self.assertEquals(hash_cache.get_file_hashes(self.file_name, 10), {
+            'md5': _md5(self.data),
+            's3': _md5(b''.join(m.digest() for m in part_md5s)) + '-3',
+            'swift': _md5(''.join(m.hexdigest() for m in part_md5s).encode())
+        })
+
+    def test_cached(self):
+        hashes = hash_cache.get_file_hashes(self.file_name, 10, cache=self.cache)
+        self.assertEquals(len(self.cache), 3)
+
+        with mock.patch.object(hash_cache, '_hash_file', autospec=True) as mock_hash_file:
+            self.assertEquals(hash_cache.get_file_hashes(self.file_name, 10, cache=self.cache),
+                              hashes)
+            self.assertEquals(hash_cache.get_file_hashes(self.file_name, cache=self.cache),
+                              {'md5': hashes['md5']})
+        self.assertFalse(mock_hash_file.called)
+
+        # Changing the file changes its key
+        self.write_file('file', b'changed')
+        self.assertEquals(hash_cache.get_file_hashes(self.file_name, cache=self.cache),
+                          {'md5': _md5(b'changed')})
+
+    def test_eviction(self):
+        with mock.patch.object(hash_cache, '_EVICT_INTERVAL', 1):
+            for i in range(4):
+                hash_cache.get_file_hashes(self.write_file('file%s' % i, b'data' * (i + 1)), 10,
+                                           cache=self.cache)
+        self.assertEquals(len(self.cache), 6)
+
+    def test_prune(self):
+        for i in range(2):
+            hash_cache.get_file_hashes(self.write_file('file%s' % i, b'data'), cache=self.cache)
+        os.remove(self.tmp_d / 'file0')
+        self.assertEquals(self.cache.prune(), 1)
+        self.assertEquals(len(self.cache), 1)
+        self.assertEquals(self.cache.prune(max_age=0), 1)
+        self.assertEquals(len(self.cache), 0)
+
+    def test_get_cache(self):
+        cache_path = self.tmp_d / 'other' / 'hashes.sqlite'
+        with settings.use({'stor:hash_cache': {'enabled': True, 'path': cache_path}}):
+            cache = hash_cache.get_cache()
+            self.assertEquals(cache.path, cache_path)
+            self.assertIs(hash_cache.get_cache(), cache)
+            self.assertEquals(hash_cache.prune(), 0)
+        with settings.use({'stor:hash_cache': {'enabled': False}}):
+            self.assertIsNone(hash_cache.get_cache())
+
+    def test_get_cache_unavailable(self):
+        self.write_file('not_a_dir', b'')
+        with settings.use({'stor:hash_cache': {'path': self.tmp_d / 'not_a_dir' / 'hashes'}}):
+            self.assertIsNone(hash_cache.get_cache())
+
+
+class TestEtagMatches(HashCacheTestCase):
+    def assert_etag_matches(self, path, etag, segment_size=100, matches=True):
+        entry = OBSListEntry(Path(path), size=len(self.data), etag=etag)
+        self.assertEquals(hash_cache.etag_matches(self.file_name, entry, segment_size,
+                                                  cache=self.cache),
+                          matches)
+
+    def test_md5(self):
+        self.assert_etag_matches('s3://bucket/file', _md5(self.data))
+        self.assert_etag_matches('swift://tenant/container/file', _md5(self.data))
+        self.assert_etag_matches('s3://bucket/file', _md5(b'other'), matches=False)
+
+    def test_s3_multipart(self):
+        parts_md5 = hashlib.md5(b''.join(hashlib.md5(part).digest()
+                                         for part in (b'a' * 10, b'b' * 10, b'c' * 5)))
+        self.assert_etag_matches('s3://bucket/file', parts_md5.hexdigest() + '-3',
+                                 segment_size=10)
+        self.assert_etag_matches('s3://bucket/file', parts_md5.hexdigest() + '-4',
+                                 segment_size=10, matches=False)
+
+    def test_s3_multipart_other_part_size(self):
+        # Parts of a single MiB hold the whole file
+        parts_md5 = hashlib.md5(hashlib.md5(self.data).digest())
+        self.assert_etag_matches('s3://bucket/file', parts_md5.hexdigest() + '-1',
+                                 segment_size=10)
+
+    def test_swift_static_large_object(self):
+        slo_etag = _md5(''.join(_md5(part) for part in (b'a' * 10, b'b' * 10, b'c' * 5))
+                        .encode())
+        self.assert_etag_matches('swift://tenant/container/file', '"%s"' % slo_etag,
+                                 segment_size=10)
+        self.assert_etag_matches('swift://tenant/container/file', _md5(self.data),
+                                 segment_size=10)
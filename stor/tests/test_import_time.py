@@ -0,0 +1,77 @@
+import os
+import subprocess
+import sys
+import unittest
+
+import stor
+
+BACKEND_MODULES = ('boto3', 'botocore', 'dxpy', 'swiftclient', 'stor.s3', 'stor.swift', 'stor.dx')
+
+
+def import_times(code):
+    """Runs code in a new interpreter with ``-X importtime``
+
+    Returns:
+        dict: The cumulative import time (in microseconds) of every imported module
+    """
+    env = dict(os.environ)
+    package_dir = os.path.dirname(os.path.dirname(os.path.abspath(stor.__file__)))
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [package_dir, env.get('PYTHONPATH')]))
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          universal_newlines=True, env=env, check=True)
+    times = {}
+    for line in proc.stderr.splitlines():
+        if line.startswith('import time:') and 'cumulative' not in line:
+            _, cumulative, name = line[len('import time:'):].split('|')
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def imported_backends(times):
+    return sorted(
+        name for name in times
+        if any(name == mod or name.startswith(mod + '.') for mod in BACKEND_MODULES)
+    )
+
+
+class TestImportTime(unittest.TestCase):
+    def test_import_stor(self):
+        times = import_times('import stor')
+        self.assertIn('stor', times)
+        self.assertEqual(imported_backends(times), [], 'import stor took %sus' % times['stor'])
+        self.assertNotIn('importlib.metadata', times)
+
+    def test_posix_path(self):
+        times = import_times('import stor; stor.Path("/tmp/file").exists()')
+        self.assertEqual(imported_backends(times), [])
+
+    def test_cli_parser(self):
+        times = import_times('import stor.cli; stor.cli.create_parser()')
+        self.assertEqual(imported_backends(times), [],
+                         'import stor.cli took %sus' % times['stor.cli'])
+
+    def test_backend_imported_on_use(self):
+        times = import_times('import stor; stor.Path("s3://bucket/key")')
+        self.assertIn('boto3', times)
+        self.assertNotIn('dxpy', times)
+        self.assertNotIn('swiftclient', times)
+
+        times = import_times('import stor; stor.Path("swift://tenant/container/key")')
+        self.assertIn('swiftclient', times)
+        self.assertNotIn('boto3', times)
+        self.assertNotIn('dxpy', times)
+
+        times = import_times('import stor; stor.Path("dx://project:/file")')
+        self.assertIn('dxpy', times)
+        self.assertNotIn('boto3', times)
+
+    def test_write_without_dx(self):
+        times = import_times('\n'.join([
+            'from unittest import mock',
+            'import stor',
+            'with mock.patch("stor.s3.S3Path.write_object", autospec=True):',
+            '    with stor.open("s3://bucket/key.txt", "w") as f:',
+            '        f.write("data")',
+        ]))
+        self.assertNotIn('stor.dx', times)
@@ -0,0 +1,111 @@
+import threading
+import unittest
+
+from testfixtures import LogCapture
+
+from stor import exceptions
+from stor import obs
+from stor import settings
+
+
+class TestBufferPool(unittest.TestCase):
+    def test_reserve(self):
+        pool = obs._BufferPool(10)
+        with pool.reserve(4):
+            with pool.reserve(6):
+                self.assertEquals(pool._reserved, 10)
+        self.assertEquals(pool._reserved, 0)
+
+    def test_reserve_more_than_max_bytes(self):
+        pool = obs._BufferPool(10)
+        with pool.reserve(20):
+            self.assertEquals(pool._reserved, 20)
+        self.assertEquals(pool._reserved, 0)
+
+    def test_reserve_waits_for_release(self):
+        pool = obs._BufferPool(10)
+        reserved = threading.Event()
+
+        def reserve():
+            with pool.reserve(6):
+                reserved.set()
+
+        with pool.reserve(6):
+            thread = threading.Thread(target=reserve)
+            thread.start()
+            self.assertFalse(reserved.wait(0.1))
+        thread.join(5)
+        self.assertTrue(reserved.is_set())
+        self.assertEquals(pool._reserved, 0)
+
+
+class TestGetBufferPool(unittest.TestCase):
+    def setUp(self):
+        obs._buffer_pool = None
+        self.addCleanup(setattr, obs, '_buffer_pool', None)
+
+    def test_shared(self):
+        pool = obs._get_buffer_pool()
+        self.assertEquals(pool.max_bytes, settings.get_section('stor:transfer')['max_memory'])
+        pools = []
+        thread = threading.Thread(target=lambda: pools.append(obs._get_buffer_pool()))
+        thread.start()
+        thread.join()
+        self.assertIs(pools[0], pool)
+        self.assertIs(obs._get_buffer_pool(), pool)
+
+    def test_max_memory_changed(self):
+        with settings.use({'stor:transfer': {'max_memory': '1M'}}):
+            pool = obs._get_buffer_pool()
+        with settings.use({'stor:transfer': {'max_memory': '2M'}}):
+            self.assertIsNot(obs._get_buffer_pool(), pool)
+            self.assertEquals(obs._get_buffer_pool().max_bytes, 2 * 1024 ** 2)
+
+
+class TestRunTransfers(unittest.TestCase):
+    def test_completed(self):
+        def worker(source, dest):
+            return {'source': source, 'dest': dest, 'size': 1024 ** 2, 'success': True}
+
+        objects = [{'source': 's3://a/%s' % i, 'dest': 's3://b/%s' % i} for i in range(2)]
+        with LogCapture('stor.obs.progress') as progress_log:
+            copied = obs._run_transfers(worker, objects, 2)
+        self.assertEquals(sorted(result['dest'] for result in copied['completed']),
+                          ['s3://b/0', 's3://b/1'])
+        self.assertEquals(copied['failed'], [])
+        self.assertEquals(progress_log.records[0].getMessage(), 'starting copy of 2 objects')
+        self.assertTrue(progress_log.records[-1].getMessage().startswith(
+            'copy complete - 2/2\t'))
+
+    def test_failed(self):
+        def worker(source, dest):
+            return {'source': source, 'dest': dest, 'size': None, 'success': dest != 'bad'}
+
+        objects = [{'source': 'a', 'dest': 'good'}, {'source': 'b', 'dest': 'bad'}]
+        with self.assertRaisesRegex(exceptions.FailedTransferError, 'bad'):
+            obs._run_transfers(worker, objects, 2)
+
+    def test_exception(self):
+        def worker(source, dest):
+            raise ValueError('broken')
+
+        with self.assertRaisesRegex(exceptions.FailedTransferError, 'copy object a: broken'):
+            obs._run_transfers(worker, [{'source': 'a', 'dest': 'b'}], 1)
+
+
+class TestIterShardsParallel(unittest.TestCase):
+    def list_shard(self, shard):
+        """Lists two results of a shard at a time"""
+        start, end = shard
+        rest = (start + 2, end) if start + 2 < end else None
+        return list(range(start, min(start + 2, end))), rest
+
+    def test_rest_of_shard_listed_next(self):
+        shards = [(0, 5), (5, 6), (6, 10)]
+        pages = list(obs._iter_shards_parallel(self.list_shard, shards, 2))
+        self.assertEquals(pages, [[0, 1], [2, 3], [4], [5], [6, 7], [8, 9]])
+
+    def test_limit(self):
+        shards = [(0, 5), (5, 10)]
+        pages = list(obs._iter_shards_parallel(self.list_shard, shards, 2, limit=3))
+        self.assertEquals(pages, [[0, 1], [2]])
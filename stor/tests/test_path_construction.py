@@ -0,0 +1,100 @@
+import ntpath
+import unittest
+from unittest import mock
+
+from stor import base
+from stor import Path
+from stor import test
+from stor import utils
+from stor.dx import DXCanonicalPath
+from stor.dx import DXVirtualPath
+from stor.posix import PosixPath
+from stor.s3 import S3Path
+from stor.swift import SwiftPath
+from stor.windows import WindowsPath
+
+PROJ_ID = 'project-' + 'a' * 24
+FILE_ID = 'file-' + 'b' * 24
+
+
+class TestDispatch(unittest.TestCase):
+    def test_obs_paths(self):
+        self.assertIsInstance(Path('s3://bucket/key'), S3Path)
+        self.assertIsInstance(Path('swift://tenant/container/key'), SwiftPath)
+        self.assertIsInstance(Path('dx://project:/folder/file'), DXVirtualPath)
+        self.assertIsInstance(Path('dx://%s:/%s' % (PROJ_ID, FILE_ID)), DXCanonicalPath)
+        self.assertIsInstance(Path('dx://%s:' % PROJ_ID), DXCanonicalPath)
+
+    def test_filesystem_paths(self):
+        self.assertIsInstance(Path('/tmp/s3://bucket'), PosixPath)
+        self.assertIsInstance(Path('file://tmp'), PosixPath)
+        with mock.patch('os.path', ntpath):
+            self.assertIsInstance(Path(r'C:\tmp'), WindowsPath)
+
+    def test_invalid_dx_paths(self):
+        with self.assertRaisesRegex(ValueError, 'Project is required'):
+            Path('dx://')
+        with self.assertRaisesRegex(ValueError, 'ambiguous'):
+            Path('dx://%s:/%s/' % (PROJ_ID, FILE_ID))
+
+    def test_dx_class_decision_cached(self):
+        utils._find_dx_class.cache_clear()
+        with mock.patch.object(utils, 'is_valid_dxid', autospec=True,
+                               side_effect=utils.is_valid_dxid) as mock_valid:
+            paths = [Path('dx://%s:/folder/file%s' % (PROJ_ID, i)) for i in range(100)]
+        self.assertTrue(all(type(p) is DXVirtualPath for p in paths))
+        self.assertEqual(mock_valid.call_count, 2)
+
+    def test_from_validated(self):
+        p = S3Path._from_validated('s3://bucket/key')
+        self.assertIs(type(p), S3Path)
+        self.assertEqual(p, S3Path('s3://bucket/key'))
+        self.assertEqual(p.resource, 'key')
+
+
+class TestConstructionCost(unittest.TestCase):
+    """Guards against regressions in the cost of building many paths (e.g. from listings)
+    by checking the work done for each path rather than timing it.
+    """
+    paths = [
+        's3://bucket/prefix/key%s',
+        'swift://tenant/container/key%s',
+        'dx://project:/folder/file%s',
+        '/folder/file%s',
+    ]
+
+    def test_dispatch_without_path_helpers(self):
+        helpers = ('is_dx_path', 'is_swift_path', 'is_s3_path', 'is_obs_path',
+                   'is_filesystem_path')
+        patchers = [mock.patch.object(utils, name, autospec=True) for name in helpers]
+        mocks = [patcher.start() for patcher in patchers]
+        for patcher in patchers:
+            self.addCleanup(patcher.stop)
+
+        for fmt in self.paths:
+            [Path(fmt % i) for i in range(100)]
+        for helper in mocks:
+            self.assertFalse(helper.called)
+
+    def test_classes_imported_once(self):
+        for fmt in self.paths:
+            Path(fmt % 0)
+        with mock.patch('importlib.import_module', autospec=True) as mock_import:
+            for fmt in self.paths:
+                [Path(fmt % i) for i in range(100)]
+        self.assertFalse(mock_import.called)
+
+
+class TestListingConstruction(test.S3TestCase):
+    def test_s3_listing_skips_dispatch(self):
+        self.mock_s3_iterator.__iter__.return_value = [{
+            'Contents': [{'Key': 'prefix/key%s' % i} for i in range(100)],
+            'CommonPrefixes': [{'Prefix': 'prefix/dir/'}],
+            'IsTruncated': False
+        }]
+        with mock.patch.object(base, '_get_path_class', autospec=True,
+                               side_effect=base._get_path_class) as mock_get_class:
+            results = S3Path('s3://bucket/prefix').list(list_as_dir=True)
+        self.assertEqual(len(results), 101)
+        self.assertTrue(all(type(p) is S3Path for p in results))
+        self.assertFalse(mock_get_class.called)
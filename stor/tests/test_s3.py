@@ -1,6 +1,7 @@
+from concurrent.futures import ThreadPoolExecutor
 import datetime
+import hashlib
 import ntpath
-from tempfile import NamedTemporaryFile
 import unittest
 
 from boto3.exceptions import RetriesExceededError
@@ -13,13 +14,16 @@ from testfixtures import LogCapture
 import stor
 from stor import exceptions
 from stor import NamedTemporaryDirectory
+from stor.obs import OBSListEntry
 from stor.obs import OBSUploadObject
 from stor import Path
 from stor import settings
 from stor import s3
 from stor.s3 import S3Path
+from stor.swift import SwiftPath
 from stor.test import MockExecutor, S3TestCase
 from stor.tests.shared_obs import SharedOBSFileCases
+from stor.tests.shared_obs import SharedOBSStreamFileCases
 from stor import utils
 
 
@@ -119,22 +123,89 @@ class TestResource(unittest.TestCase):
         self.assertEquals(s3_p.resource, 'nested/dir/')
 
 
-@mock.patch('stor.s3._thread_local', mock.Mock())
 class TestGetS3Client(S3TestCase):
     def test_get_s3_client_exists(self):
-        s3._thread_local.s3_client = 'client'
         self.disable_get_s3_client_mock()
         client = s3._get_s3_client()
-        self.assertEquals(client, 'client')
-        del s3._thread_local.s3_client
+        self.assertIs(s3._get_s3_client(), client)
+        self.assertEqual(len(self.mock_s3_session.call_args_list), 1)
 
     def test_get_s3_client_none(self):
         self.disable_get_s3_client_mock()
         client = s3._get_s3_client()
         self.assertEqual(len(self.mock_s3_session.call_args_list), 1)
-        self.mock_s3_session.return_value.client.assert_called_once_with('s3')
+        self.mock_s3_session.return_value.client.assert_called_once_with(
+            's3', config=mock.ANY)
+        config = self.mock_s3_session.return_value.client.call_args[1]['config']
+        self.assertEquals(config.max_pool_connections, 100)
         self.assertEquals(client, self.mock_s3_session.return_value.client.return_value)
 
+    def test_get_s3_client_pool_size(self):
+        self.disable_get_s3_client_mock()
+        with settings.use({'s3:upload': {'object_threads': 8, 'segment_threads': 4},
+                           's3:download': {'object_threads': 2, 'segment_threads': 3}}):
+            s3._get_s3_client()
+        config = self.mock_s3_session.return_value.client.call_args[1]['config']
+        self.assertEquals(config.max_pool_connections, 32)
+
+    def test_get_s3_client_shared_across_threads(self):
+        self.disable_get_s3_client_mock()
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            clients = list(executor.map(lambda i: s3._get_s3_client(), range(50)))
+        self.assertEqual(len(set(id(client) for client in clients)), 1)
+        self.assertEqual(len(self.mock_s3_session.call_args_list), 1)
+
+    def test_get_s3_client_rebuilt_on_settings_change(self):
+        self.disable_get_s3_client_mock()
+        s3._get_s3_client()
+        with settings.use({'s3': {'region_name': 'us-west-2'}}):
+            s3._get_s3_client()
+            s3._get_s3_client()
+        # Unrelated settings changes do not rebuild the client
+        with settings.use({'swift': {'num_retries': 3}}):
+            s3._get_s3_client()
+        self.assertEqual(self.mock_s3_session.call_args_list, [
+            mock.call(),
+            mock.call(region_name='us-west-2'),
+            mock.call()
+        ])
+
+    def test_get_s3_transfer_follows_client(self):
+        s3._get_s3_transfer()
+        s3._get_s3_transfer()
+        self.assertEqual(len(self.mock_get_s3_transfer.call_args_list), 1)
+        self.mock_get_s3_client.return_value = mock.Mock()
+        s3._get_s3_transfer()
+        self.assertEqual(self.mock_get_s3_transfer.call_args_list, [
+            mock.call(self.mock_s3, config=None),
+            mock.call(self.mock_get_s3_client.return_value, config=None)
+        ])
+
+
+class TestS3ClientBenchmark(S3TestCase):
+    """Measures the per-object client overhead of transferring many small files"""
+    num_objects = 200
+
+    def setUp(self):
+        super(TestS3ClientBenchmark, self).setUp()
+        self.disable_get_s3_client_mock()
+
+    def test_many_small_uploads(self):
+        with NamedTemporaryDirectory(change_dir=True):
+            for i in range(self.num_objects):
+                with open('file%s' % i, 'w') as f:
+                    f.write('small')
+            with settings.use({'s3:upload': {'object_threads': 10}}):
+                S3Path('s3://bucket/path').upload(['.'])
+
+        self.assertEqual(
+            len(self.mock_s3_transfer.upload_file.call_args_list),
+            self.num_objects)
+        # A single session and client serve every object on every worker thread,
+        # instead of one session, credential lookup and connection pool per thread
+        self.assertEqual(len(self.mock_s3_session.call_args_list), 1)
+        self.assertEqual(len(self.mock_s3_session.return_value.client.call_args_list), 1)
+
 
 class TestGetS3Iterator(S3TestCase):
     def test_get_s3_iterator(self):
@@ -429,6 +500,244 @@ class TestList(S3TestCase):
             's3://test-bucket/pre/key3'
         ])
 
+    def test_list_with_metadata(self):
+        modified = datetime.datetime(2018, 1, 2, 3, 4, 5)
+        self.mock_s3_iterator.__iter__.return_value = [{
+            'Contents': [{
+                'Key': 'prefix/key1',
+                'Size': 10,
+                'ETag': '"abc123"',
+                'LastModified': modified,
+                'StorageClass': 'STANDARD'
+            }],
+            'CommonPrefixes': [{'Prefix': 'prefix/dir/'}],
+            'IsTruncated': False
+        }]
+        s3_p = S3Path('s3://test-bucket/prefix')
+        results = s3_p.list(with_metadata=True, list_as_dir=True,
+                            condition=lambda results: results == [
+                                's3://test-bucket/prefix/key1',
+                                's3://test-bucket/prefix/dir/'
+                            ])
+
+        self.assertEquals(results, [
+            OBSListEntry(S3Path('s3://test-bucket/prefix/key1'), size=10, etag='abc123',
+                         last_modified=modified, storage_class='STANDARD'),
+            OBSListEntry(S3Path('s3://test-bucket/prefix/dir/'))
+        ])
+        self.assertIsInstance(results[0].path, S3Path)
+        with self.assertRaises(AttributeError):
+            results[0].owner = 'me'
+
+
+class TestListIter(S3TestCase):
+    def test_list_iter_yields_pages_lazily(self):
+        pages_fetched = []
+
+        def pages():
+            for i in range(3):
+                pages_fetched.append(i)
+                yield {
+                    'Contents': [{'Key': 'p%s/key%s' % (i, j)} for j in range(2)],
+                    'IsTruncated': i < 2
+                }
+
+        self.mock_s3_iterator.__iter__.side_effect = pages
+        s3_p = S3Path('s3://test-bucket')
+        results = s3_p.list_iter()
+        self.assertEquals(pages_fetched, [])
+
+        self.assertEquals(next(results), 's3://test-bucket/p0/key0')
+        self.assertEquals(next(results), 's3://test-bucket/p0/key1')
+        self.assertEquals(pages_fetched, [0])
+        self.assertEquals(next(results), 's3://test-bucket/p1/key0')
+        self.assertEquals(pages_fetched, [0, 1])
+        # stopping early never fetches the last page
+        results.close()
+        self.assertEquals(pages_fetched, [0, 1])
+
+    def test_list_iter_args(self):
+        self.mock_s3_iterator.__iter__.return_value = [{
+            'Contents': [{'Key': 'prefix/pre/key1'}, {'Key': 'prefix/pre/dir/'}],
+            'CommonPrefixes': [{'Prefix': 'prefix/pre/p2/'}],
+            'IsTruncated': False
+        }]
+        s3_p = S3Path('s3://test-bucket/prefix')
+        results = list(s3_p.list_iter(starts_with='pre', limit=10,
+                                      list_as_dir=True, ignore_dir_markers=True))
+        self.assertEquals(results, [
+            's3://test-bucket/prefix/pre/key1',
+            's3://test-bucket/prefix/pre/p2/'
+        ])
+        self.mock_get_s3_iterator.assert_called_once_with(
+            s3_p, 'list_objects_v2',
+            Bucket='test-bucket',
+            Prefix='prefix/pre/',
+            Delimiter='/',
+            PaginationConfig={'MaxItems': 10})
+
+    def test_list_iter_condition(self):
+        self.mock_s3_iterator.__iter__.return_value = [{
+            'Contents': [{'Key': 'key1'}],
+            'IsTruncated': True
+        }, {
+            'Contents': [{'Key': 'key2'}],
+            'IsTruncated': False
+        }]
+        s3_p = S3Path('s3://test-bucket')
+        results = list(s3_p.list_iter(condition=lambda results: len(results) == 2))
+        self.assertEquals(results, ['s3://test-bucket/key1', 's3://test-bucket/key2'])
+
+        results = s3_p.list_iter(condition=lambda results: len(results) == 3)
+        self.assertEquals(next(results), 's3://test-bucket/key1')
+        self.assertEquals(next(results), 's3://test-bucket/key2')
+        with self.assertRaises(exceptions.ConditionNotMetError):
+            next(results)
+
+    def test_list_iter_incremental_condition(self):
+        self.mock_s3_iterator.__iter__.return_value = [{
+            'Contents': [{'Key': 'key1'}],
+            'IsTruncated': True
+        }, {
+            'Contents': [{'Key': 'key2'}],
+            'IsTruncated': False
+        }]
+        condition = utils.ManifestCondition(['key1', 'key2', 'key3'])
+        results = S3Path('s3://test-bucket').list_iter(with_metadata=True, condition=condition)
+        self.assertEquals(next(results).path, 's3://test-bucket/key1')
+        # The condition is updated as each page arrives
+        self.assertEquals(condition.missing, {'key2', 'key3'})
+        self.assertEquals(next(results).path, 's3://test-bucket/key2')
+        with self.assertRaises(exceptions.ConditionNotMetError):
+            next(results)
+
+    def test_list_iter_invalid_kwargs(self):
+        with self.assertRaises(TypeError):
+            S3Path('s3://test-bucket').list_iter(use_manifest=True)
+
+    def test_list_iter_error(self):
+        self.mock_s3_iterator.__iter__.side_effect = ClientError(
+            {
+                'ResponseMetadata': {'HTTPStatusCode': 404},
+                'Error': {'Message': 'The specified bucket does not exist'}
+            },
+            'list_objects_v2')
+        with self.assertRaises(exceptions.NotFoundError):
+            list(S3Path('s3://bucket/key').list_iter())
+
+
+class TestListParallel(S3TestCase):
+    keys = [
+        'a', 'dir1/a', 'dir1/b', 'dir1/sub/', 'dir1/sub/c', 'dir2/a', 'dir2/b',
+        'dir3/nested/a', 'file', 'zdir/a'
+    ]
+
+    def setUp(self):
+        super(TestListParallel, self).setUp()
+        self.mock_get_s3_iterator.side_effect = self.list_pages
+
+    def list_pages(self, s3_path, method_name, Bucket, Prefix, Delimiter=None,
+                   StartAfter=None, PaginationConfig=None):
+        """Lists self.keys like list_objects_v2, with one key or prefix per page"""
+        entries = []
+        for key in self.keys:
+            if not key.startswith(Prefix) or (StartAfter and key <= StartAfter):
+                continue
+            rest = key[len(Prefix):]
+            if Delimiter and Delimiter in rest:
+                common_prefix = Prefix + rest.split(Delimiter)[0] + Delimiter
+                if {'CommonPrefixes': [{'Prefix': common_prefix}]} not in entries:
+                    entries.append({'CommonPrefixes': [{'Prefix': common_prefix}]})
+            else:
+                entries.append({'Contents': [{'Key': key}]})
+        return [dict(entry, IsTruncated=i < len(entries) - 1) for i, entry in enumerate(entries)]
+
+    def test_list_parallel_ordered(self):
+        s3_p = S3Path('s3://bucket')
+        expected = [s3_p / key for key in self.keys]
+        for parallel in (2, 3, 8, 50):
+            self.assertEquals(s3_p.list(parallel=parallel), expected)
+
+        self.assertEquals(list(s3_p.list_iter(parallel=4, ignore_dir_markers=True)),
+                          [s3_p / key for key in self.keys if key != 'dir1/sub/'])
+
+    def test_list_parallel_discovery(self):
+        s3_p = S3Path('s3://bucket')
+        s3_p.list(parallel=3)
+        # The top level had 3 common prefixes, so only one discovery listing was needed
+        self.assertEquals(self.mock_get_s3_iterator.call_args_list[0],
+                          mock.call(s3_p, 'list_objects_v2', Bucket='bucket', Prefix='',
+                                    Delimiter='/'))
+        listed_prefixes = sorted(call[1]['Prefix']
+                                 for call in self.mock_get_s3_iterator.call_args_list[1:])
+        self.assertEquals(listed_prefixes, ['dir1/', 'dir2/', 'dir3/', 'zdir/'])
+
+    @mock.patch.object(s3, '_LIST_SHARD_MAX_DISCOVERY_PAGES', 3)
+    def test_list_parallel_discovery_capped(self):
+        s3_p = S3Path('s3://bucket')
+        self.assertEquals(s3_p.list(parallel=50), [s3_p / key for key in self.keys])
+        # The top level takes more than 3 pages, so it is listed as a single shard
+        delimiters = [call[1].get('Delimiter')
+                      for call in self.mock_get_s3_iterator.call_args_list]
+        self.assertEquals(delimiters, ['/', None])
+
+    @mock.patch.object(s3, '_LIST_SHARD_MAX_PAGES', 1)
+    def test_list_parallel_shard_pages(self):
+        s3_p = S3Path('s3://bucket')
+        self.assertEquals(s3_p.list(parallel=3), [s3_p / key for key in self.keys])
+        # Shards are listed a page at a time, continuing after the last listed key
+        dir1_calls = [call[1] for call in self.mock_get_s3_iterator.call_args_list
+                      if call[1]['Prefix'] == 'dir1/' and not call[1].get('Delimiter')]
+        self.assertEquals([call.get('StartAfter') for call in dir1_calls],
+                          [None, 'dir1/a', 'dir1/b', 'dir1/sub/'])
+
+    def test_list_parallel_prefix(self):
+        s3_p = S3Path('s3://bucket/dir1')
+        self.assertEquals(s3_p.list(parallel=2, starts_with='sub'), [
+            's3://bucket/dir1/sub/', 's3://bucket/dir1/sub/c'
+        ])
+        s3_p = S3Path('s3://bucket/dir')
+        self.assertEquals(s3_p.list(parallel=2), [
+            's3://bucket/dir1/a', 's3://bucket/dir1/b', 's3://bucket/dir1/sub/',
+            's3://bucket/dir1/sub/c', 's3://bucket/dir2/a', 's3://bucket/dir2/b',
+            's3://bucket/dir3/nested/a'
+        ])
+
+    def test_list_parallel_split_points(self):
+        s3_p = S3Path('s3://bucket/dir1')
+        results = s3_p.list(parallel=2, split_points=['a', 'sub/'])
+        self.assertEquals(results, [
+            's3://bucket/dir1/a', 's3://bucket/dir1/b',
+            's3://bucket/dir1/sub/', 's3://bucket/dir1/sub/c'
+        ])
+        start_afters = sorted(call[1].get('StartAfter', '')
+                              for call in self.mock_get_s3_iterator.call_args_list)
+        self.assertEquals(start_afters, ['', 'dir1/a', 'dir1/sub/'])
+
+    def test_list_parallel_limit_condition(self):
+        s3_p = S3Path('s3://bucket')
+        self.assertEquals(s3_p.list(parallel=4, limit=3),
+                          ['s3://bucket/a', 's3://bucket/dir1/a', 's3://bucket/dir1/b'])
+        with self.assertRaises(exceptions.ConditionNotMetError):
+            s3_p.list(parallel=4, condition=lambda results: len(results) == 2)
+
+    def test_list_parallel_error(self):
+        self.mock_get_s3_iterator.side_effect = ClientError(
+            {
+                'ResponseMetadata': {'HTTPStatusCode': 403},
+                'Error': {'Message': 'Access Denied'}
+            },
+            'list_objects_v2')
+        with self.assertRaises(exceptions.UnauthorizedError):
+            S3Path('s3://bucket').list(parallel=4)
+
+    def test_walkfiles_parallel(self):
+        s3_p = S3Path('s3://bucket')
+        self.assertEquals(list(s3_p.walkfiles('*a', parallel=4)), [
+            's3://bucket/a', 's3://bucket/dir1/a', 's3://bucket/dir2/a',
+            's3://bucket/dir3/nested/a', 's3://bucket/zdir/a'
+        ])
+
 
 class TestListdir(S3TestCase):
     def test_listdir(self):
@@ -794,7 +1103,7 @@ class TestRemove(S3TestCase):
         mock_delete_object.assert_called_once_with(Bucket='a', Key='b/c.txt')
 
 
-@mock.patch.object(S3Path, 'list', autospec=True)
+@mock.patch.object(S3Path, 'list_iter', autospec=True)
 class TestRmtree(S3TestCase):
     def test_rmtree_obj(self, mock_list):
         mock_delete_objects = self.mock_s3.delete_objects
@@ -831,7 +1140,6 @@ class TestRmtree(S3TestCase):
                 {'Key': 'b/e/g'}
             ]
         })
-        self.assertEquals([], objects)
 
     def test_rmtree_over_1000(self, mock_list):
         mock_delete_objects = self.mock_s3.delete_objects
@@ -848,8 +1156,7 @@ class TestRmtree(S3TestCase):
             mock.call(Bucket='bucket', Delete={
                 'Objects': [{'Key': 'obj' + str(i + 1000)} for i in range(234)]
             })
-        ])
-        self.assertEquals([], objects)
+        ], any_order=True)
 
     def test_rmtree_error(self, mock_list):
         mock_delete_objects = self.mock_s3.delete_objects
@@ -879,6 +1186,65 @@ class TestRmtree(S3TestCase):
             ]
         })
 
+    def test_rmtree_collects_errors(self, mock_list):
+        def delete_objects(Bucket, Delete):
+            return {
+                'Deleted': [obj for obj in Delete['Objects'] if obj['Key'] != 'obj1500'],
+                'Errors': [
+                    {'Key': obj['Key'], 'Code': 'AccessDenied', 'Message': 'access denied'}
+                    for obj in Delete['Objects'] if obj['Key'] in ('obj10', 'obj1500')
+                ]
+            }
+        self.mock_s3.delete_objects.side_effect = delete_objects
+        mock_list.return_value = iter([S3Path('s3://bucket/obj' + str(i)) for i in range(2500)])
+
+        with self.assertRaisesRegex(exceptions.RemoteError, '2 error'):
+            S3Path('s3://bucket').rmtree()
+        # Errors do not stop the remaining batches from being deleted
+        self.assertEquals(len(self.mock_s3.delete_objects.call_args_list), 3)
+
+        mock_list.return_value = iter([S3Path('s3://bucket/obj10'),
+                                       S3Path('s3://bucket/obj1500')])
+        with self.assertRaises(exceptions.RemoteError) as exc_context:
+            S3Path('s3://bucket').rmtree()
+        self.assertEquals(
+            sorted(error['Key'] for error in exc_context.exception.caught_exception),
+            ['obj10', 'obj1500'])
+
+    def test_rmtree_streams_listing(self, mock_list):
+        listed = []
+
+        def list_iter(path):
+            for i in range(5000):
+                listed.append(i)
+                yield S3Path('s3://bucket/obj' + str(i))
+
+        def delete_objects(Bucket, Delete):
+            # The first batch is deleted before the listing is finished
+            if Delete['Objects'][0]['Key'] == 'obj0':
+                self.assertLess(len(listed), 5000)
+            return {'Deleted': Delete['Objects']}
+
+        mock_list.side_effect = list_iter
+        self.mock_s3.delete_objects.side_effect = delete_objects
+        with settings.use({'s3:delete': {'object_threads': 1}}):
+            S3Path('s3://bucket').rmtree()
+        self.assertEquals(len(self.mock_s3.delete_objects.call_args_list), 5)
+
+    @freezegun.freeze_time('2016-4-5')
+    def test_rmtree_progress_logging(self, mock_list):
+        self.mock_s3.delete_objects.side_effect = lambda Bucket, Delete: {
+            'Deleted': Delete['Objects']
+        }
+        mock_list.return_value = iter([S3Path('s3://bucket/obj' + str(i)) for i in range(20)])
+        with LogCapture('stor.s3.progress') as progress_log:
+            S3Path('s3://bucket').rmtree()
+        progress_log.check(
+            ('stor.s3.progress', 'INFO', 'starting delete of s3://bucket/'),
+            ('stor.s3.progress', 'INFO',
+             'delete complete - 20 deleted\t0 failed\t0:00:00\t0.00 objects/s'),
+        )
+
 
 class TestStat(S3TestCase):
     def test_stat_obj(self):
@@ -1175,6 +1541,62 @@ class TestUpload(S3TestCase):
                 ('stor.s3.progress', 'INFO', 'upload complete - 20/20\t0:00:00\t0.00 MB\t0.00 MB/s'),  # noqa
             )
 
+    def test_upload_skip_identical(self, mock_getsize, mock_files):
+        contents = {'file1': b'a' * 10 + b'b' * 5, 'file2': b'same', 'file3': b'diff'}
+        mock_files.return_value = {name: len(data) for name, data in contents.items()}
+        mock_getsize.side_effect = lambda name: len(contents[name])
+        multipart_etag = hashlib.md5(hashlib.md5(b'a' * 10).digest() +
+                                     hashlib.md5(b'b' * 5).digest()).hexdigest() + '-2'
+        self.mock_s3_iterator.__iter__.return_value = [{
+            'Contents': [
+                {'Key': 'dir/file1', 'Size': 15, 'ETag': '"%s"' % multipart_etag},
+                {'Key': 'dir/file2', 'Size': 4, 'ETag': '"%s"' % hashlib.md5(b'same').hexdigest()},
+                {'Key': 'dir/file3', 'Size': 4, 'ETag': '"%s"' % hashlib.md5(b'other').hexdigest()}
+            ],
+            'IsTruncated': False
+        }]
+        upload_settings = {
+            's3:upload': {'skip_identical': True, 'segment_size': 10},
+            'stor:hash_cache': {'enabled': False}
+        }
+
+        with NamedTemporaryDirectory(change_dir=True), settings.use(upload_settings):
+            for name, data in contents.items():
+                with open(name, 'wb') as fp:
+                    fp.write(data)
+            results = S3Path('s3://bucket/dir').upload(['.'])
+
+        self.mock_s3_transfer.upload_file.assert_called_once_with(
+            bucket='bucket', key='dir/file3', filename='file3')
+        self.assertEquals(
+            sorted((r['dest'], r.get('skipped', False)) for r in results['completed']), [
+                (S3Path('s3://bucket/dir/file1'), True),
+                (S3Path('s3://bucket/dir/file2'), True),
+                (S3Path('s3://bucket/dir/file3'), False)
+            ])
+
+    def test_upload_skip_identical_single_file(self, mock_getsize, mock_files):
+        mock_files.return_value = {'file1': 4}
+        mock_getsize.return_value = 4
+        self.mock_s3.head_object.return_value = {
+            'ContentLength': 4, 'ETag': '"%s"' % hashlib.md5(b'same').hexdigest()
+        }
+        upload_settings = {
+            's3:upload': {'skip_identical': True},
+            'stor:hash_cache': {'enabled': False}
+        }
+
+        with NamedTemporaryDirectory(change_dir=True), settings.use(upload_settings):
+            with open('file1', 'wb') as fp:
+                fp.write(b'same')
+            results = S3Path('s3://bucket/dir').upload(['.'])
+
+        # The single object is looked up directly instead of listing the path
+        self.mock_s3.head_object.assert_called_once_with(Bucket='bucket', Key='dir/file1')
+        self.assertFalse(self.mock_s3_iterator.__iter__.called)
+        self.assertFalse(self.mock_s3_transfer.upload_file.called)
+        self.assertEquals(results['completed'][0]['skipped'], True)
+
 
 @mock.patch('stor.utils.make_dest_dir', autospec=True)
 @mock.patch('os.path.getsize', autospec=True)
@@ -1188,6 +1610,21 @@ class TestDownload(S3TestCase):
                                                                     filename='test/d.txt')
         mock_make_dest.assert_called_once_with('test')
 
+    def test_download_objects(self, mock_getsize, mock_make_dest):
+        s3_p = S3Path('s3://bucket/dir')
+        results = s3_p.download_objects('test', ['file1', 's3://bucket/dir/sub/file2'])
+        self.assertEquals(results, {
+            'file1': 'test/file1',
+            's3://bucket/dir/sub/file2': 'test/sub/file2'
+        })
+        self.mock_s3_transfer.download_file.assert_has_calls([
+            mock.call(bucket='bucket', key='dir/file1', filename='test/file1'),
+            mock.call(bucket='bucket', key='dir/sub/file2', filename='test/sub/file2')
+        ], any_order=True)
+
+        with self.assertRaisesRegex(ValueError, 'child'):
+            s3_p.download_objects('test', ['s3://bucket/other/file'])
+
     @mock.patch.object(S3Path, 'list', autospec=True)
     def test_download_dir(self, mock_list, mock_getsize, mock_make_dest):
         mock_list.return_value = [
@@ -1409,15 +1846,153 @@ class TestCopy(S3TestCase):
             p.copy(tmp_d)
             mockdownload_object.assert_called_once_with(p, Path(tmp_d) / 'file_source.txt')
 
-    def test_copy_swift_destination(self):
+    @mock.patch.object(SwiftPath, 'write_object', autospec=True)
+    @mock.patch.object(S3Path, 'read_object_range', autospec=True, return_value=b'data')
+    def test_copy_swift_destination(self, mock_read_range, mock_write):
+        p = S3Path('s3://bucket/key/file_source')
+        self.mock_s3.head_object.return_value = {'ContentLength': 4}
+        stor.copy(p, 'swift://tenant/container/dir/')
+
+        mock_read_range.assert_called_once_with(p, 0, 3)
+        mock_write.assert_called_once_with(SwiftPath('swift://tenant/container/dir/file_source'),
+                                           b'data')
+        self.assertFalse(self.mock_s3.copy_object.called)
+
+    @mock.patch.object(SwiftPath, '_get_multipart_writer', autospec=True)
+    @mock.patch.object(S3Path, 'read_object_range', autospec=True)
+    def test_copy_swift_destination_in_parts(self, mock_read_range, mock_get_writer):
+        mock_read_range.side_effect = lambda pth, start, end: b'x' * (end - start + 1)
+        mock_writer = mock_get_writer.return_value
+        mock_writer.max_parts = 1000
+        mock_writer.upload_part.side_effect = lambda part_number, data: (part_number, len(data))
+        self.mock_s3.head_object.return_value = {'ContentLength': 10}
+        p = S3Path('s3://bucket/key/file_source')
+        with settings.use({'stor:transfer': {'segment_size': '4B', 'max_memory': '8B'}}):
+            p.copy('swift://tenant/container/file_dest.txt')
+
+        mock_read_range.assert_has_calls([
+            mock.call(p, 0, 3),
+            mock.call(p, 4, 7),
+            mock.call(p, 8, 9),
+        ], any_order=True)
+        mock_writer.start.assert_called_once_with()
+        mock_writer.complete.assert_called_once_with([(1, 4), (2, 4), (3, 2)])
+        self.assertFalse(mock_writer.abort.called)
+
+    @mock.patch.object(SwiftPath, '_get_multipart_writer', autospec=True)
+    @mock.patch.object(S3Path, 'read_object_range', autospec=True)
+    def test_copy_swift_destination_max_parts(self, mock_read_range, mock_get_writer):
+        mock_read_range.side_effect = lambda pth, start, end: b'x' * (end - start + 1)
+        mock_writer = mock_get_writer.return_value
+        mock_writer.max_parts = 2
+        mock_writer.upload_part.side_effect = lambda part_number, data: (part_number, len(data))
+        self.mock_s3.head_object.return_value = {'ContentLength': 10}
+        p = S3Path('s3://bucket/key/file_source')
+        with settings.use({'stor:transfer': {'segment_size': '4B'}}):
+            p.copy('swift://tenant/container/file_dest.txt')
+
+        mock_writer.complete.assert_called_once_with([(1, 5), (2, 5)])
+
+    @mock.patch.object(SwiftPath, '_get_multipart_writer', autospec=True)
+    @mock.patch.object(S3Path, 'read_object_range', autospec=True, return_value=b'data')
+    def test_copy_swift_destination_error(self, mock_read_range, mock_get_writer):
+        mock_writer = mock_get_writer.return_value
+        mock_writer.max_parts = 1000
+        mock_writer.upload_part.side_effect = exceptions.RemoteError('failed', None)
+        self.mock_s3.head_object.return_value = {'ContentLength': 10}
         p = S3Path('s3://bucket/key/file_source')
-        with self.assertRaisesRegexp(ValueError, 'OBS path'):
-            p.copy('swift://tenant/container/file_dest')
+        with settings.use({'stor:transfer': {'segment_size': '4B'}}):
+            with self.assertRaisesRegex(exceptions.FailedTransferError, 'copying'):
+                p.copy('swift://tenant/container/file_dest.txt')
+
+        mock_writer.abort.assert_called_once_with()
+        self.assertFalse(mock_writer.complete.called)
 
     def test_copy_s3_destination(self):
         p = S3Path('s3://bucket/key/file_source')
-        with self.assertRaisesRegexp(ValueError, 'OBS path'):
+        self.mock_s3.head_object.return_value = {'ContentLength': 10}
+        p.copy('s3://bucket2/key/file_dest.txt')
+        self.mock_s3.copy_object.assert_called_once_with(
+            Bucket='bucket2',
+            Key='key/file_dest.txt',
+            CopySource={'Bucket': 'bucket', 'Key': 'key/file_source'})
+
+    def test_copy_s3_dir_destination(self):
+        p = S3Path('s3://bucket/key/file_source')
+        self.mock_s3.head_object.return_value = {'ContentLength': 10}
+        p.copy('s3://bucket2/dir/')
+        self.mock_s3.copy_object.assert_called_once_with(
+            Bucket='bucket2',
+            Key='dir/file_source',
+            CopySource={'Bucket': 'bucket', 'Key': 'key/file_source'})
+
+    def test_copy_s3_destination_from_utils(self):
+        self.mock_s3.head_object.return_value = {'ContentLength': 10}
+        stor.copy('s3://bucket/key/file_source', 's3://bucket2/key/file_dest.txt')
+        self.mock_s3.copy_object.assert_called_once_with(
+            Bucket='bucket2',
+            Key='key/file_dest.txt',
+            CopySource={'Bucket': 'bucket', 'Key': 'key/file_source'})
+
+    def test_copy_s3_ambiguous_destination(self):
+        p = S3Path('s3://bucket/key/file_source')
+        with self.assertRaisesRegex(ValueError, 'OBS destination'):
             p.copy('s3://bucket/key/file_dest')
+        self.assertFalse(self.mock_s3.copy_object.called)
+
+    def test_copy_s3_destination_error(self):
+        p = S3Path('s3://bucket/key/file_source')
+        self.mock_s3.head_object.side_effect = ClientError(
+            {'Error': {'Code': '404', 'Message': 'Not Found'}}, 'head_object')
+        with self.assertRaisesRegex(exceptions.FailedTransferError, 'copying'):
+            p.copy('s3://bucket2/key/file_dest.txt')
+
+    def test_copy_large_object_in_parts(self):
+        p = S3Path('s3://bucket/key/file_source')
+        self.mock_s3.head_object.return_value = {
+            'ContentLength': 6 * 1024 ** 3,
+            'ContentType': 'text/plain',
+            'Metadata': {'a': 'b'}
+        }
+        self.mock_s3.create_multipart_upload.return_value = {'UploadId': 'upload'}
+        self.mock_s3.upload_part_copy.side_effect = [
+            {'CopyPartResult': {'ETag': 'etag%s' % i}} for i in range(1, 4)
+        ]
+        with settings.use({'s3:upload': {'segment_size': '2G', 'segment_threads': 1}}):
+            p.copy('s3://bucket2/key/file_dest.txt')
+
+        self.assertFalse(self.mock_s3.copy_object.called)
+        self.mock_s3.create_multipart_upload.assert_called_once_with(
+            Bucket='bucket2', Key='key/file_dest.txt', ContentType='text/plain',
+            Metadata={'a': 'b'})
+        copy_source = {'Bucket': 'bucket', 'Key': 'key/file_source'}
+        self.mock_s3.upload_part_copy.assert_has_calls([
+            mock.call(Bucket='bucket2', Key='key/file_dest.txt', UploadId='upload',
+                      PartNumber=1, CopySource=copy_source,
+                      CopySourceRange='bytes=0-%s' % (2 * 1024 ** 3 - 1)),
+            mock.call(Bucket='bucket2', Key='key/file_dest.txt', UploadId='upload',
+                      PartNumber=2, CopySource=copy_source,
+                      CopySourceRange='bytes=%s-%s' % (2 * 1024 ** 3, 4 * 1024 ** 3 - 1)),
+            mock.call(Bucket='bucket2', Key='key/file_dest.txt', UploadId='upload',
+                      PartNumber=3, CopySource=copy_source,
+                      CopySourceRange='bytes=%s-%s' % (4 * 1024 ** 3, 6 * 1024 ** 3 - 1)),
+        ])
+        self.mock_s3.complete_multipart_upload.assert_called_once_with(
+            Bucket='bucket2', Key='key/file_dest.txt', UploadId='upload',
+            MultipartUpload={'Parts': [
+                {'ETag': 'etag%s' % i, 'PartNumber': i} for i in range(1, 4)
+            ]})
+
+    def test_copy_large_object_in_parts_error(self):
+        p = S3Path('s3://bucket/key/file_source')
+        self.mock_s3.head_object.return_value = {'ContentLength': 6 * 1024 ** 3}
+        self.mock_s3.create_multipart_upload.return_value = {'UploadId': 'upload'}
+        self.mock_s3.upload_part_copy.side_effect = ClientError(
+            {'Error': {'Code': '500', 'Message': 'Internal Error'}}, 'upload_part_copy')
+        with self.assertRaises(exceptions.FailedTransferError):
+            p.copy('s3://bucket2/key/file_dest.txt')
+        self.mock_s3.abort_multipart_upload.assert_called_once_with(
+            Bucket='bucket2', Key='key/file_dest.txt', UploadId='upload')
 
 
 class TestCopytree(S3TestCase):
@@ -1431,10 +2006,97 @@ class TestCopytree(S3TestCase):
             condition=None,
             use_manifest=False)
 
-    def test_copytree_swift_destination(self):
+    @mock.patch.object(SwiftPath, 'write_object', autospec=True)
+    @mock.patch.object(S3Path, 'read_object_range', autospec=True, return_value=b'data')
+    @mock.patch.object(S3Path, 'list', autospec=True)
+    def test_copytree_swift_destination(self, mock_list, mock_read_range, mock_write):
+        mock_list.return_value = [
+            OBSListEntry(S3Path('s3://bucket/key/file1'), size=4),
+            OBSListEntry(S3Path('s3://bucket/key/dir/'), size=0),
+            OBSListEntry(S3Path('s3://bucket/key/dir/file2'), size=4),
+        ]
         p = S3Path('s3://bucket/key')
-        with self.assertRaises(ValueError):
-            p.copytree('s3://s3/path')
+        copied = stor.copytree(p, 'swift://tenant/container/path')
+
+        self.assertFalse(self.mock_s3.head_object.called)
+        self.assertEquals(mock_read_range.call_count, 2)
+        mock_write.assert_has_calls([
+            mock.call(SwiftPath('swift://tenant/container/path/file1'), b'data'),
+            mock.call(SwiftPath('swift://tenant/container/path/dir/'), b''),
+            mock.call(SwiftPath('swift://tenant/container/path/dir/file2'), b'data'),
+        ], any_order=True)
+        self.assertEquals(len(copied['completed']), 3)
+
+    @mock.patch.object(S3Path, 'list', autospec=True)
+    def test_copytree_s3_destination(self, mock_list):
+        mock_list.return_value = [
+            OBSListEntry(S3Path('s3://bucket/key/file1'), size=10),
+            OBSListEntry(S3Path('s3://bucket/key/dir/'), size=0),
+            OBSListEntry(S3Path('s3://bucket/key/dir/file2'), size=20),
+        ]
+        p = S3Path('s3://bucket/key')
+        copied = p.copytree('s3://bucket2/path', condition=lambda results: len(results) == 3)
+
+        mock_list.assert_called_once_with(S3Path('s3://bucket/key/'), use_manifest=False,
+                                          with_metadata=True)
+        self.assertFalse(self.mock_s3.head_object.called)
+        self.assertEquals(self.mock_s3.copy_object.call_count, 3)
+        self.mock_s3.copy_object.assert_has_calls([
+            mock.call(Bucket='bucket2', Key='path/file1',
+                      CopySource={'Bucket': 'bucket', 'Key': 'key/file1'}),
+            mock.call(Bucket='bucket2', Key='path/dir/',
+                      CopySource={'Bucket': 'bucket', 'Key': 'key/dir/'}),
+            mock.call(Bucket='bucket2', Key='path/dir/file2',
+                      CopySource={'Bucket': 'bucket', 'Key': 'key/dir/file2'}),
+        ], any_order=True)
+        self.assertEquals(
+            {r['dest'] for r in copied['completed']},
+            {S3Path('s3://bucket2/path/file1'), S3Path('s3://bucket2/path/dir/'),
+             S3Path('s3://bucket2/path/dir/file2')})
+
+    @mock.patch.object(S3Path, 'copytree', autospec=True)
+    def test_copytree_s3_destination_from_utils(self, mock_copytree):
+        stor.copytree('s3://bucket/key', 's3://bucket2/path', use_manifest=True)
+        mock_copytree.assert_called_once_with(S3Path('s3://bucket/key'),
+                                              S3Path('s3://bucket2/path'),
+                                              use_manifest=True, condition=None)
+
+    @mock.patch.object(S3Path, 'list', autospec=True)
+    def test_copytree_s3_destination_condition_failed(self, mock_list):
+        mock_list.return_value = [OBSListEntry(S3Path('s3://bucket/key/file1'), size=10)]
+        p = S3Path('s3://bucket/key')
+        with self.assertRaises(exceptions.ConditionNotMetError):
+            p.copytree('s3://bucket2/path', condition=lambda results: len(results) == 3)
+
+    @mock.patch.object(utils, 'generate_and_save_data_manifest', autospec=True)
+    @mock.patch.object(utils, 'get_data_manifest_contents', autospec=True)
+    @mock.patch.object(S3Path, 'list', autospec=True)
+    def test_copytree_s3_destination_use_manifest(self, mock_list, mock_get_manifest,
+                                                  mock_save_manifest):
+        mock_list.return_value = [
+            OBSListEntry(S3Path('s3://bucket/key/.data_manifest.csv'), size=10),
+            OBSListEntry(S3Path('s3://bucket/key/file1'), size=10),
+        ]
+        mock_get_manifest.return_value = ['key/file1']
+        p = S3Path('s3://bucket/key')
+        p.copytree('s3://bucket2/path', use_manifest=True)
+
+        mock_list.assert_called_once_with(S3Path('s3://bucket/key/'), use_manifest=True,
+                                          with_metadata=True)
+        mock_save_manifest.assert_called_once_with(S3Path('s3://bucket2/path/'),
+                                                   ['path/file1'])
+        self.mock_s3.copy_object.assert_called_once_with(
+            Bucket='bucket2', Key='path/file1',
+            CopySource={'Bucket': 'bucket', 'Key': 'key/file1'})
+
+    @mock.patch.object(S3Path, 'list', autospec=True)
+    def test_copytree_s3_destination_failed(self, mock_list):
+        mock_list.return_value = [OBSListEntry(S3Path('s3://bucket/key/file1'), size=10)]
+        self.mock_s3.copy_object.side_effect = ClientError(
+            {'Error': {'Code': '403', 'Message': 'Forbidden'}}, 'copy_object')
+        p = S3Path('s3://bucket/key')
+        with self.assertRaisesRegex(exceptions.FailedTransferError, 'copying'):
+            p.copytree('s3://bucket2/path')
 
     @mock.patch('os.path', ntpath)
     def test_copytree_windows_destination(self):
@@ -1452,6 +2114,16 @@ class TestCopytree(S3TestCase):
         # read_object in the shared tests.
         self.assertEquals(s3_p.read_object(), b'data')
 
+    @mock.patch('botocore.response.StreamingBody', autospec=True)
+    def test_read_object_range(self, mock_stream):
+        mock_stream.read.return_value = b'ata'
+        self.mock_s3.get_object.return_value = {'Body': mock_stream}
+
+        s3_p = S3Path('s3://bucket/key/obj')
+        self.assertEquals(s3_p.read_object_range(1, 3), b'ata')
+        self.mock_s3.get_object.assert_called_once_with(Bucket='bucket', Key='key/obj',
+                                                        Range='bytes=1-3')
+
 
 class TestRestore(S3TestCase):
     def test_restore_normal(self):
@@ -1480,6 +2152,54 @@ class TestRestore(S3TestCase):
 
 
 class TestS3File(S3TestCase):
+    def test_stream_write_multipart_upload(self):
+        self.mock_s3.create_multipart_upload.return_value = {'UploadId': 'upload_id'}
+        self.mock_s3.upload_part.side_effect = lambda **kwargs: {
+            'ETag': 'etag%s' % kwargs['PartNumber']
+        }
+        s3_p = S3Path('s3://bucket/key/obj')
+        with settings.use({'s3:upload': {'segment_size': '5B'}}):
+            with s3_p.open(mode='wb', stream=True) as obj:
+                obj.write(b'hello world')
+
+        self.mock_s3.create_multipart_upload.assert_called_once_with(Bucket='bucket',
+                                                                     Key='key/obj')
+        self.assertEquals(sorted(self.mock_s3.upload_part.call_args_list,
+                                 key=lambda call: call[1]['PartNumber']), [
+            mock.call(Bucket='bucket', Key='key/obj', UploadId='upload_id',
+                      PartNumber=1, Body=b'hello'),
+            mock.call(Bucket='bucket', Key='key/obj', UploadId='upload_id',
+                      PartNumber=2, Body=b' worl'),
+            mock.call(Bucket='bucket', Key='key/obj', UploadId='upload_id',
+                      PartNumber=3, Body=b'd'),
+        ])
+        self.mock_s3.complete_multipart_upload.assert_called_once_with(
+            Bucket='bucket', Key='key/obj', UploadId='upload_id',
+            MultipartUpload={'Parts': [
+                {'ETag': 'etag1', 'PartNumber': 1},
+                {'ETag': 'etag2', 'PartNumber': 2},
+                {'ETag': 'etag3', 'PartNumber': 3}
+            ]})
+        self.assertFalse(self.mock_s3.abort_multipart_upload.called)
+
+    def test_stream_write_multipart_upload_error(self):
+        self.mock_s3.create_multipart_upload.return_value = {'UploadId': 'upload_id'}
+        self.mock_s3.upload_part.side_effect = ClientError(
+            {
+                'ResponseMetadata': {'HTTPStatusCode': 503},
+                'Error': {'Message': 'Slow Down'}
+            },
+            'upload_part')
+        s3_p = S3Path('s3://bucket/key/obj')
+        with settings.use({'s3:upload': {'segment_size': '5B'}}):
+            with self.assertRaises(exceptions.UnavailableError):
+                with s3_p.open(mode='wb', stream=True) as obj:
+                    obj.write(b'hello world')
+
+        self.assertFalse(self.mock_s3.complete_multipart_upload.called)
+        self.mock_s3.abort_multipart_upload.assert_called_once_with(
+            Bucket='bucket', Key='key/obj', UploadId='upload_id')
+
     @mock.patch('botocore.response.StreamingBody', autospec=True)
     def test_read_success(self, mock_stream):
         mock_stream.read.return_value = b'data'
@@ -1509,49 +2229,81 @@ line4
         self.assertEqual(next(s3_p.open()), 'line1\n')
         self.assertEqual(next(iter(s3_p.open())), 'line1\n')
 
-    @mock.patch('time.sleep', autospec=True)
-    def test_binary_write_multiple_w_context_manager(self, mock_sleep):
-        mock_upload = self.mock_s3_transfer.upload_file
+    def test_binary_write_multiple_w_context_manager(self):
         s3_p = S3Path('s3://bucket/key/obj')
         with s3_p.open(mode='wb') as obj:
             obj.write(b'hello')
             obj.write(b' world')
-        upload_call, = mock_upload.call_args_list
-        self.assertTrue(upload_call[1]['bucket'] == s3_p.bucket)
-        self.assertTrue(upload_call[1]['key'] == s3_p.resource)
+        self.mock_s3.put_object.assert_called_once_with(Bucket='bucket', Key='key/obj',
+                                                        Body=b'hello world')
+        self.assertFalse(self.mock_s3_transfer.upload_file.called)
 
-    @mock.patch('time.sleep', autospec=True)
-    def test_write_multiple_flush_multiple_upload(self, mock_sleep):
-        mock_upload = self.mock_s3_transfer.upload_file
+    def test_write_multiple_flush_multiple_upload(self):
         s3_p = S3Path('s3://bucket/key/obj')
-        with NamedTemporaryFile('wb', delete=False) as ntf1,\
-                NamedTemporaryFile('wb', delete=False) as ntf2,\
-                NamedTemporaryFile('wb', delete=False) as ntf3:
-            with mock.patch('tempfile.NamedTemporaryFile', autospec=True) as ntf:
-                ntf.side_effect = [ntf1, ntf2, ntf3]
-                with s3_p.open(mode='w') as obj:
-                    obj.write('hello')
-                    obj.flush()
-                    obj.write(' world')
-                    obj.flush()
-                u1, u2, u3 = mock_upload.call_args_list
-                self.assertTrue(u1[1]['bucket'] == s3_p.bucket)
-                self.assertTrue(u2[1]['bucket'] == s3_p.bucket)
-                self.assertTrue(u3[1]['bucket'] == s3_p.bucket)
-                self.assertTrue(u1[1]['filename'] == ntf1.name)
-                self.assertTrue(u2[1]['filename'] == ntf2.name)
-                self.assertTrue(u3[1]['filename'] == ntf3.name)
-                self.assertTrue(u1[1]['key'] == s3_p.resource)
-                self.assertTrue(u2[1]['key'] == s3_p.resource)
-                self.assertTrue(u3[1]['key'] == s3_p.resource)
-                self.assertEqual(open(ntf1.name, 'rb').read(), b'hello')
-                self.assertEqual(open(ntf2.name, 'rb').read(), b'hello world')
-                # third call happens because we don't care about checking for
-                # additional file change
-                self.assertEqual(open(ntf3.name, 'rb').read(), b'hello world')
-
-
-class TestS3Shared(SharedOBSFileCases, S3TestCase):
+        with mock.patch('tempfile.NamedTemporaryFile', autospec=True) as ntf:
+            with s3_p.open(mode='w') as obj:
+                obj.write('hello')
+                obj.flush()
+                obj.write(' world')
+                obj.flush()
+        self.assertEquals(self.mock_s3.put_object.call_args_list, [
+            mock.call(Bucket='bucket', Key='key/obj', Body=b'hello'),
+            mock.call(Bucket='bucket', Key='key/obj', Body=b'hello world'),
+            # third call happens because we don't care about checking for
+            # additional file change
+            mock.call(Bucket='bucket', Key='key/obj', Body=b'hello world')
+        ])
+        # Content is uploaded straight from memory
+        self.assertFalse(ntf.called)
+
+    def test_write_object_headers(self):
+        s3_p = S3Path('s3://bucket/key/obj')
+        s3_p.write_object(b'{}', headers={'ContentType': 'application/json'})
+        self.mock_s3.put_object.assert_called_once_with(Bucket='bucket', Key='key/obj',
+                                                        Body=b'{}',
+                                                        ContentType='application/json')
+
+    def test_write_object_multipart(self):
+        self.mock_s3.create_multipart_upload.return_value = {'UploadId': 'upload_id'}
+        self.mock_s3.upload_part.side_effect = lambda **kwargs: {
+            'ETag': 'etag%s' % kwargs['PartNumber']
+        }
+        s3_p = S3Path('s3://bucket/key/obj')
+        with settings.use({'s3:upload': {'segment_size': '4B'}}):
+            s3_p.write_object(b'0123456789', headers={'ContentType': 'text/plain'})
+
+        self.assertFalse(self.mock_s3.put_object.called)
+        self.mock_s3.create_multipart_upload.assert_called_once_with(
+            Bucket='bucket', Key='key/obj', ContentType='text/plain')
+        self.assertEquals(sorted((call[1]['PartNumber'], call[1]['Body'])
+                                 for call in self.mock_s3.upload_part.call_args_list),
+                          [(1, b'0123'), (2, b'4567'), (3, b'89')])
+        self.mock_s3.complete_multipart_upload.assert_called_once_with(
+            Bucket='bucket', Key='key/obj', UploadId='upload_id',
+            MultipartUpload={'Parts': [
+                {'ETag': 'etag1', 'PartNumber': 1},
+                {'ETag': 'etag2', 'PartNumber': 2},
+                {'ETag': 'etag3', 'PartNumber': 3}
+            ]})
+
+    def test_write_object_multipart_error(self):
+        self.mock_s3.create_multipart_upload.return_value = {'UploadId': 'upload_id'}
+        self.mock_s3.upload_part.side_effect = ClientError(
+            {
+                'ResponseMetadata': {'HTTPStatusCode': 403},
+                'Error': {'Message': 'Access Denied'}
+            },
+            'upload_part')
+        s3_p = S3Path('s3://bucket/key/obj')
+        with settings.use({'s3:upload': {'segment_size': '4B'}}):
+            with self.assertRaises(exceptions.UnauthorizedError):
+                s3_p.write_object(b'0123456789')
+        self.assertFalse(self.mock_s3.complete_multipart_upload.called)
+        self.mock_s3.abort_multipart_upload.assert_called_once_with(
+            Bucket='bucket', Key='key/obj', UploadId='upload_id')
+
+
+class TestS3Shared(SharedOBSFileCases, SharedOBSStreamFileCases, S3TestCase):
     drive = 's3://'
     path_class = S3Path
     normal_path = S3Path('s3://bucket/my/key/obj')
@@ -1566,8 +2318,7 @@ class TestSessionSettings(unittest.TestCase):
         self._clear_s3_cache()
 
     def _clear_s3_cache(self):  # pragma: no cover
-        if hasattr(s3._thread_local, 's3_client'):
-            del s3._thread_local.s3_client
+        s3._s3_client_manager.clear()
         if hasattr(s3._thread_local, 's3_transfer'):
             del s3._thread_local.s3_transfer
 
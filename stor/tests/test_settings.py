@@ -33,6 +33,17 @@ class TestSettings(unittest.TestCase):
     def test_initialize_default(self):
         expected_settings = {
             'stor': {},
+            'stor:hash_cache': {
+                'enabled': True,
+                'path': '',
+                'max_entries': 1000000
+            },
+            'stor:transfer': {
+                'segment_size': 16777216,
+                'object_threads': 10,
+                'segment_threads': 4,
+                'max_memory': 268435456
+            },
             's3': {
                 'aws_access_key_id': '',
                 'aws_secret_access_key': '',
@@ -43,13 +54,17 @@ class TestSettings(unittest.TestCase):
             's3:upload': {
                 'segment_size': 8388608,
                 'object_threads': 10,
-                'segment_threads': 10
+                'segment_threads': 10,
+                'skip_identical': False
             },
             's3:download': {
                 'segment_size': 8388608,
                 'object_threads': 10,
                 'segment_threads': 10
             },
+            's3:delete': {
+                'object_threads': 10
+            },
             'swift': {
                 'username': '',
                 'password': '',
@@ -74,12 +89,25 @@ class TestSettings(unittest.TestCase):
                 'segment_size': 1073741824,
                 'segment_threads': 10,
                 'skip_identical': False,
+                'stream_segment_size': 16777216,
                 'use_slo': True
             },
             'dx': {
                 'auth_token': '',
                 'wait_on_close': 0,
                 'file_proxy_url': '',
+                'resolution_cache_ttl': 0,
+                'resolution_cache_size': 100000,
+            },
+            'dx:upload': {
+                'object_threads': 10,
+                'segment_size': 16777216
+            },
+            'dx:download': {
+                'object_threads': 10
+            },
+            'dx:delete': {
+                'object_threads': 10
             }
         }
         settings._initialize()
@@ -89,6 +117,17 @@ class TestSettings(unittest.TestCase):
     def test_initialize_w_user_file(self):
         expected_settings = {
             'stor': {},
+            'stor:hash_cache': {
+                'enabled': True,
+                'path': '',
+                'max_entries': 1000000
+            },
+            'stor:transfer': {
+                'segment_size': 16777216,
+                'object_threads': 10,
+                'segment_threads': 4,
+                'max_memory': 268435456
+            },
             's3': {
                 'aws_access_key_id': '',
                 'aws_secret_access_key': '',
@@ -99,13 +138,17 @@ class TestSettings(unittest.TestCase):
             's3:upload': {
                 'segment_size': 8388608,
                 'object_threads': 10,
-                'segment_threads': 10
+                'segment_threads': 10,
+                'skip_identical': False
             },
             's3:download': {
                 'segment_size': 8388608,
                 'object_threads': 10,
                 'segment_threads': 10
             },
+            's3:delete': {
+                'object_threads': 10
+            },
             'swift': {
                 'username': 'fake_user',
                 'password': 'fake_password',
@@ -130,12 +173,25 @@ class TestSettings(unittest.TestCase):
                 'segment_size': 1073741824,
                 'segment_threads': 10,
                 'skip_identical': False,
+                'stream_segment_size': 16777216,
                 'use_slo': True
             },
             'dx': {
                 'auth_token': 'fake_token',
                 'wait_on_close': 0,
                 'file_proxy_url': '',
+                'resolution_cache_ttl': 0,
+                'resolution_cache_size': 100000,
+            },
+            'dx:upload': {
+                'object_threads': 10,
+                'segment_size': 16777216
+            },
+            'dx:download': {
+                'object_threads': 10
+            },
+            'dx:delete': {
+                'object_threads': 10
             }
         }
         filename = os.path.join(os.path.dirname(__file__), 'file_data', 'test.cfg')
@@ -191,6 +247,42 @@ class TestSettings(unittest.TestCase):
         settings.update(settings=update_settings)
         self.assertEquals(settings._global_settings, expected_settings)
 
+    def test_get_returns_copy(self):
+        options = settings.get()
+        options['swift:upload']['object_threads'] = 30
+        self.assertEquals(settings.get(), test_settings)
+        self.assertEquals(settings.get_section('swift:upload')['object_threads'], 10)
+
+    def test_get_section(self):
+        section = settings.get_section('swift:upload')
+        self.assertEquals(section, test_settings['swift:upload'])
+        self.assertIs(settings.get_section('swift:upload'), section)
+        with self.assertRaises(TypeError):
+            section['object_threads'] = 30
+        with self.assertRaises(KeyError):
+            settings.get_section('foo')
+
+    @mock.patch.dict('stor.settings._global_settings',
+                     copy.deepcopy(test_settings), clear=True)
+    def test_get_section_after_update(self):
+        section = settings.get_section('swift:upload')
+        settings.update({'swift:upload': {'object_threads': 30}})
+        self.assertEquals(settings.get_section('swift:upload')['object_threads'], 30)
+        self.assertEquals(section['object_threads'], 10)
+        with settings.use({'swift:upload': {'object_threads': 20}}):
+            self.assertEquals(settings.get_section('swift:upload')['object_threads'], 20)
+        self.assertEquals(settings.get_section('swift:upload')['object_threads'], 30)
+
+    @mock.patch.dict('stor.settings._global_settings',
+                     copy.deepcopy(test_settings), clear=True)
+    def test_get_section_after_nested_change(self):
+        self.assertEquals(settings.get_section('swift:upload')['object_threads'], 10)
+        settings._global_settings['swift:upload']['object_threads'] = 30
+        self.assertEquals(settings.get_section('swift:upload')['object_threads'], 30)
+        settings._global_settings['new'] = {'option': 1}
+        settings._global_settings['new']['option'] = 2
+        self.assertEquals(settings.get_section('new')['option'], 2)
+
     def test_update_wo_settings(self):
         settings.update()
         self.assertEquals(settings._global_settings, test_settings)
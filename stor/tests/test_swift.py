@@ -1,7 +1,9 @@
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
 import logging
 import ntpath
 import os
-from tempfile import NamedTemporaryFile
 import unittest
 
 import freezegun
@@ -17,9 +19,11 @@ from stor import Path
 from stor import settings
 from stor import swift
 from stor import utils
+from stor.obs import OBSListEntry
 from stor.swift import SwiftPath
 from stor.test import SwiftTestCase
 from stor.tests.shared_obs import SharedOBSFileCases
+from stor.tests.shared_obs import SharedOBSStreamFileCases
 
 
 def _service_404_exception():
@@ -225,6 +229,28 @@ class TestGetSwiftService(SwiftTestCase):
         swift_p._get_swift_service()
         self.mock_swift_service.assert_called_once_with({'option': 'value'})
 
+    def test_get_swift_service_shared(self, mock_get_swift_connection_options):
+        self.disable_get_swift_service_mock()
+        self.mock_swift_service.side_effect = lambda opts: mock.Mock()
+
+        mock_get_swift_connection_options.return_value = {'os_tenant_name': 'tenant',
+                                                          'os_auth_token': 'token'}
+        swift_p = SwiftPath('swift://tenant/')
+        service = swift_p._get_swift_service()
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            thread_services = list(executor.map(lambda i: swift_p._get_swift_service(),
+                                                range(4)))
+        self.assertTrue(all(thread_service is service for thread_service in thread_services))
+        self.assertEquals(len(self.mock_swift_service.call_args_list), 1)
+
+        # Services of invalidated credentials are evicted
+        swift._clear_cached_auth_credentials()
+        self.assertEquals(swift._swift_services, {})
+        mock_get_swift_connection_options.return_value = {'os_tenant_name': 'tenant',
+                                                          'os_auth_token': 'new_token'}
+        self.assertIsNot(swift_p._get_swift_service(), service)
+        self.assertEquals(len(swift._swift_services), 1)
+
 
 @mock.patch.object(SwiftPath, '_get_swift_connection_options',
                    autospec=True)
@@ -235,6 +261,49 @@ class TestGetSwiftConnection(SwiftTestCase):
         swift_p._get_swift_connection()
         self.mock_swift_get_conn.assert_called_once_with({'option': 'value'})
 
+    def test_get_swift_connection_cached(self, mock_get_swift_connection_options):
+        mock_get_swift_connection_options.return_value = {'os_tenant_name': 'tenant'}
+        swift_p = SwiftPath('swift://tenant/')
+        conn = swift_p._get_swift_connection()
+        self.assertIs(SwiftPath('swift://tenant/container')._get_swift_connection(), conn)
+        self.assertEquals(len(self.mock_swift_get_conn.call_args_list), 1)
+
+        # Other tenants and options get their own connections
+        mock_get_swift_connection_options.return_value = {'os_tenant_name': 'tenant2'}
+        SwiftPath('swift://tenant2/')._get_swift_connection()
+        self.assertEquals(len(self.mock_swift_get_conn.call_args_list), 2)
+
+        # Clearing auth credentials invalidates cached connections
+        mock_get_swift_connection_options.return_value = {'os_tenant_name': 'tenant'}
+        swift._clear_cached_auth_credentials()
+        swift_p._get_swift_connection()
+        self.assertEquals(len(self.mock_swift_get_conn.call_args_list), 3)
+
+    def test_get_swift_connection_per_thread(self, mock_get_swift_connection_options):
+        mock_get_swift_connection_options.return_value = {'os_tenant_name': 'tenant'}
+        self.mock_swift_get_conn.side_effect = lambda opts: mock.Mock()
+        swift_p = SwiftPath('swift://tenant/')
+        conn = swift_p._get_swift_connection()
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            thread_conn = executor.submit(swift_p._get_swift_connection).result()
+            self.assertIs(executor.submit(swift_p._get_swift_connection).result(),
+                          thread_conn)
+        self.assertIsNot(thread_conn, conn)
+        self.assertIs(swift_p._get_swift_connection(), conn)
+
+    def test_auth_error_clears_cached_connection(self, mock_get_swift_connection_options):
+        mock_get_swift_connection_options.return_value = {'os_tenant_name': 'tenant'}
+        stale_conn = mock.Mock()
+        stale_conn.head_object.side_effect = ClientException('Unauthorized. Check username')
+        self.mock_swift_get_conn.side_effect = [stale_conn, self.mock_swift_conn]
+        self.mock_swift_conn.head_object.return_value = {'content-length': '10'}
+
+        swift_p = SwiftPath('swift://tenant/container/obj')
+        self.assertEquals(swift_p._swift_connection_call('head_object', 'container', 'obj'),
+                          {'content-length': '10'})
+        self.assertEquals(len(self.mock_swift_get_conn.call_args_list), 2)
+        self.assertIs(swift_p._get_swift_connection(), self.mock_swift_conn)
+
 
 class TestOpen(SwiftTestCase):
     def setUp(self):
@@ -285,6 +354,64 @@ line4
         self.assertEqual(next(swift_p.open()), 'line1\n')
         self.assertEqual(next(iter(swift_p.open())), 'line1\n')
 
+    @mock.patch('time.time', autospec=True, return_value=1.5)
+    def test_stream_write_slo(self, mock_time):
+        self.mock_swift_conn.put_object.side_effect = lambda container, obj, data, **kwargs: (
+            'etag-%s' % data)
+        swift_p = SwiftPath('swift://tenant/container/obj')
+        with settings.use({'swift:upload': {'stream_segment_size': '5B'}}):
+            with swift_p.open(mode='wb', stream=True) as obj:
+                obj.write(b'hello world')
+
+        self.mock_swift_conn.put_container.assert_called_once_with('.segments_container')
+        segment_calls = [
+            call for call in self.mock_swift_conn.put_object.call_args_list
+            if call[0][0] == '.segments_container'
+        ]
+        self.assertEquals(sorted(segment_calls), [
+            mock.call('.segments_container', 'obj/slo/1.500000/5/00000001', b'hello'),
+            mock.call('.segments_container', 'obj/slo/1.500000/5/00000002', b' worl'),
+            mock.call('.segments_container', 'obj/slo/1.500000/5/00000003', b'd'),
+        ])
+        manifest_call = self.mock_swift_conn.put_object.call_args_list[-1]
+        self.assertEquals(manifest_call[0][:2], ('container', 'obj'))
+        self.assertEquals(manifest_call[1], {'query_string': 'multipart-manifest=put'})
+        self.assertEquals(json.loads(manifest_call[0][2]), [
+            {
+                'path': '/.segments_container/obj/slo/1.500000/5/00000001',
+                'etag': "etag-b'hello'",
+                'size_bytes': 5
+            },
+            {
+                'path': '/.segments_container/obj/slo/1.500000/5/00000002',
+                'etag': "etag-b' worl'",
+                'size_bytes': 5
+            },
+            {
+                'path': '/.segments_container/obj/slo/1.500000/5/00000003',
+                'etag': "etag-b'd'",
+                'size_bytes': 1
+            }
+        ])
+
+    def test_read_object_range(self):
+        self.mock_swift_conn.get_object.return_value = ('header', b'ata')
+
+        swift_p = SwiftPath('swift://tenant/container/obj')
+        self.assertEquals(swift_p.read_object_range(1, 3), b'ata')
+        self.mock_swift_conn.get_object.assert_called_once_with(
+            'container', 'obj', headers={'Range': 'bytes=1-3'})
+
+    @mock.patch('time.sleep', autospec=True)
+    def test_read_range_success_on_second_try(self, mock_sleep):
+        self.mock_swift_conn.get_object.side_effect = [
+            ClientException('dummy', 'dummy', http_status=503),
+            ('header', b'ata')
+        ]
+        swift_p = SwiftPath('swift://tenant/container/obj')
+        self.assertEquals(swift_p.read_object_range(1, 3), b'ata')
+        self.assertEquals(len(mock_sleep.call_args_list), 1)
+
     @mock.patch('time.sleep', autospec=True)
     def test_read_success_on_second_try(self, mock_sleep):
         self.mock_swift_conn.get_object.side_effect = [
@@ -296,62 +423,85 @@ line4
         self.assertEquals(obj.read(), 'data')
         self.assertEquals(len(mock_sleep.call_args_list), 1)
 
-    @mock.patch('time.sleep', autospec=True)
-    @mock.patch.object(SwiftPath, 'upload', autospec=True)
-    def test_write_use_manifest_multiple_and_close(self, mock_upload, mock_sleep):
-        with NamedTemporaryFile(delete=False) as fp:
-            with mock.patch('tempfile.NamedTemporaryFile',
-                            autospec=True) as ntf_mock:
-                ntf_mock.side_effect = [fp]
-                swift_p = SwiftPath('swift://tenant/container/obj')
-                obj = swift_p.open(mode='wb')
-                obj.write(b'hello')
-                obj.write(b' world')
-                obj.close()
-            upload, = mock_upload.call_args_list
-            self.assertEquals(upload[0][1][0].source, fp.name)
-            self.assertEquals(upload[0][1][0].object_name, swift_p.resource)
-            self.assertEqual(open(fp.name).read(), 'hello world')
+    def test_write_use_manifest_multiple_and_close(self):
+        swift_p = SwiftPath('swift://tenant/container/obj')
+        obj = swift_p.open(mode='wb')
+        obj.write(b'hello')
+        obj.write(b' world')
+        obj.close()
+        self.mock_swift_conn.put_object.assert_called_once_with('container', 'obj',
+                                                                b'hello world')
 
-    @mock.patch('time.sleep', autospec=True)
-    @mock.patch.object(SwiftPath, 'upload', autospec=True)
-    def test_write_multiple_w_context_manager(self, mock_upload, mock_sleep):
+    def test_write_multiple_w_context_manager(self):
         swift_p = SwiftPath('swift://tenant/container/obj')
         with swift_p.open(mode='wb') as obj:
             obj.write(b'hello')
             obj.write(b' world')
-        upload_call, = mock_upload.call_args_list
+        self.mock_swift_conn.put_object.assert_called_once_with('container', 'obj',
+                                                                b'hello world')
+
+    def test_write_multiple_flush_multiple_upload(self):
+        swift_p = SwiftPath('swift://tenant/container/obj')
+        with mock.patch('tempfile.NamedTemporaryFile', autospec=True) as ntf:
+            with swift_p.open(mode='wb') as obj:
+                obj.write(b'hello')
+                obj.flush()
+                obj.write(b' world')
+                obj.flush()
+        self.assertEquals(self.mock_swift_conn.put_object.call_args_list, [
+            mock.call('container', 'obj', b'hello'),
+            mock.call('container', 'obj', b'hello world'),
+            # third call happens because we don't care about checking for
+            # additional file change
+            mock.call('container', 'obj', b'hello world')
+        ])
+        # Content is uploaded straight from memory
+        self.assertFalse(ntf.called)
 
     @mock.patch('time.sleep', autospec=True)
-    @mock.patch.object(SwiftPath, 'upload', autospec=True)
-    def test_write_multiple_flush_multiple_upload(self, mock_upload,
-                                                  mock_sleep):
+    def test_write_success_on_second_try(self, mock_sleep):
+        self.mock_swift_conn.put_object.side_effect = [
+            ClientException('dummy', 'dummy', http_status=503),
+            'etag'
+        ]
+        swift_p = SwiftPath('swift://tenant/container/obj')
+        swift_p.write_object(b'data')
+        self.assertEquals(len(self.mock_swift_conn.put_object.call_args_list), 2)
+        self.assertEquals(len(mock_sleep.call_args_list), 1)
+
+    @mock.patch('time.time', autospec=True, return_value=1.5)
+    def test_write_object_slo(self, mock_time):
+        self.mock_swift_conn.put_object.side_effect = lambda container, obj, data, **kwargs: (
+            'etag-%s' % data)
         swift_p = SwiftPath('swift://tenant/container/obj')
-        with NamedTemporaryFile(delete=False) as ntf1,\
-                NamedTemporaryFile(delete=False) as ntf2,\
-                NamedTemporaryFile(delete=False) as ntf3:
-            with mock.patch('tempfile.NamedTemporaryFile', autospec=True) as ntf:
-                ntf.side_effect = [ntf1, ntf2, ntf3]
-                with swift_p.open(mode='wb') as obj:
-                    obj.write(b'hello')
-                    obj.flush()
-                    obj.write(b' world')
-                    obj.flush()
-                u1, u2, u3 = mock_upload.call_args_list
-                u1[0][1][0].source == ntf1.name
-                u2[0][1][0].source == ntf2.name
-                u3[0][1][0].source == ntf3.name
-                u1[0][1][0].object_name == swift_p.resource
-                u2[0][1][0].object_name == swift_p.resource
-                u3[0][1][0].object_name == swift_p.resource
-                self.assertEqual(open(ntf1.name).read(), 'hello')
-                self.assertEqual(open(ntf2.name).read(), 'hello world')
-                # third call happens because we don't care about checking for
-                # additional file change
-                self.assertEqual(open(ntf3.name).read(), 'hello world')
-
-
-class TestSwiftShared(SharedOBSFileCases, SwiftTestCase):
+        with settings.use({'swift:upload': {'segment_size': '4B'}}):
+            swift_p.write_object(b'0123456789')
+
+        self.mock_swift_conn.put_container.assert_called_once_with('.segments_container')
+        self.assertEquals(sorted(self.mock_swift_conn.put_object.call_args_list[:-1]), [
+            mock.call('.segments_container', 'obj/slo/1.500000/4/00000001', b'0123'),
+            mock.call('.segments_container', 'obj/slo/1.500000/4/00000002', b'4567'),
+            mock.call('.segments_container', 'obj/slo/1.500000/4/00000003', b'89'),
+        ])
+        manifest_call = self.mock_swift_conn.put_object.call_args_list[-1]
+        self.assertEquals(manifest_call[0][:2], ('container', 'obj'))
+        self.assertEquals([segment['size_bytes'] for segment in json.loads(manifest_call[0][2])],
+                          [4, 4, 2])
+
+    def test_write_object_slo_error(self):
+        self.mock_swift_conn.put_object.side_effect = ClientException('dummy', 'dummy',
+                                                                      http_status=403)
+        swift_p = SwiftPath('swift://tenant/container/obj')
+        with settings.use({'swift:upload': {'segment_size': '4B'}}):
+            with self.assertRaises(swift.UnauthorizedError):
+                swift_p.write_object(b'0123456789', num_retries=0)
+        # Uploaded segments are removed and no manifest is written
+        self.assertEquals(len(self.mock_swift_conn.delete_object.call_args_list), 3)
+        self.assertFalse(any(call[0][0] == 'container'
+                             for call in self.mock_swift_conn.put_object.call_args_list))
+
+
+class TestSwiftShared(SharedOBSFileCases, SharedOBSStreamFileCases, SwiftTestCase):
     drive = 'swift://'
     path_class = SwiftPath
     normal_path = SwiftPath('swift://tenant/container/obj')
@@ -447,7 +597,7 @@ class TestList(SwiftTestCase):
         with self.assertRaises(ValueError):
             list(swift_p.list())
         mock_list.assert_called_once_with('container', prefix=None,
-                                          limit=None, full_listing=True)
+                                          limit=10000, full_listing=False)
 
     @mock.patch('time.sleep', autospec=True)
     def test_list_condition_not_met(self, mock_sleep):
@@ -609,9 +759,9 @@ class TestList(SwiftTestCase):
             'swift://tenant/container/path/to/resource3'
         ])
         mock_list.assert_called_once_with('container',
-                                          limit=None,
+                                          limit=10000,
                                           prefix='path/to/',
-                                          full_listing=True,
+                                          full_listing=False,
                                           delimiter='/')
 
     def test_listdir_ignore_segment_containers(self):
@@ -636,9 +786,9 @@ class TestList(SwiftTestCase):
             'swift://tenant/container_segments/path/to/resource3'
         ])
         mock_list.assert_called_once_with('container_segments',
-                                          limit=None,
+                                          limit=10000,
                                           prefix='path/to/',
-                                          full_listing=True,
+                                          full_listing=False,
                                           delimiter='/')
 
     def test_listdir_on_container(self):
@@ -661,9 +811,9 @@ class TestList(SwiftTestCase):
             'swift://tenant/container/resource3'
         ])
         mock_list.assert_called_once_with('container',
-                                          limit=None,
+                                          limit=10000,
                                           prefix=None,
-                                          full_listing=True,
+                                          full_listing=False,
                                           delimiter='/')
 
     def test_listdir_on_tenant_allow_segment_containers(self):
@@ -683,9 +833,9 @@ class TestList(SwiftTestCase):
             'swift://tenant/container2_segments',
             'swift://tenant/.segments_container3'
         ])
-        mock_list.assert_called_once_with(limit=None,
+        mock_list.assert_called_once_with(limit=10000,
                                           prefix=None,
-                                          full_listing=True)
+                                          full_listing=False)
 
     def test_listdir_on_tenant_ignore_segment_containers(self):
         mock_list = self.mock_swift_conn.get_account
@@ -702,9 +852,9 @@ class TestList(SwiftTestCase):
         self.assertSwiftListResultsEqual(results, [
             'swift://tenant/container1'
         ])
-        mock_list.assert_called_once_with(limit=None,
+        mock_list.assert_called_once_with(limit=10000,
                                           prefix=None,
-                                          full_listing=True)
+                                          full_listing=False)
 
     @mock.patch('os.path', ntpath)
     def test_list_windows(self):
@@ -728,9 +878,9 @@ class TestList(SwiftTestCase):
             'swift://tenant/container/path/to/resource4'
         ])
         mock_list.assert_called_once_with('container',
-                                          limit=None,
+                                          limit=10000,
                                           prefix='path',
-                                          full_listing=True)
+                                          full_listing=False)
 
     def test_list_multiple_return(self):
         mock_list = self.mock_swift_conn.get_container
@@ -753,9 +903,9 @@ class TestList(SwiftTestCase):
             'swift://tenant/container/path/to/resource4'
         ])
         mock_list.assert_called_once_with('container',
-                                          limit=None,
+                                          limit=10000,
                                           prefix='path',
-                                          full_listing=True)
+                                          full_listing=False)
 
     def test_list_limit(self):
         mock_list = self.mock_swift_conn.get_container
@@ -787,8 +937,8 @@ class TestList(SwiftTestCase):
             'swift://tenant/container2'
         ])
         mock_list.assert_called_once_with(prefix=None,
-                                          full_listing=True,
-                                          limit=None)
+                                          full_listing=False,
+                                          limit=10000)
 
     def test_list_starts_with(self):
         mock_list = self.mock_swift_conn.get_container
@@ -805,8 +955,8 @@ class TestList(SwiftTestCase):
         ])
         mock_list.assert_called_once_with('container',
                                           prefix='r/prefix',
-                                          limit=None,
-                                          full_listing=True)
+                                          limit=10000,
+                                          full_listing=False)
 
     def test_list_starts_with_no_resource(self):
         mock_list = self.mock_swift_conn.get_container
@@ -823,8 +973,8 @@ class TestList(SwiftTestCase):
         ])
         mock_list.assert_called_once_with('container',
                                           prefix='prefix',
-                                          limit=None,
-                                          full_listing=True)
+                                          limit=10000,
+                                          full_listing=False)
 
     @mock.patch('time.sleep', autospec=True)
     def test_list_w_condition_and_use_manifest(self, mock_sleep):
@@ -932,6 +1082,266 @@ class TestWalkFiles(SwiftTestCase):
             SwiftPath('swift://tenant/container/my/other/obj5.sh')
         ]))
 
+    @mock.patch.object(swift, '_LIST_PAGE_SIZE', 2)
+    def test_pages_w_dir_markers(self):
+        mock_list = self.mock_swift_conn.get_container
+        mock_list.side_effect = [
+            ({}, [{
+                'name': 'my/dir',
+                'content_type': 'application/directory'
+            }, {
+                'name': 'my/obj1',
+                'content_type': 'application/octet-stream'
+            }]),
+            ({}, [{
+                'name': 'my/obj2',
+                'content_type': 'application/octet-stream'
+            }])
+        ]
+
+        f = list(SwiftPath('swift://tenant/container/my').walkfiles())
+        self.assertEquals(f, [
+            SwiftPath('swift://tenant/container/my/obj1'),
+            SwiftPath('swift://tenant/container/my/obj2')
+        ])
+        self.assertEquals(mock_list.call_args_list, [
+            mock.call('container', full_listing=False, limit=2, prefix='my'),
+            mock.call('container', full_listing=False, limit=2, prefix='my', marker='my/obj1')
+        ])
+
+
+@mock.patch.object(swift, '_LIST_PAGE_SIZE', 2)
+class TestListIter(SwiftTestCase):
+    def test_pages_in_order(self):
+        mock_list = self.mock_swift_conn.get_container
+        mock_list.side_effect = [
+            ({}, [{'name': 'path/b1'}, {'name': 'path/b2'}]),
+            ({}, [{'name': 'path/c1'}, {'name': 'path/c2'}]),
+            ({}, [])
+        ]
+
+        results = SwiftPath('swift://tenant/container/path').list_iter()
+        self.assertEquals(next(results), 'swift://tenant/container/path/b1')
+        self.assertEquals(next(results), 'swift://tenant/container/path/b2')
+        # The next page is only requested once the first page is exhausted
+        self.assertEquals(len(mock_list.call_args_list), 1)
+
+        self.assertEquals(list(results), [
+            'swift://tenant/container/path/c1',
+            'swift://tenant/container/path/c2'
+        ])
+        self.assertEquals(mock_list.call_args_list, [
+            mock.call('container', full_listing=False, limit=2, prefix='path'),
+            mock.call('container', full_listing=False, limit=2, prefix='path',
+                      marker='path/b2'),
+            mock.call('container', full_listing=False, limit=2, prefix='path',
+                      marker='path/c2')
+        ])
+
+    def test_limit(self):
+        mock_list = self.mock_swift_conn.get_container
+        mock_list.side_effect = [
+            ({}, [{'name': 'path/b1'}, {'name': 'path/b2'}]),
+            ({}, [{'name': 'path/c1'}])
+        ]
+
+        results = list(SwiftPath('swift://tenant/container/path').list_iter(limit=3))
+        self.assertEquals(results, [
+            'swift://tenant/container/path/b1',
+            'swift://tenant/container/path/b2',
+            'swift://tenant/container/path/c1'
+        ])
+        self.assertEquals(mock_list.call_args_list, [
+            mock.call('container', full_listing=False, limit=2, prefix='path'),
+            mock.call('container', full_listing=False, limit=1, prefix='path',
+                      marker='path/b2')
+        ])
+
+    def test_ignore_segment_containers(self):
+        mock_list = self.mock_swift_conn.get_account
+        mock_list.side_effect = [
+            ({}, [{'name': '.segments_a'}, {'name': 'b'}]),
+            ({}, [{'name': 'c_segments'}])
+        ]
+
+        results = list(SwiftPath('swift://tenant').list_iter())
+        self.assertEquals(results, ['swift://tenant/b'])
+        self.assertEquals(mock_list.call_args_list, [
+            mock.call(full_listing=False, limit=2, prefix=None),
+            mock.call(full_listing=False, limit=2, prefix=None, marker='b')
+        ])
+
+    def test_list_as_dir_across_pages(self):
+        mock_list = self.mock_swift_conn.get_container
+        mock_list.side_effect = [
+            ({}, [{'name': 'path/a'}, {'name': 'path/dir'}]),
+            ({}, [{'subdir': 'path/dir/'}, {'name': 'path/z'}]),
+            ({}, [])
+        ]
+
+        results = list(SwiftPath('swift://tenant/container/path').list_iter(list_as_dir=True))
+        self.assertEquals(results, [
+            'swift://tenant/container/path/a',
+            'swift://tenant/container/path/dir',
+            'swift://tenant/container/path/z'
+        ])
+        self.assertEquals(mock_list.call_args_list[1],
+                          mock.call('container', full_listing=False, limit=2, prefix='path/',
+                                    delimiter='/', marker='path/dir'))
+
+    @mock.patch('time.sleep', autospec=True)
+    def test_page_unavailable(self, mock_sleep):
+        mock_list = self.mock_swift_conn.get_container
+        mock_list.side_effect = [
+            ({}, [{'name': 'path/b1'}, {'name': 'path/b2'}]),
+            ClientException('unavailable', http_status=503),
+            ({}, [{'name': 'path/c1'}])
+        ]
+
+        results = list(SwiftPath('swift://tenant/container/path').list_iter())
+        self.assertEquals(results, [
+            'swift://tenant/container/path/b1',
+            'swift://tenant/container/path/b2',
+            'swift://tenant/container/path/c1'
+        ])
+        # Only the failed page is retried
+        self.assertEquals(mock_list.call_args_list[1], mock_list.call_args_list[2])
+        self.assertEquals(len(mock_sleep.call_args_list), 1)
+
+    def test_condition_not_met(self):
+        mock_list = self.mock_swift_conn.get_container
+        mock_list.return_value = ({}, [{'name': 'path/b1'}])
+
+        with self.assertRaises(exceptions.ConditionNotMetError):
+            list(SwiftPath('swift://tenant/container/path').list_iter(
+                condition=lambda results: len(results) == 2))
+
+    def test_incremental_condition(self):
+        mock_list = self.mock_swift_conn.get_container
+        mock_list.return_value = ({}, [{'name': 'path/b1'}])
+        condition = utils.ManifestCondition(['path/b1'])
+
+        results = list(SwiftPath('swift://tenant/container/path').list_iter(
+            condition=condition))
+        self.assertEquals(results, ['swift://tenant/container/path/b1'])
+        self.assertEquals(condition.missing, set())
+
+    def test_invalid_kwargs(self):
+        with self.assertRaises(TypeError):
+            SwiftPath('swift://tenant/container/path').list_iter(use_manifest=True)
+
+    def test_with_metadata(self):
+        mock_list = self.mock_swift_conn.get_container
+        mock_list.side_effect = [
+            ({}, [{
+                'name': 'path/a',
+                'bytes': 10,
+                'hash': 'abc123',
+                'last_modified': '2018-01-02T03:04:05.000000',
+                'content_type': 'text/plain'
+            }, {
+                'name': 'path/dir'
+            }]),
+            ({}, [{'subdir': 'path/dir/'}]),
+            ({}, [])
+        ]
+
+        swift_p = SwiftPath('swift://tenant/container/path')
+        results = list(swift_p.list_iter(list_as_dir=True, with_metadata=True,
+                                         condition=lambda results: len(results) == 2))
+        self.assertEquals(results, [
+            OBSListEntry(SwiftPath('swift://tenant/container/path/a'), size=10,
+                         etag='abc123', last_modified='2018-01-02T03:04:05.000000',
+                         content_type='text/plain'),
+            OBSListEntry(SwiftPath('swift://tenant/container/path/dir'))
+        ])
+        self.assertIsInstance(results[0].path, SwiftPath)
+
+
+def _fake_get_container(names):
+    """Returns a fake ``get_container`` that pages through the sorted names"""
+    def get_container(container, prefix=None, marker=None, end_marker=None, limit=None,
+                      full_listing=False):
+        results = [
+            name for name in sorted(names)
+            if (not prefix or name.startswith(prefix)) and
+            (marker is None or name > marker) and
+            (end_marker is None or name < end_marker)
+        ]
+        return {}, [{'name': name} for name in results[:limit]]
+    return get_container
+
+
+@mock.patch.object(swift, '_LIST_PAGE_SIZE', 10)
+class TestListParallel(SwiftTestCase):
+    def setUp(self):
+        super(TestListParallel, self).setUp()
+        self.names = ['dir/obj%03d' % i for i in range(95)]
+        self.mock_swift_conn.get_container.side_effect = _fake_get_container(self.names)
+        self.expected = ['swift://tenant/container/%s' % name for name in self.names]
+
+    def test_sampled_ranges(self):
+        swift_p = SwiftPath('swift://tenant/container/dir')
+        results = list(swift_p.list_iter(parallel=4))
+        self.assertEquals(results, self.expected)
+
+        range_calls = [
+            c for c in self.mock_swift_conn.get_container.call_args_list
+            if 'end_marker' in c[1]
+        ]
+        self.assertTrue(len(range_calls) > 1)
+
+    def test_split_points(self):
+        swift_p = SwiftPath('swift://tenant/container/dir')
+        results = list(swift_p.list_iter(parallel=2, split_points=['obj050', 'obj0705']))
+        self.assertEquals(results, self.expected)
+
+        mock_list = self.mock_swift_conn.get_container
+        # The first names after the split points are the boundaries of the ranges
+        mock_list.assert_any_call('container', full_listing=False, limit=1, prefix='dir',
+                                  marker='dir/obj050')
+        mock_list.assert_any_call('container', full_listing=False, limit=10, prefix='dir',
+                                  marker='dir/obj009', end_marker='dir/obj051')
+        mock_list.assert_any_call('container', full_listing=False, limit=10, prefix='dir',
+                                  marker='dir/obj051', end_marker='dir/obj071')
+        mock_list.assert_any_call('container', full_listing=False, limit=10, prefix='dir',
+                                  marker='dir/obj071')
+
+    @mock.patch.object(swift, '_LIST_SHARD_MAX_PAGES', 1)
+    def test_range_pages(self):
+        swift_p = SwiftPath('swift://tenant/container/dir')
+        results = list(swift_p.list_iter(parallel=2, split_points=['obj050']))
+        self.assertEquals(results, self.expected)
+
+        mock_list = self.mock_swift_conn.get_container
+        # Ranges are listed a page at a time, continuing after the last listed name
+        mock_list.assert_any_call('container', full_listing=False, limit=10, prefix='dir',
+                                  marker='dir/obj019', end_marker='dir/obj051')
+        mock_list.assert_any_call('container', full_listing=False, limit=10, prefix='dir',
+                                  marker='dir/obj061')
+
+    def test_list(self):
+        swift_p = SwiftPath('swift://tenant/container/dir')
+        self.assertEquals(swift_p.list(parallel=3), self.expected)
+
+    def test_limit(self):
+        swift_p = SwiftPath('swift://tenant/container/dir')
+        results = list(swift_p.list_iter(parallel=4, limit=25))
+        self.assertEquals(results, self.expected[:25])
+
+    def test_single_page(self):
+        swift_p = SwiftPath('swift://tenant/container/dir/obj09')
+        results = list(swift_p.list_iter(parallel=4))
+        self.assertEquals(results, self.expected[90:])
+        self.assertEquals(len(self.mock_swift_conn.get_container.call_args_list), 1)
+
+    def test_sample_list_markers(self):
+        names = ['dir/obj%03d' % i for i in range(10)]
+        self.assertEquals(swift._sample_list_markers(names, 4, prefix='dir'), [
+            'dir/obj01', 'dir/obj03', 'dir/obj05', 'dir/obj07', 'dir/obj09'
+        ])
+        self.assertEquals(swift._sample_list_markers(['dir/a', 'dir/a'], 4, prefix='dir'), [])
+
 
 @mock.patch.object(SwiftPath, 'list', autospec=True)
 class TestGlob(SwiftTestCase):
@@ -1379,7 +1789,7 @@ class TestDownload(SwiftTestCase):
             })
 
         # Verify that list was called with a data manifest as well
-        mock_list.assert_called_once_with(mock.ANY, use_manifest=True)
+        mock_list.assert_called_once_with(mock.ANY, use_manifest=True, parallel=10)
 
     @mock.patch('time.sleep', autospec=True)
     @mock.patch.object(SwiftPath, 'list', autospec=True)
@@ -1412,7 +1822,7 @@ class TestDownload(SwiftTestCase):
             })
 
         # Verify that list was called with a data manifest as well
-        mock_list.assert_called_once_with(mock.ANY, use_manifest=True)
+        mock_list.assert_called_once_with(mock.ANY, use_manifest=True, parallel=10)
 
     @mock.patch('time.sleep', autospec=True)
     @mock.patch.object(SwiftPath, 'list', autospec=True)
@@ -1436,13 +1846,19 @@ class TestDownload(SwiftTestCase):
         self.assertEquals(len(mock_sleep.call_args_list), 2)
         # Verify that list was called with a data manifest as well
         self.assertEquals(mock_list.call_args_list,
-                          [mock.call(mock.ANY, use_manifest=True),
-                           mock.call(mock.ANY, use_manifest=True),
-                           mock.call(mock.ANY, use_manifest=True)])
+                          [mock.call(mock.ANY, use_manifest=True, parallel=10),
+                           mock.call(mock.ANY, use_manifest=True, parallel=10),
+                           mock.call(mock.ANY, use_manifest=True, parallel=10)])
 
 
 @mock.patch('stor.utils.walk_files_and_dirs', autospec=True)
 class TestUpload(SwiftTestCase):
+    def setUp(self):
+        super(TestUpload, self).setUp()
+        # Uploads with skip_identical look up the destination, which is empty
+        self.mock_swift_conn.get_container.return_value = ({}, [])
+        self.mock_swift_conn.head_object.side_effect = _service_404_exception()
+
     def test_abs_path(self, mock_walk_files_and_dirs):
         mock_walk_files_and_dirs.return_value = {
             '/abs_path/file1': 10
@@ -1563,7 +1979,7 @@ class TestUpload(SwiftTestCase):
             'leave_segments': True,
             'segment_size': 1000,
             'changed': True,
-            'skip_identical': True,
+            'skip_identical': False,
             'checksum': False
         })
 
@@ -1636,7 +2052,7 @@ class TestUpload(SwiftTestCase):
             'leave_segments': True,
             'segment_size': 1000,
             'changed': True,
-            'skip_identical': True,
+            'skip_identical': False,
             'checksum': False
         })
 
@@ -1865,7 +2281,7 @@ class TestUpload(SwiftTestCase):
             'leave_segments': True,
             'segment_size': 1000,
             'changed': True,
-            'skip_identical': True,
+            'skip_identical': False,
             'checksum': False
         })
 
@@ -1937,10 +2353,80 @@ class TestUpload(SwiftTestCase):
             'leave_segments': True,
             'segment_size': 1000,
             'changed': True,
-            'skip_identical': True,
+            'skip_identical': False,
             'checksum': False
         })
 
+    def test_upload_skip_identical(self, mock_walk_files_and_dirs):
+        mock_walk_files_and_dirs.return_value = {'file1': 4, 'file2': 5, 'file3': 3}
+        self.mock_swift_conn.get_container.return_value = ({}, [
+            {'name': 'path/file1', 'bytes': 4, 'hash': hashlib.md5(b'same').hexdigest()},
+            {'name': 'path/file2', 'bytes': 5, 'hash': hashlib.md5(b'other').hexdigest()}
+        ])
+        self.mock_swift.upload.return_value = [{
+            'success': True,
+            'action': 'upload_object',
+            'object': 'path/file2',
+            'path': 'file2'
+        }]
+        upload_settings = {
+            'swift:upload': {'skip_identical': True},
+            'stor:hash_cache': {'enabled': False}
+        }
+
+        with NamedTemporaryDirectory(change_dir=True), settings.use(upload_settings):
+            for name, data in (('file1', b'same'), ('file2', b'diffs'), ('file3', b'new')):
+                with open(name, 'wb') as fp:
+                    fp.write(data)
+            results = SwiftPath('swift://tenant/container/path').upload(['.'])
+
+        upload_args = self.mock_swift.upload.call_args_list[0][0]
+        self.assertEquals([o.object_name for o in upload_args[1]], ['path/file2', 'path/file3'])
+        self.assertFalse(self.mock_swift.upload.call_args_list[0][1]['options']['skip_identical'])
+        self.assertEquals(results[0], {
+            'action': 'upload_object',
+            'object': 'path/file1',
+            'path': 'file1',
+            'success': True,
+            'status': 'skipped-identical'
+        })
+        self.assertEquals(len(results), 2)
+
+    def test_upload_skip_identical_single_file(self, mock_walk_files_and_dirs):
+        mock_walk_files_and_dirs.return_value = {'file1': 4}
+        self.mock_swift_conn.head_object.side_effect = None
+        self.mock_swift_conn.head_object.return_value = {
+            'content-length': '4', 'etag': hashlib.md5(b'same').hexdigest()
+        }
+        self.mock_swift.upload.return_value = []
+        upload_settings = {
+            'swift:upload': {'skip_identical': True},
+            'stor:hash_cache': {'enabled': False}
+        }
+
+        with NamedTemporaryDirectory(change_dir=True), settings.use(upload_settings):
+            with open('file1', 'wb') as fp:
+                fp.write(b'same')
+            results = SwiftPath('swift://tenant/container/path').upload(['.'])
+
+        # The single object is looked up directly instead of listing the container
+        self.mock_swift_conn.head_object.assert_called_once_with('container', 'path/file1')
+        self.assertFalse(self.mock_swift_conn.get_container.called)
+        self.assertEquals(self.mock_swift.upload.call_args_list[0][0][1], [])
+        self.assertEquals(results[0]['status'], 'skipped-identical')
+
+    def test_upload_skip_identical_missing_container(self, mock_walk_files_and_dirs):
+        mock_walk_files_and_dirs.return_value = {'file1': 4, 'file2': 5}
+        self.mock_swift_conn.get_container.side_effect = _service_404_exception()
+        self.mock_swift.upload.return_value = []
+
+        with settings.use({'swift:upload': {'skip_identical': True}}):
+            SwiftPath('swift://tenant/container/path').upload(['.'])
+
+        upload_args = self.mock_swift.upload.call_args_list[0][0]
+        self.assertEquals(sorted(o.object_name for o in upload_args[1]),
+                          ['path/file1', 'path/file2'])
+
 
 class TestCopy(SwiftTestCase):
     @mock.patch.object(swift.SwiftPath, 'download_object', autospec=True)
@@ -1958,9 +2444,79 @@ class TestCopy(SwiftTestCase):
 
     def test_copy_swift_destination(self):
         p = SwiftPath('swift://tenant/container/file_source')
-        with self.assertRaisesRegexp(ValueError, 'OBS path'):
+        self.mock_swift_conn.head_object.return_value = {'content-length': '10'}
+        p.copy('swift://tenant/container2/file_dest.txt')
+        self.mock_swift_conn.copy_object.assert_called_once_with(
+            'container', 'file_source', destination='/container2/file_dest.txt', headers={})
+
+    def test_copy_swift_dir_destination_other_tenant(self):
+        p = SwiftPath('swift://tenant/container/file_source')
+        self.mock_swift_conn.head_object.return_value = {'content-length': '10'}
+        p.copy('swift://tenant2/container2/dir/')
+        self.mock_swift_conn.copy_object.assert_called_once_with(
+            'container', 'file_source', destination='/container2/dir/file_source',
+            headers={'Destination-Account': 'tenant2'})
+
+    def test_copy_swift_ambiguous_destination(self):
+        p = SwiftPath('swift://tenant/container/file_source')
+        with self.assertRaisesRegex(ValueError, 'OBS destination'):
             p.copy('swift://tenant/container/file_dest')
 
+    def test_copy_swift_tenant_destination(self):
+        p = SwiftPath('swift://tenant/container/file_source')
+        with self.assertRaisesRegex(ValueError, 'not an object path'):
+            p.copy('swift://tenant/')
+
+    def test_copy_swift_destination_error(self):
+        p = SwiftPath('swift://tenant/container/file_source')
+        self.mock_swift_conn.head_object.side_effect = ClientException(
+            'not found', http_status=404)
+        with self.assertRaisesRegex(exceptions.FailedTransferError, 'copying'):
+            p.copy('swift://tenant/container2/file_dest.txt')
+
+    @mock.patch('time.time', autospec=True, return_value=1.5)
+    def test_copy_large_object_by_segment(self, mock_time):
+        p = SwiftPath('swift://tenant/container/file_source')
+        self.mock_swift_conn.head_object.return_value = {
+            'content-length': str(6 * 1024 ** 3),
+            'content-type': 'text/plain',
+            'x-object-meta-mtime': '1',
+            'x-static-large-object': 'True',
+            'etag': 'etag'
+        }
+        self.mock_swift_conn.get_object.return_value = ({}, json.dumps([
+            {'name': '/.segments_container/seg1', 'hash': 'hash1', 'bytes': 4 * 1024 ** 3},
+            {'name': '/.segments_container/seg2', 'hash': 'hash2', 'bytes': 2 * 1024 ** 3},
+        ]))
+        with settings.use({'swift:upload': {'segment_size': '4G', 'segment_threads': 1}}):
+            p.copy('swift://tenant/container2/file_dest.txt')
+
+        self.mock_swift_conn.get_object.assert_called_once_with(
+            'container', 'file_source', query_string='multipart-manifest=get')
+        self.mock_swift_conn.put_container.assert_called_once_with('.segments_container2')
+        prefix = 'file_dest.txt/slo/1.500000/%s' % (4 * 1024 ** 3)
+        self.mock_swift_conn.copy_object.assert_has_calls([
+            mock.call('.segments_container', 'seg1',
+                      destination='/.segments_container2/%s/00000001' % prefix, headers={}),
+            mock.call('.segments_container', 'seg2',
+                      destination='/.segments_container2/%s/00000002' % prefix, headers={}),
+        ])
+        self.mock_swift_conn.put_object.assert_called_once_with(
+            'container2', 'file_dest.txt', mock.ANY, query_string='multipart-manifest=put',
+            headers={'content-type': 'text/plain', 'x-object-meta-mtime': '1'})
+        self.assertEquals(json.loads(self.mock_swift_conn.put_object.call_args[0][2]), [
+            {
+                'path': '/.segments_container2/%s/00000001' % prefix,
+                'etag': 'hash1',
+                'size_bytes': 4 * 1024 ** 3
+            },
+            {
+                'path': '/.segments_container2/%s/00000002' % prefix,
+                'etag': 'hash2',
+                'size_bytes': 2 * 1024 ** 3
+            },
+        ])
+
 
 class TestCopytree(SwiftTestCase):
     @mock.patch.object(swift.SwiftPath, 'download', autospec=True)
@@ -1977,10 +2533,83 @@ class TestCopytree(SwiftTestCase):
             condition=None,
             use_manifest=False)
 
-    def test_copytree_swift_destination(self):
+    @mock.patch('stor.s3.S3Path.write_object', autospec=True)
+    @mock.patch.object(swift.SwiftPath, 'read_object_range', autospec=True,
+                       return_value=b'data')
+    @mock.patch.object(swift.SwiftPath, 'list', autospec=True)
+    def test_copytree_s3_destination(self, mock_list, mock_read_range, mock_write):
+        mock_list.return_value = [
+            OBSListEntry(SwiftPath('swift://tenant/container/file1'), size=4),
+            OBSListEntry(SwiftPath('swift://tenant/container/dir/file2'), size=4),
+        ]
         p = SwiftPath('swift://tenant/container')
-        with self.assertRaises(ValueError):
-            p.copytree('swift://swift/path')
+        copied = p.copytree('s3://bucket/path')
+
+        mock_read_range.assert_has_calls([
+            mock.call(SwiftPath('swift://tenant/container/file1'), 0, 3),
+            mock.call(SwiftPath('swift://tenant/container/dir/file2'), 0, 3),
+        ], any_order=True)
+        mock_write.assert_has_calls([
+            mock.call(Path('s3://bucket/path/file1'), b'data'),
+            mock.call(Path('s3://bucket/path/dir/file2'), b'data'),
+        ], any_order=True)
+        self.assertEquals(len(copied['completed']), 2)
+
+    @mock.patch.object(swift.SwiftPath, 'list', autospec=True)
+    def test_copytree_swift_destination(self, mock_list):
+        mock_list.return_value = [
+            OBSListEntry(SwiftPath('swift://tenant/container/file1'), size=10),
+            OBSListEntry(SwiftPath('swift://tenant/container/dir/file2'), size=20),
+        ]
+        p = SwiftPath('swift://tenant/container')
+        copied = p.copytree('swift://tenant/container2/path',
+                            condition=lambda results: len(results) == 2)
+
+        mock_list.assert_called_once_with(SwiftPath('swift://tenant/container/'),
+                                          use_manifest=False, with_metadata=True)
+        self.assertFalse(self.mock_swift_conn.head_object.called)
+        self.assertEquals(self.mock_swift_conn.copy_object.call_count, 2)
+        self.mock_swift_conn.copy_object.assert_has_calls([
+            mock.call('container', 'file1', destination='/container2/path/file1', headers={}),
+            mock.call('container', 'dir/file2', destination='/container2/path/dir/file2',
+                      headers={}),
+        ], any_order=True)
+        self.assertEquals(
+            {r['dest'] for r in copied['completed']},
+            {SwiftPath('swift://tenant/container2/path/file1'),
+             SwiftPath('swift://tenant/container2/path/dir/file2')})
+
+    @mock.patch.object(utils, 'generate_and_save_data_manifest', autospec=True)
+    @mock.patch.object(utils, 'get_data_manifest_contents', autospec=True)
+    @mock.patch.object(swift.SwiftPath, 'list', autospec=True)
+    def test_copytree_swift_destination_use_manifest(self, mock_list, mock_get_manifest,
+                                                     mock_save_manifest):
+        mock_list.return_value = [
+            OBSListEntry(SwiftPath('swift://tenant/container/dir/.data_manifest.csv'),
+                         size=10),
+            OBSListEntry(SwiftPath('swift://tenant/container/dir/file1'), size=10),
+        ]
+        mock_get_manifest.return_value = ['dir/file1']
+        p = SwiftPath('swift://tenant/container/dir')
+        p.copytree('swift://tenant/container2', use_manifest=True)
+
+        mock_save_manifest.assert_called_once_with(SwiftPath('swift://tenant/container2/'),
+                                                   ['file1'])
+        self.mock_swift_conn.copy_object.assert_called_once_with(
+            'container', 'dir/file1', destination='/container2/file1', headers={})
+
+    @mock.patch.object(utils, 'generate_and_save_data_manifest', autospec=True)
+    @mock.patch.object(utils, 'get_data_manifest_contents', autospec=True)
+    @mock.patch.object(swift.SwiftPath, 'list', autospec=True)
+    def test_copytree_swift_destination_manifest_not_met(self, mock_list, mock_get_manifest,
+                                                         mock_save_manifest):
+        mock_list.return_value = [
+            OBSListEntry(SwiftPath('swift://tenant/container/dir/file1'), size=10),
+        ]
+        mock_get_manifest.return_value = ['dir/file1', 'dir/file2']
+        p = SwiftPath('swift://tenant/container/dir')
+        with self.assertRaises(exceptions.ConditionNotMetError):
+            p.copytree('swift://tenant/container2', use_manifest=True)
 
     @mock.patch('os.path', ntpath)
     def test_copytree_windows_destination(self):
@@ -2388,8 +3017,8 @@ class TestRmtree(SwiftTestCase):
                           set(['dir/r1', 'dir/r2']))
 
         self.assertEquals(mock_list.call_args_list, [
-            mock.call(u'container', full_listing=True, limit=None, prefix='dir/'),
-            mock.call(u'container', full_listing=True, limit=None, prefix='dir/')
+            mock.call(u'container', full_listing=False, limit=10000, prefix='dir/'),
+            mock.call(u'container', full_listing=False, limit=10000, prefix='dir/')
         ])
 
 
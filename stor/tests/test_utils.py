@@ -1,4 +1,6 @@
+import datetime
 import errno
+import hashlib
 import logging
 from unittest import mock
 import ntpath
@@ -9,8 +11,11 @@ import unittest
 from testfixtures import LogCapture
 
 import stor
+from stor import exceptions
 from stor import Path
+from stor.obs import OBSListEntry
 from stor.posix import PosixPath
+from stor import settings
 from stor.s3 import S3Path
 from stor.swift import SwiftPath
 from stor.windows import WindowsPath
@@ -245,6 +250,24 @@ class TestCondition(unittest.TestCase):
         with self.assertRaisesRegexp(ValueError, 'exactly one argument'):
             utils.validate_condition(lambda: True)  # pragma: no cover
 
+    def test_manifest_condition(self):
+        condition = utils.ManifestCondition(['a', 'b'])
+        utils.validate_condition(condition)
+        condition.update([S3Path('s3://bucket/a'), S3Path('s3://bucket/c')])
+        self.assertFalse(condition.is_met())
+        with self.assertRaises(exceptions.ConditionNotMetError):
+            utils.check_condition(condition, None)
+        condition.update([S3Path('s3://bucket/b')])
+        self.assertEquals(condition.missing, set())
+        utils.check_condition(condition, None)
+
+    def test_join_incremental_condition(self):
+        condition = utils.join_conditions(lambda results: len(results) == 2,
+                                          utils.ManifestCondition(['a']))
+        utils.check_condition(condition, [S3Path('s3://bucket/a'), S3Path('s3://bucket/b')])
+        with self.assertRaises(exceptions.ConditionNotMetError):
+            utils.check_condition(condition, [S3Path('s3://bucket/b')])
+
 
 class TestSizeConversion(unittest.TestCase):
     def test_str_to_bytes_int(self):
@@ -460,3 +483,117 @@ class TestIsWriteableS3(unittest.TestCase):
         self.mock_copy.side_effect = stor.exceptions.FailedUploadError('foo')
         self.assertFalse(utils.is_writeable('s3://stor-test/foo/bar'))
         self.assertFalse(self.mock_remove.called)
+
+
+def _md5(data):
+    return hashlib.md5(data).hexdigest()
+
+
+class TestSync(unittest.TestCase):
+    def setUp(self):
+        tmp_d = utils.NamedTemporaryDirectory()
+        self.tmp_d = tmp_d.__enter__()
+        self.addCleanup(tmp_d.__exit__, None, None, None)
+        use_settings = settings.use({'stor:hash_cache': {'enabled': False}})
+        use_settings.__enter__()
+        self.addCleanup(use_settings.__exit__, None, None, None)
+        for name, data in (('same', b'same'), ('changed', b'new data'),
+                           ('dir/new', b'new'), ('dir/resized', b'resized')):
+            (self.tmp_d / name).parent.makedirs_p()
+            with open(self.tmp_d / name, 'wb') as fp:
+                fp.write(data)
+
+        # The remote objects were all uploaded before the local files were modified
+        modified = datetime.datetime(2018, 1, 2, tzinfo=datetime.timezone.utc)
+        self.s3_entries = [
+            OBSListEntry(S3Path('s3://bucket/dir/changed'), size=8, etag=_md5(b'old data'),
+                         last_modified=modified),
+            OBSListEntry(S3Path('s3://bucket/dir/dir/resized'), size=3, etag=_md5(b'res'),
+                         last_modified=modified),
+            OBSListEntry(S3Path('s3://bucket/dir/extra'), size=5, etag=_md5(b'extra'),
+                         last_modified=modified),
+            OBSListEntry(S3Path('s3://bucket/dir/same'), size=4, etag=_md5(b'same'),
+                         last_modified=modified)
+        ]
+
+        patcher = mock.patch.object(S3Path, 'list', autospec=True, return_value=self.s3_entries)
+        self.mock_list = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(S3Path, 'upload', autospec=True)
+        self.mock_upload = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(S3Path, 'download_objects', autospec=True)
+        self.mock_download_objects = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(S3Path, '_remove_objects', autospec=True)
+        self.mock_remove_objects = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def uploaded(self):
+        upload_objs = self.mock_upload.call_args[0][1]
+        return [(o.source, o.object_name) for o in upload_objs]
+
+    def test_upload_etag(self):
+        results = utils.sync(self.tmp_d, 's3://bucket/dir')
+
+        self.mock_list.assert_called_once_with(S3Path('s3://bucket/dir/'),
+                                               ignore_dir_markers=True, with_metadata=True,
+                                               parallel=None)
+        self.assertEquals(self.uploaded(), [
+            (self.tmp_d / 'changed', 'dir/changed'),
+            (self.tmp_d / 'dir/new', 'dir/dir/new'),
+            (self.tmp_d / 'dir/resized', 'dir/dir/resized')
+        ])
+        self.assertEquals(results, {
+            'copied': [
+                S3Path('s3://bucket/dir/changed'),
+                S3Path('s3://bucket/dir/dir/new'),
+                S3Path('s3://bucket/dir/dir/resized')
+            ],
+            'deleted': []
+        })
+        self.assertFalse(self.mock_remove_objects.called)
+
+    def test_upload_mtime_delete(self):
+        results = utils.sync(self.tmp_d, 's3://bucket/dir', compare='mtime', delete=True)
+
+        # Every local file is newer than its object
+        self.assertEquals([name for _, name in self.uploaded()],
+                          ['dir/changed', 'dir/dir/new', 'dir/dir/resized', 'dir/same'])
+        self.mock_remove_objects.assert_called_once_with(S3Path('s3://bucket/dir'),
+                                                         [S3Path('s3://bucket/dir/extra')])
+        self.assertEquals(results['deleted'], [S3Path('s3://bucket/dir/extra')])
+
+    def test_upload_size(self):
+        utils.sync(self.tmp_d, 's3://bucket/dir', compare='size')
+        self.assertEquals([name for _, name in self.uploaded()],
+                          ['dir/dir/new', 'dir/dir/resized'])
+
+    def test_download(self):
+        results = utils.sync('s3://bucket/dir', self.tmp_d, delete=True)
+
+        self.mock_download_objects.assert_called_once_with(
+            S3Path('s3://bucket/dir'), self.tmp_d, ['changed', 'dir/resized', 'extra'])
+        self.assertFalse(self.mock_upload.called)
+        self.assertEquals(results['deleted'], [self.tmp_d / 'dir/new'])
+        self.assertFalse((self.tmp_d / 'dir/new').exists())
+        self.assertTrue((self.tmp_d / 'same').exists())
+
+    def test_nothing_to_copy(self):
+        self.mock_list.return_value = [
+            OBSListEntry(S3Path('s3://bucket/dir/new'), size=3, etag=_md5(b'new')),
+            OBSListEntry(S3Path('s3://bucket/dir/resized'), size=7, etag=_md5(b'resized'))
+        ]
+        self.assertEquals(utils.sync(self.tmp_d / 'dir', 's3://bucket/dir'),
+                          {'copied': [], 'deleted': []})
+        self.assertFalse(self.mock_upload.called)
+
+    def test_invalid(self):
+        with self.assertRaisesRegex(ValueError, 'compare'):
+            utils.sync(self.tmp_d, 's3://bucket/dir', compare='md5')
+        with self.assertRaisesRegex(ValueError, 'filesystem path'):
+            utils.sync(self.tmp_d, self.tmp_d / 'dir')
+        with self.assertRaisesRegex(ValueError, 'filesystem path'):
+            utils.sync('s3://bucket/dir', 'swift://tenant/container/dir')
+        with self.assertRaisesRegex(ValueError, 'S3 or Swift'):
+            utils.sync(self.tmp_d, 'dx://project:/dir')
@@ -1,6 +1,8 @@
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 import datetime
 import errno
+import functools
 import logging
 import os
 import shlex
@@ -8,10 +10,8 @@ import shutil
 from subprocess import check_call
 import tempfile
 
-from dxpy.bindings import verify_string_dxid
-from dxpy.exceptions import DXError
-
 from stor import exceptions
+from stor import settings
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +19,9 @@ logger = logging.getLogger(__name__)
 # for upload/download
 DATA_MANIFEST_FILE_NAME = '.data_manifest.csv'
 
+#: The ways `sync` can compare files that have the same size on both sides
+SYNC_COMPARE_MODES = ('etag', 'mtime', 'size')
+
 
 def str_to_bytes(s):
     """
@@ -112,9 +115,45 @@ def remove_trailing_slash(p):
     return type(p)(p.rstrip('/'))
 
 
+class IncrementalCondition(object):
+    """
+    A condition that is updated with each page of results as it is listed.
+
+    Function conditions are called with every result at once, so `S3Path.list_iter`
+    and `SwiftPath.list_iter` retain everything they yield to check them. Incremental
+    conditions are instead updated with the paths of each page as it arrives and
+    checked with `is_met` once the listing is complete, so the results are not
+    retained. An instance keeps its state, so it should only be used for one listing.
+    """
+    def update(self, results):
+        """Updates the condition with a page of listed paths"""
+        raise NotImplementedError
+
+    def is_met(self):
+        """Returns True if the results listed so far meet the condition"""
+        raise NotImplementedError
+
+
+class ManifestCondition(IncrementalCondition):
+    """Checks that every object name of a data manifest was listed.
+
+    Only the names that have not been listed yet are held in memory. See
+    `validate_manifest_list`.
+    """
+    def __init__(self, expected_objs):
+        self.missing = set(expected_objs)
+
+    def update(self, results):
+        self.missing.difference_update(r.resource for r in results)
+
+    def is_met(self):
+        return not self.missing
+
+
 def validate_condition(condition):
-    """Verifies condition is a function that takes one argument"""
-    if condition is None:
+    """Verifies condition is a function that takes one argument or an
+    `IncrementalCondition`"""
+    if condition is None or isinstance(condition, IncrementalCondition):
         return
     if not (hasattr(condition, '__call__') and hasattr(condition, '__code__')):
         raise ValueError('condition must be callable')
@@ -125,20 +164,61 @@ def validate_condition(condition):
 def check_condition(condition, results):
     """Checks the results against the condition.
 
+    `IncrementalCondition` objects are updated with ``results`` (unless it is None,
+    when they were updated as the results were listed) before they are checked.
+
     Raises:
         ConditionNotMetError: If the condition returns False
     """
     if condition is None:
         return
 
-    condition_met = condition(results)
+    condition_met = _is_condition_met(condition, results)
     if not condition_met:
         raise exceptions.ConditionNotMetError('condition not met')
 
 
+def _is_condition_met(condition, results):
+    if isinstance(condition, IncrementalCondition):
+        if results is not None:
+            condition.update(results)
+        return condition.is_met()
+    return condition(results)
+
+
+def iter_checked_pages(pages, condition, with_metadata=False):
+    """Yields the results of each page of a listing, then checks them against the
+    condition. Helper for ``list_iter`` methods.
+
+    `IncrementalCondition` objects are updated as each page arrives. The results are
+    only retained for other conditions, which are called with all of them at once.
+
+    Args:
+        pages (Iter[List]): The paths (or `OBSListEntry` objects) of each page.
+        condition (function(results) -> bool|IncrementalCondition): The condition.
+        with_metadata (bool): If the pages hold `OBSListEntry` objects, whose paths
+            are checked.
+
+    Raises:
+        ConditionNotMetError: The results did not meet the condition.
+    """
+    incremental = isinstance(condition, IncrementalCondition)
+    listed = [] if condition and not incremental else None
+    for page_results in pages:
+        if condition is not None:
+            paths = [r.path for r in page_results] if with_metadata else page_results
+            if incremental:
+                condition.update(paths)
+            else:
+                listed.extend(paths)
+        yield from page_results
+
+    check_condition(condition, listed)
+
+
 def join_conditions(*conditions):
     def wrapper(results):
-        return all(f(results) for f in conditions)
+        return all(_is_condition_met(f, results) for f in conditions)
     return wrapper
 
 
@@ -190,8 +270,7 @@ def is_swift_path(p):
     Returns:
         bool: True if p is a Swift path, False otherwise.
     """
-    from stor.swift import SwiftPath
-    return p.startswith(SwiftPath.drive)
+    return p.startswith('swift://')
 
 
 def is_filesystem_path(p):
@@ -217,8 +296,7 @@ def is_s3_path(p):
     Returns
         bool: True if p is a S3 path, False otherwise.
     """
-    from stor.s3 import S3Path
-    return p.startswith(S3Path.drive)
+    return p.startswith('s3://')
 
 
 def is_obs_path(p):
@@ -244,8 +322,7 @@ def is_dx_path(p):
     Returns
         bool: True if p is a DX path, False otherwise.
     """
-    from stor.dx import DXPath
-    return p.startswith(DXPath.drive)
+    return p.startswith('dx://')
 
 
 def is_valid_dxid(dxid, expected_classes):
@@ -257,6 +334,9 @@ def is_valid_dxid(dxid, expected_classes):
     Returns
         bool: Whether given dxid is a valid path of one of expected_classes
     """
+    from dxpy.bindings import verify_string_dxid
+    from dxpy.exceptions import DXError
+
     try:
         return verify_string_dxid(dxid, expected_classes) is None
     except DXError:
@@ -272,16 +352,24 @@ def find_dx_class(p):
     Returns
         cls: DXVirtualPath or DXCanonicalPath
     """
-    from stor.dx import DXPath, DXCanonicalPath, DXVirtualPath
-    colon_pieces = p[len(DXPath.drive):].split(':', 1)
+    colon_pieces = p[len('dx://'):].split(':', 1)
     if not colon_pieces or not colon_pieces[0] or '/' in colon_pieces[0]:
         raise ValueError('Project is required to construct a DXPath')
     project = colon_pieces[0]
     resource = (colon_pieces[1] if len(colon_pieces) == 2 else '').lstrip('/')
-    resource_parts = resource.split('/')
-    root_name, rest = resource_parts[0], resource_parts[1:]
-    canonical_resource = is_valid_dxid(root_name, 'file') or not resource
-    if canonical_resource and rest:
+    root_name, sep, _ = resource.partition('/')
+    return _find_dx_class(project, root_name, bool(sep))
+
+
+@functools.lru_cache(maxsize=4096)
+def _find_dx_class(project, root_name, has_rest):
+    """Finds the DX path class from the project and first resource part of a path.
+
+    Paths built from a listing share these, so the class decisions are cached.
+    """
+    from stor.dx import DXCanonicalPath, DXVirtualPath
+    canonical_resource = not root_name or is_valid_dxid(root_name, 'file')
+    if canonical_resource and has_rest:
         raise ValueError('DX folder paths that start with a valid file dxid are ambiguous')
     canonical_project = is_valid_dxid(project, 'project')
 
@@ -377,7 +465,9 @@ def copy(source, dest, **kwargs):
     """Copies a source file to a destination file.
 
     Note that this utility can be called from either OBS, posix, or
-    windows paths created with ``stor.Path``.
+    windows paths created with ``stor.Path``. Objects are copied server-side
+    between two S3 paths or two Swift paths, and streamed between paths of
+    different OBS services without using local disk (see `OBSPath.copy`).
 
     Args:
         source (path|str): The source directory to copy from
@@ -417,10 +507,8 @@ def copy(source, dest, **kwargs):
     dest = Path(dest)
     swift_retry_options = kwargs.pop('swift_retry_options', {})
     kwargs.update(**swift_retry_options)
-    if is_dx_path(source) and is_dx_path(dest):
-        return source.copy(dest, **kwargs)
     if is_obs_path(source) and is_obs_path(dest):
-        raise ValueError('cannot copy one OBS path to another OBS path')
+        return source.copy(dest, **kwargs)
     if (is_s3_path(dest) or is_swift_path(dest)) and dest.is_ambiguous():
         raise ValueError('OBS destination must be file with extension or directory with slash')
 
@@ -499,20 +587,26 @@ def copytree(source, dest, copy_cmd=None, use_manifest=False, headers=None,
         - b/
         - - 1.txt
 
+    Copying between two S3 paths or two Swift paths is done server-side,
+    without downloading the objects. Objects are streamed between paths of
+    different OBS services without using local disk (see `OBSPath.copytree`)::
+
+        Path('swift://tenant/container/folder').copytree('s3://bucket/folder')
+
     Args:
         source (path|str): The source directory to copy from
         dest (path|str): The directory to copy to. Must not exist if
             its a posix directory
         copy_cmd (str): If copying to / from posix or windows, this command is
             used instead of shutil.copytree
-        use_manifest (bool, default False): See `SwiftPath.upload` and
-            `SwiftPath.download`.
-        condition (function(results) -> bool): See `SwiftPath.upload` and
-            `SwiftPath.download`.
-        headers (List[str]): See `SwiftPath.upload`.
+        use_manifest (bool, default False): See `SwiftPath.upload`,
+            `SwiftPath.download` and `OBSPath.copytree`.
+        condition (function(results) -> bool): See `SwiftPath.upload`,
+            `SwiftPath.download` and `OBSPath.copytree`.
+        headers (List[str]): See `SwiftPath.upload`. Server-side copies keep the
+            headers of the source objects.
 
     Raises:
-        ValueError: if two OBS paths are specified
         OSError: if destination is a posix path and it already exists
     """
     from stor import Path
@@ -522,7 +616,7 @@ def copytree(source, dest, copy_cmd=None, use_manifest=False, headers=None,
     if is_dx_path(source) and is_dx_path(dest):
         return source.copytree(dest, **kwargs)
     if is_obs_path(source) and is_obs_path(dest):
-        raise ValueError('cannot copy one OBS path to another OBS path')
+        return source.copytree(dest, use_manifest=use_manifest, condition=condition, **kwargs)
     from stor.windows import WindowsPath
     if is_obs_path(source) and isinstance(dest, WindowsPath):
         raise ValueError('OBS copytree to windows is not supported')
@@ -555,6 +649,186 @@ def copytree(source, dest, copy_cmd=None, use_manifest=False, headers=None,
                         condition=condition, **kwargs)
 
 
+def sync(source, dest, compare='etag', delete=False, parallel=None):
+    """Copies the files of a source directory that are missing from or differ in
+    a destination directory.
+
+    One of the directories must be on the filesystem and the other on S3 or Swift.
+    Both sides are listed with their metadata (see ``list(with_metadata=True)``) and
+    only files that are missing or differ are uploaded or downloaded, using the thread
+    pools of `S3Path.upload` / `S3Path.download_objects` or `SwiftPath.upload` /
+    `SwiftPath.download_objects`. Files with different sizes always differ. Files with
+    the same size are compared by ``compare``:
+
+    * ``etag``: The MD5 of the local file is compared with the ETag of the object. The
+      ETags of S3 multipart uploads and Swift static large objects are computed from
+      the parts of the file. Only local files that have the same size as their object
+      are read, and only if their hashes are not in the `stor.hash_cache`.
+    * ``mtime``: The file differs if the source was modified after the destination.
+    * ``size``: Files with the same size are not copied.
+
+    For example, to upload only the files that changed since the last sync::
+
+        >>> import stor
+        >>> stor.sync('local/dir', 's3://bucket/dir')
+
+    Args:
+        source (path|str): The directory to copy files from.
+        dest (path|str): The directory to copy files to.
+        compare (str): How files of the same size are compared. One of
+            `SYNC_COMPARE_MODES`.
+        delete (bool): Remove files of the destination that are not in the source.
+        parallel (int): List S3 and Swift directories with this many concurrent shards.
+            See `S3Path.list` and `SwiftPath.list`.
+
+    Returns:
+        dict: The destination paths that were copied (``copied``) and removed
+        (``deleted``).
+
+    Raises:
+        ValueError: if neither or both paths are on the filesystem, the OBS path is not
+            an S3 or Swift path, or ``compare`` is invalid
+    """
+    from stor import Path
+
+    source = Path(source)
+    dest = Path(dest)
+    if compare not in SYNC_COMPARE_MODES:
+        raise ValueError('compare must be one of %s' % (SYNC_COMPARE_MODES,))
+    obs_path = dest if is_filesystem_path(source) else source
+    if (is_filesystem_path(source) == is_filesystem_path(dest) or
+            not (is_s3_path(obs_path) or is_swift_path(obs_path))):
+        raise ValueError('sync is only supported between a filesystem path and an '
+                         'S3 or Swift path')
+
+    source_entries = _list_sync_entries(source, parallel=parallel)
+    dest_entries = _list_sync_entries(dest, parallel=parallel)
+    uploading = obs_path is dest
+
+    to_copy = _get_sync_changes(source_entries, dest_entries, compare, obs_path, uploading)
+    to_delete = sorted(set(dest_entries) - set(source_entries)) if delete else []
+
+    logger.info('syncing %s to %s: %s of %s file(s) to copy, %s to delete',
+                source, dest, len(to_copy), len(source_entries), len(to_delete))
+    if to_copy:
+        _sync_copy(source, dest, source_entries, to_copy, uploading)
+    if to_delete:
+        _sync_delete(dest, dest_entries, to_delete, uploading)
+
+    return {
+        'copied': [dest / name for name in to_copy],
+        'deleted': [dest_entries[name].path for name in to_delete]
+    }
+
+
+def _get_sync_changes(source_entries, dest_entries, compare, obs_path, uploading):
+    """Returns the sorted names of the source files that `sync` copies"""
+    to_copy = []
+    to_compare = []
+    for name, source_entry in source_entries.items():
+        dest_entry = dest_entries.get(name)
+        if dest_entry is None or dest_entry.size != source_entry.size:
+            to_copy.append(name)
+        elif compare == 'mtime':
+            if (_to_timestamp(source_entry.last_modified) >
+                    _to_timestamp(dest_entry.last_modified)):
+                to_copy.append(name)
+        elif compare == 'etag':
+            to_compare.append(name)
+
+    if to_compare:
+        from stor import hash_cache
+
+        local_entries, obs_entries = ((source_entries, dest_entries)
+                                      if uploading else (dest_entries, source_entries))
+        service = obs_path.drive[:-3]
+        direction = 'upload' if uploading else 'download'
+        segment_size = str_to_bytes(settings.get_section(service + ':upload')['segment_size'])
+        cache = hash_cache.get_cache()
+        options = settings.get_section('%s:%s' % (service, direction))
+        with ThreadPoolExecutor(max_workers=options['object_threads']) as executor:
+            matches = executor.map(
+                lambda name: hash_cache.etag_matches(local_entries[name].path,
+                                                     obs_entries[name],
+                                                     segment_size,
+                                                     cache=cache),
+                to_compare)
+            to_copy.extend(name for name, match in zip(to_compare, matches) if not match)
+    return sorted(to_copy)
+
+
+def _sync_copy(source, dest, source_entries, to_copy, uploading):
+    """Uploads or downloads the files that `sync` copies"""
+    if uploading:
+        resource_base = with_trailing_slash(str(dest.resource or ''))
+        from stor.obs import OBSUploadObject
+        dest.upload([
+            OBSUploadObject(str(source_entries[name].path),
+                            object_name=resource_base + name)
+            for name in to_copy
+        ])
+    else:
+        # The files are already known to differ, so don't hash them again
+        with settings.use({'swift:download': {'skip_identical': False}}):
+            source.download_objects(dest, to_copy)
+
+
+def _sync_delete(dest, dest_entries, to_delete, uploading):
+    """Removes the destination files that `sync` deletes"""
+    if uploading:
+        dest._remove_objects([dest_entries[name].path for name in to_delete])
+    else:
+        for name in to_delete:
+            os.remove(dest_entries[name].path)
+
+
+def _list_sync_entries(root, parallel=None):
+    """Lists the files under a directory for `sync`
+
+    Returns:
+        dict: `OBSListEntry` objects keyed by their name relative to ``root``, with
+        ``/`` separators. Entries of local files have the ``st_mtime`` of the file as
+        their ``last_modified``.
+    """
+    from stor import Path
+    from stor.obs import OBSListEntry
+
+    if is_filesystem_path(root):
+        entries = {}
+        for dir_name, _, file_names in os.walk(root):
+            for file_name in file_names:
+                full_name = os.path.join(dir_name, file_name)
+                try:
+                    stat = os.stat(full_name)
+                except FileNotFoundError:  # e.g. a broken symlink
+                    continue
+                name = os.path.relpath(full_name, root).replace(os.sep, '/')
+                entries[name] = OBSListEntry(Path(full_name), size=stat.st_size,
+                                             last_modified=stat.st_mtime)
+        return entries
+
+    prefix = with_trailing_slash(root)
+    return {
+        str(entry.path)[len(prefix):]: entry
+        for entry in prefix.list(ignore_dir_markers=True, with_metadata=True,
+                                 parallel=parallel)
+        if str(entry.path) != prefix
+    }
+
+
+def _to_timestamp(last_modified):
+    """Converts the ``last_modified`` of an `OBSListEntry` to a POSIX timestamp"""
+    if isinstance(last_modified, str):
+        # Swift returns UTC times such as 2018-01-02T03:04:05.123456
+        last_modified = datetime.datetime.strptime(last_modified.split('.')[0],
+                                                   '%Y-%m-%dT%H:%M:%S')
+    if isinstance(last_modified, datetime.datetime):
+        if last_modified.tzinfo is None:
+            last_modified = last_modified.replace(tzinfo=datetime.timezone.utc)
+        return last_modified.timestamp()
+    return last_modified
+
+
 def _safe_get_size(name):
     """Get the size of a file, handling weird edge cases like broken
     symlinks by returning None"""